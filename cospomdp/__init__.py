@@ -19,7 +19,7 @@ from cospomdp.domain.observation import (Loc, CosObservation,
 
 from cospomdp.models.agent import CosAgent
 # from cospomdp.models.basic_env import BasicEnv2D
-from cospomdp.models.belief import CosJointBelief
+from cospomdp.models.belief import CosJointBelief, LogHistogram, SparseHistogram
 
 from cospomdp.models.search_region import SearchRegion, SearchRegion2D
 from cospomdp.models.correlation import CorrelationDist
@@ -41,3 +41,5 @@ from cospomdp.models.reward_model import ObjectSearchRewardModel, NavRewardModel
 from cospomdp.models.policy_model import PolicyModel
 
 from cospomdp.models.sensors import SensorModel, FanSensor, FrustumCamera, FanSensor3D
+
+from cospomdp.planning import RootParallelPOUCT
@@ -98,6 +98,11 @@ class RobotState(pomdp_py.ObjectState):
     def in_range(self, sensor, loc):
         raise NotImplementedError
 
+    def locs_in_range(self, sensor, locs, **kwargs):
+        """Returns a boolean array indicating whether
+        each location in `locs` (N x 2) is in range"""
+        raise NotImplementedError
+
 
 class RobotState2D(RobotState):
     """2D robot state; pose is x, y, th"""
@@ -128,6 +133,9 @@ class RobotState2D(RobotState):
     def loc_in_range(self, sensor, loc, **kwargs):
         return sensor.in_range(loc, self["pose"], **kwargs)
 
+    def locs_in_range(self, sensor, locs, **kwargs):
+        return sensor.in_range_batch(locs, self["pose"], **kwargs)
+
     def in_range_facing(self, sensor, sobj, **kwargs):
         return sensor.in_range_facing(sobj.loc, self["pose"], **kwargs)
 
@@ -13,7 +13,7 @@
 # limitations under the License.
 
 from .agent import CosAgent
-from .belief import CosJointBelief
+from .belief import CosJointBelief, LogHistogram, SparseHistogram
 from .correlation import CorrelationDist
 from .observation_model import CosObjectObservationModel
 from .reward_model import ObjectSearchRewardModel, NavRewardModel
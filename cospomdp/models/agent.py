@@ -16,6 +16,7 @@ import pomdp_py
 import random
 from ..domain.state import ObjectState, RobotState, CosState
 from ..utils.math import normalize, euclidean_dist
+from ..utils.timing import StepTimer
 from .belief import CosJointBelief
 from .transition_model import CosTransitionModel
 from .observation_model import (CosObjectObservationModel,
@@ -57,6 +58,7 @@ class CosAgent(pomdp_py.Agent):
                 is updated exactly. Otherwise, it is approximated; the belief
                 at a fixed number of samples of places are updated, and the belief
                 at other places are approximated by nearby places.
+                histogram-vectorized performs the exact update with array operations.
             bu_args (dict): Arguments for belief update; useful for approximate update.
             prior: Maps from search region location to a float.
             rollout_policy_model (RolloutPolicy)
@@ -74,7 +76,12 @@ class CosAgent(pomdp_py.Agent):
         init_belief = CosJointBelief({robot_id: init_brobot,
                                       target_id: init_btarget})
         self.init_robot_state = init_robot_state
+        self._target_belief_initializer = target_belief_initializer
         self._target_belief_updater = target_belief_updater
+        self._binit_args = binit_args
+        # Records time spent in belief update; Wrappers that plan with
+        # this agent may replace it with their own timer.
+        self.timer = StepTimer()
 
         transition_model = CosTransitionModel(target_id, robot_trans_model)
         observation_model = build_cos_observation_model(corr_dists, detectors,
@@ -110,13 +117,30 @@ class CosAgent(pomdp_py.Agent):
         rstate_class = self.init_robot_state.__class__
         next_srobot = rstate_class.from_obz(robotobz)
         new_brobot = pomdp_py.Histogram({next_srobot: 1.0})
-        new_btarget = self._target_belief_updater(
-            self.belief.b(self.target_id), next_srobot,
-            observation, self.observation_model, self._belief_type, self._bu_args)
+        with self.timer.timeit("belief_update"):
+            new_btarget = self._target_belief_updater(
+                self.belief.b(self.target_id), next_srobot,
+                observation, self.observation_model, self._belief_type, self._bu_args)
         new_belief = CosJointBelief({self.robot_id: new_brobot,
                                      self.target_id: new_btarget})
         self.set_belief(new_belief)
 
+    def reset_belief(self, robot_state, prior={}):
+        """Re-initializes the belief from `prior` with the robot at
+        `robot_state`, discarding any search tree. The transition,
+        observation, policy and reward models are kept as they are;
+        this is cheaper than constructing a new CosAgent when only
+        the belief changes."""
+        init_brobot = self._initialize_robot_belief(robot_state)
+        init_btarget = self._target_belief_initializer(self._target, self.search_region,
+                                                       self._belief_type, prior,
+                                                       robot_state, **self._binit_args)
+        self.init_robot_state = robot_state
+        self.set_belief(CosJointBelief({self.robot_id: init_brobot,
+                                        self.target_id: init_btarget}))
+        if hasattr(self, "tree"):
+            del self.tree
+
     def _initialize_robot_belief(self, init_robot_state):
         """The robot state is known"""
         return pomdp_py.Histogram({init_robot_state: 1.0})
@@ -14,6 +14,7 @@
 
 import random
 import pomdp_py
+import numpy as np
 from ..domain.state import CosState, ObjectState
 
 class CosJointBelief(pomdp_py.OOBelief):
@@ -32,3 +33,351 @@ class CosJointBelief(pomdp_py.OOBelief):
 
     def set_b(self, objid, belief):
         self.object_beliefs[objid] = belief
+
+
+class LogHistogram(pomdp_py.Histogram):
+    """
+    A histogram that stores unnormalized log probabilities in a numpy
+    array, one entry per value (e.g. per target state). Updating the
+    belief with observation log likelihoods is an array addition, and
+    the probabilities are normalized lazily, only when the belief is
+    queried or sampled, and cached until the next update.
+
+    Behaves like a pomdp_py.Histogram for reading (b[value], random(),
+    mpe(), get_histogram(), iteration); update() returns a new LogHistogram.
+    """
+    # If the log probabilities drift beyond this magnitude,
+    # they are shifted back (the distribution is unchanged).
+    _SHIFT_THRESHOLD = 500.0
+
+    def __init__(self, values, log_probs, index=None):
+        """
+        Args:
+            values (list): values of the random variable (hashable)
+            log_probs (array-like): unnormalized log probability of each value
+            index (dict): maps from value to its position in `values`; computed
+                if not given. It is shared between LogHistograms of the same values.
+        """
+        super().__init__({})
+        self._values = values
+        self._log_probs = np.asarray(log_probs, dtype=float)
+        if index is None:
+            index = {val: i for i, val in enumerate(values)}
+        self._index = index
+        self._probs = None
+        self._cdf = None
+        self._hist = None
+
+    @staticmethod
+    def from_histogram(hist):
+        """
+        Args:
+            hist (dict or pomdp_py.Histogram): maps from value to probability
+        """
+        if isinstance(hist, pomdp_py.Histogram):
+            hist = hist.get_histogram()
+        values = list(hist.keys())
+        with np.errstate(divide="ignore"):
+            log_probs = np.log(np.array([hist[val] for val in values], dtype=float))
+        return LogHistogram(values, log_probs)
+
+    @property
+    def values(self):
+        return self._values
+
+    def update(self, log_likelihoods):
+        """Returns a new LogHistogram whose log probabilities are the ones of
+        this histogram plus `log_likelihoods` (same order as self.values).
+        If every value becomes impossible, the belief is left unchanged."""
+        log_probs = self._log_probs + log_likelihoods
+        top = np.max(log_probs)
+        if top == -np.inf or np.isnan(top):
+            # copied, so that __setitem__ on either belief leaves the other alone
+            return LogHistogram(self._values, self._log_probs.copy(), index=self._index)
+        if abs(top) > LogHistogram._SHIFT_THRESHOLD:
+            log_probs -= top
+        return LogHistogram(self._values, log_probs, index=self._index)
+
+    def probs(self):
+        """Returns the normalized probabilities as a numpy array
+        (same order as self.values)."""
+        if self._probs is None:
+            probs = np.exp(self._log_probs - np.max(self._log_probs))
+            self._probs = probs / probs.sum()
+        return self._probs
+
+    def log_probs(self):
+        """Returns the normalized log probabilities as a numpy array"""
+        probs = self._log_probs - np.max(self._log_probs)
+        return probs - np.log(np.sum(np.exp(probs)))
+
+    def __getitem__(self, value):
+        i = self._index.get(value)
+        if i is None:
+            return 0
+        return self.probs()[i]
+
+    def __setitem__(self, value, prob):
+        """Sets the (normalized) probability of value; the other
+        values keep their current unnormalized probabilities."""
+        log_norm = np.max(self._log_probs)\
+            + np.log(np.sum(np.exp(self._log_probs - np.max(self._log_probs))))
+        with np.errstate(divide="ignore"):
+            self._log_probs[self._index[value]] = np.log(prob) + log_norm
+        self._probs = None
+        self._cdf = None
+        self._hist = None
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __contains__(self, value):
+        return value in self._index
+
+    def __eq__(self, other):
+        if isinstance(other, pomdp_py.Histogram):
+            return self.get_histogram() == other.get_histogram()
+        return False
+
+    def __hash__(self):
+        return id(self)
+
+    @property
+    def histogram(self):
+        return self.get_histogram()
+
+    def get_histogram(self):
+        if self._hist is None:
+            self._hist = dict(zip(self._values, self.probs().tolist()))
+        return self._hist
+
+    def is_normalized(self, epsilon=1e-9):
+        return True
+
+    def mpe(self):
+        return self._values[int(np.argmax(self._log_probs))]
+
+    def argmax(self):
+        return self.mpe()
+
+    def random(self, rnd=random):
+        if self._cdf is None:
+            self._cdf = np.cumsum(self.probs())
+        i = int(np.searchsorted(self._cdf, rnd.random() * self._cdf[-1], side="right"))
+        return self._values[min(i, len(self._values) - 1)]
+
+
+class SparseHistogram(pomdp_py.Histogram):
+    """
+    A histogram that keeps explicit probabilities only for its support,
+    the most likely values that together hold at least 1 - prune_mass of
+    the probability. The remaining (pruned) mass, `residual`, is spread
+    uniformly over the pruned values. Sampling and reading the support
+    then scale with the size of the support instead of the whole domain.
+
+    Behaves like a pomdp_py.Histogram for reading; iterating goes over
+    the whole domain, as does get_histogram(). update() returns a new
+    SparseHistogram.
+    """
+    DEFAULT_PRUNE_MASS = 1e-3
+
+    def __init__(self, domain, support, probs, residual=0.0,
+                 prune_mass=DEFAULT_PRUNE_MASS, domain_index=None, prune=True):
+        """
+        Args:
+            domain (list): all values of the random variable
+            support (list): values with an explicit probability
+            probs (array-like): probability of each value in `support`
+            residual (float): total probability of the values not in `support`
+            prune_mass (float): values are pruned from the support as long
+                as the total pruned mass stays below this. If the pruned mass
+                grows beyond twice this (e.g. observations made pruned values
+                likely again), the pruned values are put back in the support.
+            domain_index (dict): maps from value to its position in `domain`;
+                computed if not given. Shared by the histograms of an update chain.
+            prune (bool): False if the support should be kept as given.
+        """
+        super().__init__({})
+        if domain_index is None:
+            domain_index = {val: i for i, val in enumerate(domain)}
+        self._domain = domain
+        self._domain_index = domain_index
+        self._prune_mass = prune_mass
+        probs = np.asarray(probs, dtype=float)
+        if residual > 2 * prune_mass and len(support) < len(domain):
+            support, probs = self._restore(support, probs, residual)
+            residual = 0.0
+        if prune:
+            support, probs, residual = self._prune(support, probs, residual)
+        self._support, self._probs, self._residual = support, probs, residual
+        self._support_index = {val: i for i, val in enumerate(self._support)}
+        self._cdf = None
+        self._hist = None
+
+    @staticmethod
+    def from_histogram(hist, prune_mass=DEFAULT_PRUNE_MASS):
+        """
+        Args:
+            hist (dict or pomdp_py.Histogram): maps from value to probability
+        """
+        if isinstance(hist, pomdp_py.Histogram):
+            hist = hist.get_histogram()
+        values = list(hist.keys())
+        probs = np.array([hist[val] for val in values], dtype=float)
+        total = probs.sum()
+        if total > 0:
+            probs /= total
+        return SparseHistogram(values, values, probs, 0.0, prune_mass=prune_mass)
+
+    def _restore(self, support, probs, residual):
+        """Returns (support, probs) over the whole domain, where the
+        values not in `support` share `residual` uniformly"""
+        in_support = set(support)
+        pruned = [val for val in self._domain if val not in in_support]
+        return (list(support) + pruned,
+                np.concatenate([probs, np.full(len(pruned), residual / len(pruned))]))
+
+    def _prune(self, support, probs, residual):
+        """Moves the least likely values of the support to the residual,
+        while the residual stays within prune_mass."""
+        budget = self._prune_mass - residual
+        if budget <= 0 or len(support) <= 1:
+            return support, probs, residual
+        order = np.argsort(probs, kind="stable")
+        cumulative = np.cumsum(probs[order])
+        num_pruned = min(int(np.searchsorted(cumulative, budget, side="right")),
+                         len(support) - 1)
+        if num_pruned == 0:
+            return support, probs, residual
+        keep = np.sort(order[num_pruned:])
+        return ([support[i] for i in keep], probs[keep],
+                residual + float(cumulative[num_pruned - 1]))
+
+    @property
+    def support(self):
+        return self._support
+
+    @property
+    def residual(self):
+        """Total probability of the pruned values"""
+        return self._residual
+
+    @property
+    def num_pruned(self):
+        return len(self._domain) - len(self._support)
+
+    @property
+    def residual_prob(self):
+        """Probability of each pruned value"""
+        if self.num_pruned == 0:
+            return 0.0
+        return self._residual / self.num_pruned
+
+    def support_items(self):
+        """Returns a list of (value, probability) for the values in the support"""
+        return list(zip(self._support, self._probs.tolist()))
+
+    def sample_pruned(self, k, rnd=random):
+        """Returns up to `k` pruned values, uniformly at random (with replacement)"""
+        if self.num_pruned == 0:
+            return []
+        return [self._random_pruned(rnd) for _ in range(k)]
+
+    def _random_pruned(self, rnd=random):
+        # Rejection sampling; fast when the support is a small part of the domain
+        for _ in range(100):
+            val = self._domain[rnd.randrange(len(self._domain))]
+            if val not in self._support_index:
+                return val
+        pruned = [val for val in self._domain if val not in self._support_index]
+        return pruned[rnd.randrange(len(pruned))]
+
+    def with_support(self, values):
+        """Returns a SparseHistogram where `values` (those in the domain)
+        are in the support; pruned values among them get their residual
+        probability as explicit probability. They may be pruned again
+        at the next update()."""
+        added = [val for val in dict.fromkeys(values)
+                 if val in self._domain_index and val not in self._support_index]
+        if len(added) == 0:
+            return self
+        per_value = self.residual_prob
+        return SparseHistogram(self._domain, self._support + added,
+                               np.concatenate([self._probs, np.full(len(added), per_value)]),
+                               self._residual - per_value * len(added),
+                               prune_mass=self._prune_mass, domain_index=self._domain_index,
+                               prune=False)
+
+    def update(self, likelihoods, residual_likelihood, prune_mass=None):
+        """Returns a new SparseHistogram after multiplying the probability of
+        each value in the support by `likelihoods` (same order as self.support),
+        and the pruned values by `residual_likelihood`; then normalizes and
+        prunes again. If every value becomes impossible, the belief is unchanged."""
+        if prune_mass is None:
+            prune_mass = self._prune_mass
+        probs = self._probs * likelihoods
+        residual = self._residual * residual_likelihood
+        total = probs.sum() + residual
+        if total <= 0:
+            probs, residual, total = self._probs, self._residual, 1.0
+        return SparseHistogram(self._domain, self._support, probs / total, residual / total,
+                               prune_mass=prune_mass, domain_index=self._domain_index)
+
+    def __getitem__(self, value):
+        i = self._support_index.get(value)
+        if i is not None:
+            return self._probs[i]
+        if value in self._domain_index:
+            return self.residual_prob
+        return 0
+
+    def __setitem__(self, value, prob):
+        raise TypeError("SparseHistogram cannot be modified; use update()")
+
+    def __len__(self):
+        return len(self._domain)
+
+    def __iter__(self):
+        return iter(self._domain)
+
+    def __contains__(self, value):
+        return value in self._domain_index
+
+    def __eq__(self, other):
+        if isinstance(other, pomdp_py.Histogram):
+            return self.get_histogram() == other.get_histogram()
+        return False
+
+    def __hash__(self):
+        return id(self)
+
+    @property
+    def histogram(self):
+        return self.get_histogram()
+
+    def get_histogram(self):
+        if self._hist is None:
+            residual_prob = self.residual_prob
+            self._hist = {val: residual_prob for val in self._domain}
+            self._hist.update(zip(self._support, self._probs.tolist()))
+        return self._hist
+
+    def is_normalized(self, epsilon=1e-9):
+        return True
+
+    def mpe(self):
+        return self._support[int(np.argmax(self._probs))]
+
+    def argmax(self):
+        return self.mpe()
+
+    def random(self, rnd=random):
+        if self.num_pruned > 0 and rnd.random() < self._residual:
+            return self._random_pruned(rnd)
+        if self._cdf is None:
+            self._cdf = np.cumsum(self._probs)
+        i = int(np.searchsorted(self._cdf, rnd.random() * self._cdf[-1], side="right"))
+        return self._support[min(i, len(self._support) - 1)]
@@ -12,15 +12,26 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import json
+import random
+import hashlib
+import inspect
+import numpy as np
+import scipy.sparse
 from ..domain.state import ObjectState
 from ..probability import JointDist, Event, TabularDistribution
 from tqdm import tqdm
 import pickle
 
+# Version of the memory-mapped cache format written by CorrelationDist.save_mmap
+CORR_CACHE_VERSION = 2
+
 
 class CorrelationDist(JointDist):
     def __init__(self, corr_object, target, search_region,
-                 corr_func_or_dict, corr_func_args={}, dists=None):
+                 corr_func_or_dict, corr_func_args={}, dists=None,
+                 backend="tabular", matrix=None, normalized=False):
         """
         Models Pr(Si | Starget) = Pr(corr_object_id | target_id)
         Args:
@@ -31,14 +42,40 @@ class CorrelationDist(JointDist):
                 and an object location, and return a value, the greater, the more correlated.
                 Or: a dictionary that maps (target_loc, corr_object_loc) to a float,
                 by default 1e-12.
-
-
+            backend (str): How Pr(Si | Starget) is stored. 'tabular' stores a
+                TabularDistribution per target state. 'dense' stores a numpy
+                array M where M[t,i] = Pr(Si = locations[i] | Starget = locations[t]),
+                indexed by the order of search_region.locations. 'sparse' stores
+                the same matrix as a scipy.sparse csr_matrix; entries of zero are
+                not stored (so the 1e-12 default of a dict is treated as zero),
+                and a row without any nonzero entry is treated as uniform.
+            matrix: precomputed matrix for the 'dense' or 'sparse' backend
+                (rows are normalized upon construction, unless `normalized` is True,
+                in which case the matrix is used as is, e.g. a read-only memory map).
         """
         self.corr_object_id, self.corr_object_class = corr_object
         self.target_id, self.target_class = target
         self.search_region = search_region
+        if backend not in {"tabular", "dense", "sparse"}:
+            raise ValueError("Unknown backend {}".format(backend))
+        self.backend = backend
+        self._locations = list(search_region.locations)
+        self._loc_index = {loc: i for i, loc in enumerate(self._locations)}
+        self._valranges = {}
         super().__init__([self.corr_object_id, self.target_id])
 
+        if backend != "tabular":
+            self.dists = None
+            if matrix is None:
+                matrix = self._compute_matrix(corr_func_or_dict, corr_func_args)
+            if normalized:
+                self.matrix = matrix
+                if backend == "sparse":
+                    self._empty_rows = set(np.nonzero(np.diff(matrix.indptr) == 0)[0].tolist())
+            else:
+                self.matrix = self._normalize_matrix(matrix)
+            return
+
         # calculate weights
         if dists is not None:
             self.dists = dists
@@ -63,26 +100,113 @@ class CorrelationDist(JointDist):
                 self.dists[target_state] =\
                     TabularDistribution([self.corr_object_id], weights, normalize=True)
 
+    def _compute_matrix(self, corr_func_or_dict, corr_func_args):
+        """Fills in the (unnormalized) matrix for the dense or sparse backend"""
+        n = len(self._locations)
+        if type(corr_func_or_dict) == dict:
+            if self.backend == "dense":
+                matrix = np.full((n, n), 1e-12)
+                for (target_loc, object_loc), prob in corr_func_or_dict.items():
+                    if target_loc in self._loc_index and object_loc in self._loc_index:
+                        matrix[self._loc_index[target_loc], self._loc_index[object_loc]] = prob
+                return matrix
+            rows, cols, vals = [], [], []
+            for (target_loc, object_loc), prob in corr_func_or_dict.items():
+                if target_loc in self._loc_index and object_loc in self._loc_index:
+                    rows.append(self._loc_index[target_loc])
+                    cols.append(self._loc_index[object_loc])
+                    vals.append(prob)
+            return scipy.sparse.csr_matrix((vals, (rows, cols)), shape=(n, n))
+
+        rows, cols, vals = [], [], []
+        matrix = np.zeros((n, n)) if self.backend == "dense" else None
+        for t, target_loc in enumerate(tqdm(self._locations,
+                                            desc="Creating Pr({} | {})".format(
+                                                self.corr_object_class, self.target_class))):
+            for i, object_loc in enumerate(self._locations):
+                prob = corr_func_or_dict(target_loc, object_loc,
+                                         self.target_id, self.corr_object_id,
+                                         **corr_func_args)
+                if matrix is not None:
+                    matrix[t, i] = prob
+                elif prob != 0:
+                    rows.append(t)
+                    cols.append(i)
+                    vals.append(float(prob))
+        if matrix is not None:
+            return matrix
+        return scipy.sparse.csr_matrix((vals, (rows, cols)), shape=(n, n))
+
+    def _normalize_matrix(self, matrix):
+        n = len(self._locations)
+        if self.backend == "dense":
+            matrix = np.array(matrix, dtype=float)
+            totals = matrix.sum(axis=1)
+            matrix[totals <= 0] = 1.0 / n
+            totals[totals <= 0] = 1.0
+            return matrix / totals[:, None]
+        else:
+            matrix = scipy.sparse.csr_matrix(matrix, dtype=float)
+            totals = np.asarray(matrix.sum(axis=1)).flatten()
+            self._empty_rows = set(np.nonzero(totals <= 0)[0].tolist())
+            totals[totals <= 0] = 1.0
+            return scipy.sparse.diags(1.0 / totals).dot(matrix).tocsr().sorted_indices()
+
+    def loc_index(self, loc):
+        """Returns the row/column index of `loc` in the matrix backends"""
+        return self._loc_index[loc]
+
+    def cond_matrix(self, target_locs):
+        """
+        Only for the 'dense' or 'sparse' backend. Returns (si_states, M) where M
+        has a row Pr(Si | starget) for each target location in `target_locs`
+        and a column for each si in si_states.
+        """
+        if self.backend == "tabular":
+            raise ValueError("cond_matrix is not available for the tabular backend")
+        rows = [self._loc_index[loc] for loc in target_locs]
+        if rows == list(range(len(self._locations))):
+            # No need to copy (the matrix may be a shared memory map)
+            matrix = self.matrix
+        else:
+            matrix = self.matrix[rows]
+        if self.backend == "sparse":
+            empty = [r for r, t in enumerate(rows) if t in self._empty_rows]
+            if len(empty) > 0:
+                matrix = matrix.toarray()
+                matrix[empty] = 1.0 / len(self._locations)
+        return self.valrange(self.corr_object_id), matrix
+
     def save(self, savepath):
         with open(savepath, "wb") as f:
-            dists = {}
-            for starget in self.dists:
-                dists[starget] = []
-                _dist = self.dists[starget]
-                for event in _dist.events:
-                    dists[starget].append((event.values, _dist.prob(event)))
-
-            pickle.dump({
+            data = {
                 "corr_object": (self.corr_object_id, self.corr_object_class),
                 "target_object": (self.target_id, self.target_class),
                 'search_region': self.search_region,
-                "dists": dists
-            }, f)
+                "backend": self.backend
+            }
+            if self.backend != "tabular":
+                data["matrix"] = self.matrix
+            else:
+                dists = {}
+                for starget in self.dists:
+                    dists[starget] = []
+                    _dist = self.dists[starget]
+                    for event in _dist.events:
+                        dists[starget].append((event.values, _dist.prob(event)))
+                data["dists"] = dists
+            pickle.dump(data, f)
 
     @staticmethod
     def load(loadpath):
         with open(loadpath, "rb") as f:
             data = pickle.load(f)
+        if "matrix" in data:
+            return CorrelationDist(data['corr_object'],
+                                   data['target_object'],
+                                   data['search_region'], None, None,
+                                   backend=data["backend"], matrix=data["matrix"],
+                                   normalized=True)
         dists = {}
         for starget in data['dists']:
             weights = data['dists'][starget]
@@ -93,6 +217,79 @@ class CorrelationDist(JointDist):
                                data['target_object'],
                                data['search_region'], None, None, dists=dists)
 
+    def save_mmap(self, savepath, content_hash):
+        """
+        Saves the matrix of a 'dense' or 'sparse' CorrelationDist as raw .npy
+        arrays plus a json metadata file, so that it can be loaded back as a
+        read-only memory map (see load_mmap) and shared among processes through
+        the page cache.
+
+        Files written: {savepath}.meta.json, and {savepath}.matrix.npy (dense)
+        or {savepath}.{data,indices,indptr}.npy (sparse).
+
+        Args:
+            savepath (str): path without extension
+            content_hash (str): see corr_content_hash; stored to detect stale caches.
+        """
+        if self.backend == "tabular":
+            raise ValueError("save_mmap requires the 'dense' or 'sparse' backend.")
+        if self.backend == "dense":
+            arrays = {"matrix": np.asarray(self.matrix)}
+        else:
+            arrays = {"data": self.matrix.data,
+                      "indices": self.matrix.indices,
+                      "indptr": self.matrix.indptr}
+        # Write to temporary files and then rename, so that processes that
+        # currently have an older version memory-mapped are not affected.
+        for name in arrays:
+            with open(f"{savepath}.{name}.npy.tmp", "wb") as f:
+                np.save(f, arrays[name])
+            os.replace(f"{savepath}.{name}.npy.tmp", f"{savepath}.{name}.npy")
+        meta = {"version": CORR_CACHE_VERSION,
+                "hash": content_hash,
+                "backend": self.backend,
+                "corr_object": [self.corr_object_id, self.corr_object_class],
+                "target_object": [self.target_id, self.target_class],
+                "shape": list(self.matrix.shape)}
+        # The metadata is written last; Its presence marks a complete cache.
+        with open(f"{savepath}.meta.json.tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(f"{savepath}.meta.json.tmp", f"{savepath}.meta.json")
+
+    @staticmethod
+    def load_mmap(loadpath, search_region, content_hash, mmap_mode="r"):
+        """
+        Loads a CorrelationDist saved by save_mmap. Returns None if the
+        cache does not exist, was written by a different format version,
+        or its content hash does not match `content_hash` (i.e. it is stale).
+
+        Args:
+            loadpath (str): path without extension
+            search_region (SearchRegion): must be the same one used to build the cache.
+            content_hash (str): expected hash (see corr_content_hash)
+            mmap_mode: passed to np.load; None loads the arrays into memory.
+        """
+        metapath = f"{loadpath}.meta.json"
+        if not os.path.exists(metapath):
+            return None
+        with open(metapath) as f:
+            meta = json.load(f)
+        if meta.get("version") != CORR_CACHE_VERSION\
+           or meta.get("hash") != content_hash:
+            return None
+        backend = meta["backend"]
+        if backend == "dense":
+            matrix = np.load(f"{loadpath}.matrix.npy", mmap_mode=mmap_mode)
+        else:
+            data, indices, indptr = [np.load(f"{loadpath}.{name}.npy", mmap_mode=mmap_mode)
+                                     for name in ["data", "indices", "indptr"]]
+            matrix = scipy.sparse.csr_matrix((data, indices, indptr),
+                                             shape=tuple(meta["shape"]), copy=False)
+        return CorrelationDist(tuple(meta["corr_object"]),
+                               tuple(meta["target_object"]),
+                               search_region, None, None,
+                               backend=backend, matrix=matrix, normalized=True)
+
     def marginal(self, variables, evidence):
         """Performs marignal inference,
         produce a joint distribution over `variables`,
@@ -111,6 +308,10 @@ class CorrelationDist(JointDist):
             "When inferring Pr(Si | Starget), you must provide a value for Starget"\
             "i.e. set evidence = <some target state>"
         target_state = evidence[self.target_id]
+        if self.backend != "tabular":
+            if target_state.loc not in self._loc_index:
+                raise ValueError("Unexpected value for target state in evidence: {}".format(target_state))
+            return MatrixCondDist(self, self._loc_index[target_state.loc])
         if target_state not in self.dists:
             import pdb; pdb.set_trace()
             raise ValueError("Unexpected value for target state in evidence: {}".format(target_state))
@@ -125,5 +326,126 @@ class CorrelationDist(JointDist):
             cls = self.target_class
         else:
             cls = self.corr_object_class
-        return [self.search_region.object_state(var, cls, loc)
-                for loc in self.search_region]
+        if var not in self._valranges:
+            self._valranges[var] = [self.search_region.object_state(var, cls, loc)
+                                    for loc in self._locations]
+        return self._valranges[var]
+
+
+class MatrixCondDist(JointDist):
+    """
+    Pr(Si | Starget = starget), a row of the matrix held by a CorrelationDist
+    with the 'dense' or 'sparse' backend. Supports the same operations
+    as the TabularDistribution returned by the tabular backend
+    (prob, valrange, sample) without creating an Event per location.
+    """
+    def __init__(self, corr_dist, row):
+        self.corr_dist = corr_dist
+        self.row = row
+        self.objid = corr_dist.corr_object_id
+        super().__init__([self.objid])
+        matrix_row = corr_dist.matrix[row]
+        if corr_dist.backend == "sparse":
+            if row in corr_dist._empty_rows:
+                n = len(corr_dist._locations)
+                self._indices = np.arange(n)
+                self._probs = np.full(n, 1.0 / n)
+            else:
+                self._indices = matrix_row.indices
+                self._probs = matrix_row.data
+        else:
+            self._indices = None
+            self._probs = matrix_row
+
+    def _prob_index(self, i):
+        if self._indices is None:
+            return self._probs[i]
+        pos = np.searchsorted(self._indices, i)
+        if pos < len(self._indices) and self._indices[pos] == i:
+            return self._probs[pos]
+        return 0.0
+
+    def prob(self, values):
+        """
+        Args:
+            values (dict or Event): maps from corr object id to object state
+        """
+        si = values[self.objid]
+        if si.loc not in self.corr_dist._loc_index:
+            raise ValueError("{} is not a valid event".format(values))
+        return float(self._prob_index(self.corr_dist.loc_index(si.loc)))
+
+    def __getitem__(self, si):
+        return self.prob({self.objid: si})
+
+    def valrange(self, var):
+        return self.corr_dist.valrange(var)
+
+    def sample(self, rnd=random):
+        i = rnd.choices(range(len(self._probs)), weights=self._probs, k=1)[0]
+        if self._indices is not None:
+            i = self._indices[i]
+        si = self.corr_dist.valrange(self.objid)[i]
+        return Event({self.objid: si})
+
+    def random(self, rnd=random):
+        return self.sample(rnd=rnd)
+
+
+def corr_content_hash(search_region, corr_object, target, corr_func, corr_func_args={},
+                      backend="dense"):
+    """
+    Returns a hash (str) of everything that determines the content of a
+    CorrelationDist, i.e. the search region locations (in order), the objects,
+    the correlation function and its arguments, and the backend. Used to
+    detect stale caches written by save_mmap.
+    """
+    if type(corr_func) == str:
+        func_str = corr_func
+    elif hasattr(corr_func, "__self__"):
+        # bound method, e.g. ConditionalSpatialCorrelation.func; the
+        # parameters of the object matter as much as the code.
+        owner = corr_func.__self__
+        if hasattr(owner, "cache_key"):
+            params = owner.cache_key()
+        else:
+            params = sorted((k, _canonical(v)) for k, v in vars(owner).items())
+        func_str = repr((type(owner).__qualname__, params,
+                         _func_content(corr_func.__func__)))
+    else:
+        func_str = _func_content(corr_func)
+    content = repr((CORR_CACHE_VERSION,
+                    list(search_region.locations),
+                    tuple(corr_object), tuple(target),
+                    func_str, sorted(corr_func_args.items()),
+                    backend))
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def _func_content(func):
+    """The name and code of a function, so that editing its body
+    changes the hash (see corr_content_hash)."""
+    name = "{}.{}".format(getattr(func, "__module__", ""),
+                          getattr(func, "__qualname__", str(func)))
+    try:
+        code = inspect.getsource(func)
+    except (OSError, TypeError):
+        # e.g. defined in an interactive session
+        func_code = getattr(func, "__code__", None)
+        if func_code is None:
+            return name
+        code = (func_code.co_code.hex(), repr(func_code.co_consts))
+    return repr((name, code,
+                 getattr(func, "__defaults__", None),
+                 getattr(func, "__kwdefaults__", None)))
+
+
+def _canonical(value):
+    """Turns numpy arrays (whose repr is abbreviated) into lists"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (list, tuple)):
+        return type(value)(_canonical(v) for v in value)
+    if isinstance(value, dict):
+        return sorted((k, _canonical(v)) for k, v in value.items())
+    return value
@@ -14,6 +14,7 @@
 
 import random
 import math
+import numpy as np
 from functools import reduce
 from pomdp_py.utils import typ
 from pomdp_py import ObservationModel, Gaussian
@@ -21,6 +22,7 @@ from pomdp_py import ObservationModel, Gaussian
 from .sensors import FanSensor, FrustumCamera
 from ..utils.math import fround, euclidean_dist
 from ..domain.observation import Loc, CosObservation, RobotObservation
+from ..domain.state import ObjectState
 
 
 ### Observation models
@@ -65,15 +67,111 @@ class CosObjectObservationModel(ObservationModel):
             if corr_dist is None:
                 raise ValueError("Must provide correlational distribution.")
 
+            self._corr_dist = corr_dist
             self._cond_dists = {}
             for starget in corr_dist.valrange(target_id):
                 # Obtain Pr(Si | S_target = starget)
                 self._cond_dists[starget.loc] =\
                     corr_dist.marginal([self.corr_object_id], evidence={self.target_id: starget})
 
+        self._cond_matrix = None  # (target locs, si states, matrix) for probability_vector
+        self._si_locs = None  # array of locations of si states in _cond_matrix
+        self._cond_rows = None  # ({target loc: row}, si states, si locs) for corr_cond_rows
+
     def corr_cond_dist(self, starget):
         return self._cond_dists[starget.loc]
 
+    def corr_cond_matrix(self, target_locs):
+        """
+        Returns (si_states, M) where M is a numpy array of shape
+        (len(target_locs), len(si_states)) with M[t,i] = Pr(Si = si_states[i] | starget at target_locs[t]).
+        The result is cached for the last `target_locs` it was called with,
+        since the target's value range rarely changes between steps.
+        """
+        target_locs = tuple(target_locs)
+        if self._cond_matrix is not None\
+           and self._cond_matrix[0] == target_locs:
+            return self._cond_matrix[1], self._cond_matrix[2]
+
+        if getattr(self._corr_dist, "backend", "tabular") != "tabular":
+            # The correlation is already stored as a matrix
+            si_states, matrix = self._corr_dist.cond_matrix(target_locs)
+            self._cond_matrix = (target_locs, si_states, matrix)
+            self._si_locs = np.array([si.loc for si in si_states])
+            return si_states, matrix
+
+        # Share the rows with corr_cond_rows, so a row is computed only once
+        # however the target locations are grouped between calls.
+        si_locs, matrix = self.corr_cond_rows(target_locs)
+        si_states = self._cond_rows[1]
+        self._cond_matrix = (target_locs, si_states, matrix)
+        self._si_locs = si_locs
+        return si_states, matrix
+
+    def corr_cond_rows(self, target_locs):
+        """
+        Returns (si_locs, M), where si_locs is an N x 2 array of the locations
+        of the si states and M[t,i] = Pr(Si at si_locs[i] | starget at target_locs[t]).
+        Unlike corr_cond_matrix, this does not replace the matrix cached for
+        probability_vector, so it suits callers that ask for a different set
+        of target locations every time (e.g. a particle filter). For the
+        tabular backend, the row of each target location is computed once
+        and kept.
+        """
+        target_locs = [tuple(loc) for loc in target_locs]
+        if getattr(self._corr_dist, "backend", "tabular") != "tabular":
+            si_states, matrix = self._corr_dist.cond_matrix(target_locs)
+            if self._cond_rows is None:
+                self._cond_rows = ({}, si_states, np.array([si.loc for si in si_states]))
+            return self._cond_rows[2], matrix
+
+        if self._cond_rows is None:
+            si_states = list(self._cond_dists[target_locs[0]].valrange(self.corr_object_id))
+            self._cond_rows = ({}, si_states, np.array([si.loc for si in si_states]))
+        rows, si_states, si_locs = self._cond_rows
+        for target_loc in target_locs:
+            if target_loc not in rows:
+                dist_si = self._cond_dists[target_loc]
+                rows[target_loc] = np.array([dist_si.prob({self.corr_object_id: si})
+                                             for si in si_states])
+        return si_locs, np.array([rows[target_loc] for target_loc in target_locs])
+
+    @property
+    def si_locs(self):
+        """N x 2 array of the locations of the si states returned
+        by the last call of corr_cond_matrix (in the same order)"""
+        return self._si_locs
+
+    def probability_vector(self, zi, target_states, srobot):
+        """
+        Computes Pr(zi | starget, srobot') for every starget in `target_states`
+        at once. Equivalent to calling `probability` for each target state, but
+        the detection model is evaluated only once per si instead of once per
+        (starget, si) pair.
+
+        Args:
+            zi (Loc): observation of object i
+            target_states (list): list of target ObjectStates
+            srobot (RobotState): next robot state
+        Returns:
+            numpy array of shape (len(target_states),)
+        """
+        if self.corr_object_id == self.target_id:
+            return self.detection_model.probability_batch(
+                zi, srobot, np.array([starget.loc for starget in target_states]))
+
+        target_locs = [s.loc for s in target_states]
+        if self._cond_matrix is None or self._cond_matrix[0] == tuple(target_locs):
+            si_states, matrix = self.corr_cond_matrix(target_locs)
+            si_locs = self._si_locs
+        else:
+            # A different set of target states than the cached one (e.g. the
+            # support of a SparseHistogram); take the rows from corr_cond_rows,
+            # so the cached matrix is neither evicted nor rebuilt.
+            si_locs, matrix = self.corr_cond_rows(target_locs)
+        pr_detection = self.detection_model.probability_batch(zi, srobot, si_locs)
+        return 1e-12 + matrix.dot(pr_detection)
+
     def probability(self, zi, snext, *args):
         # action doesn't matter here
         """
@@ -126,6 +224,34 @@ class DetectionModel:
     def sample(self, si, srobot, a=None):
         raise NotImplementedError
 
+    def probability_batch(self, zi, srobot, locs, a=None):
+        """
+        Returns a numpy array with Pr(zi | si, srobot') for an object
+        state si at each of the locations in `locs`. Agrees with
+        `probability`; Children classes should override this with
+        a vectorized implementation.
+
+        Args:
+            zi: object observation
+            srobot: robot state
+            locs (array-like): N x 2 array of object locations
+        """
+        return np.array([self.probability(zi, ObjectState(self.objid, self.objid, tuple(loc)), srobot, a=a)
+                         for loc in locs])
+
+
+def _gaussian_pdf_batch(locs, point, sigma):
+    """Returns the pdf at `point` of isotropic 2D gaussians with standard deviation
+    `sigma` centered at each of `locs` (N x 2 array); Same as pomdp_py.Gaussian."""
+    diff = np.asarray(locs, dtype=float) - np.asarray(point, dtype=float)
+    sqdist = np.sum(diff**2, axis=1)
+    return np.exp(-0.5 * sqdist / sigma**2) / (2 * math.pi * sigma**2)
+
+
+def _dist_batch(locs, point):
+    return np.linalg.norm(np.asarray(locs, dtype=float) - np.asarray(point, dtype=float), axis=1)
+
+
 class FanModel(DetectionModel):
     def __init__(self, objid, fan_params,
                  quality_params, round_to="int", **kwargs):
@@ -203,7 +329,7 @@ class FanModelYoonseon(FanModel):
             # This has 0.0 probability.
             prob += 0.0 * alpha
         else:
-            gaussian = Gaussian(list(si),
+            gaussian = Gaussian(list(si.loc),
                                 [[sigma**2, 0],
                                  [0, sigma**2]])
             prob += gaussian[zi.loc] * alpha
@@ -216,6 +342,20 @@ class FanModelYoonseon(FanModel):
         prob += pr_c * gamma
         return prob
 
+    def probability_batch(self, zi, srobot, locs, a=None):
+        sigma, epsilon = self.params
+        in_range = srobot.locs_in_range(self.sensor, locs)
+        alpha = np.where(in_range, epsilon, (1.0 - epsilon) / 2.0)
+        beta = (1.0 - epsilon) / 2.0
+        gamma = np.where(in_range, (1.0 - epsilon) / 2.0, epsilon)
+        prob = np.full(len(locs), 1e-12)
+        if zi.loc is not None:
+            prob += _gaussian_pdf_batch(locs, zi.loc, sigma) * alpha
+        prob += (1.0 / self.sensor.sensor_region_size) * beta
+        if zi.loc is None:
+            prob += gamma
+        return prob
+
     def sample(self, si, srobot, a=None, return_event=False):
         sigma, epsilon = self.params
         alpha, beta, gamma = self._compute_params(
@@ -295,6 +435,15 @@ class FanModelNoFP(FanModel):
             else:
                 return 1e-12
 
+    def probability_batch(self, zi, srobot, locs, a=None):
+        in_range = srobot.locs_in_range(self.sensor, locs)
+        if zi.loc is None:
+            return np.where(in_range, 1.0 - self.detection_prob, 1.0)
+        else:
+            return np.where(in_range,
+                            self.detection_prob * _gaussian_pdf_batch(locs, zi.loc, self.sigma),
+                            1e-12)
+
 
     def sample(self, si, srobot, a=None, return_event=False):
         in_range = srobot.in_range(self.sensor, si)
@@ -395,6 +544,21 @@ class FanModelSimpleFP(FanModel):
             else:
                 return self.false_pos_rate / self.sensor.sensor_region_size
 
+    def probability_batch(self, zi, srobot, locs, a=None):
+        in_range = srobot.locs_in_range(self.sensor, locs)
+        if zi.loc is None:
+            return np.where(in_range, 1.0 - self.detection_prob, 1.0 - self.false_pos_rate)
+
+        false_pos = self.false_pos_rate / self.sensor.sensor_region_size
+        if not srobot.loc_in_range(self.sensor, zi.loc):
+            # See probability(); zi is outside of the FOV
+            pr_in_range = self.false_pos_rate / (100 - (self.sensor.sensor_region_size))
+        else:
+            pr_in_range = np.where(_dist_batch(locs, zi.loc) > 3*self.sigma,
+                                   false_pos,
+                                   self.detection_prob * _gaussian_pdf_batch(locs, zi.loc, self.sigma))
+        return np.where(in_range, pr_in_range, false_pos)
+
 
     def sample(self, si, srobot, a=None, return_event=False):
         in_range = srobot.in_range(self.sensor, si)
@@ -517,6 +681,23 @@ class FanModelFarRange(FanModel):
             else:
                 return distance_weight * self.false_pos_rate / self.sensor.sensor_region_size
 
+    def probability_batch(self, zi, srobot, locs, a=None):
+        in_range = srobot.locs_in_range(self.sensor, locs)
+        if zi.loc is None:
+            return np.where(in_range, 1.0 - self.detection_prob, 1.0 - self.false_pos_rate)
+
+        distance = euclidean_dist(zi.loc, srobot.loc)
+        if distance <= self.sensor.mean_range:
+            distance_weight = 1.0
+        else:
+            distance_weight = math.exp(-(distance - self.sensor.mean_range)**2)
+        false_pos = distance_weight * self.false_pos_rate / self.sensor.sensor_region_size
+        pr_in_range = np.where(_dist_batch(locs, zi.loc) > 3*self.sigma,
+                               false_pos,
+                               distance_weight * self.detection_prob\
+                               * _gaussian_pdf_batch(locs, zi.loc, self.sigma))
+        return np.where(in_range, pr_in_range, false_pos)
+
 
     def sample(self, si, srobot, a=None, return_event=False):
         in_range = srobot.in_range(self.sensor, si)
@@ -593,6 +774,42 @@ class CosObservationModel(ObservationModel):
             pr_joint *= pr
         return pr_joint
 
+    def probability_vector(self, observation, target_states, next_srobot):
+        """
+        Computes Pr(observation | starget, srobot') for every starget
+        in `target_states`; Returns a numpy array of the same length.
+
+        Args:
+            observation (CosObservation2D)
+            target_states (list): list of target ObjectStates
+            next_srobot (RobotState): next robot state
+        """
+        if observation.z(self.robot_id).pose != next_srobot['pose']\
+           or observation.z(self.robot_id).status != next_srobot['status']:
+            return np.full(len(target_states), 1e-12)
+        pr_joint = np.ones(len(target_states))
+        for zi in observation:
+            pr_joint *= self.zi_models[zi.objid].probability_vector(
+                zi, target_states, next_srobot)
+        return pr_joint
+
+    def log_probability_vector(self, observation, target_states, next_srobot):
+        """
+        Same as probability_vector, but returns log Pr(observation | starget, srobot').
+        The log likelihoods of the objects' observations are summed instead of
+        multiplying their probabilities, so the result does not underflow
+        when there are many detectable objects.
+        """
+        if observation.z(self.robot_id).pose != next_srobot['pose']\
+           or observation.z(self.robot_id).status != next_srobot['status']:
+            return np.full(len(target_states), math.log(1e-12))
+        logpr_joint = np.zeros(len(target_states))
+        with np.errstate(divide="ignore"):
+            for zi in observation:
+                logpr_joint += np.log(self.zi_models[zi.objid].probability_vector(
+                    zi, target_states, next_srobot))
+        return logpr_joint
+
 
 # The 3D occlusion stuff is not yet complete or needed
 # class DetectionModelFull:
@@ -39,7 +39,7 @@ class PolicyModel(RolloutPolicy):
         return self._observation_model
 
     def sample(self, state):
-        return random.sample(self.get_all_actions(state=state), 1)[0]
+        return random.choice(tuple(self.get_all_actions(state=state)))
 
     def get_all_actions(self, state, history=None):
         raise NotImplementedError
@@ -48,11 +48,11 @@ class PolicyModel(RolloutPolicy):
         if self.action_prior is not None:
             preferences = self.action_prior.get_preferred_actions(state, history)
             if len(preferences) > 0:
-                return random.sample(preferences, 1)[0][0]
+                return random.choice(tuple(preferences))[0]
             else:
-                return random.sample(self.get_all_actions(state=state), 1)[0]
+                return random.choice(tuple(self.get_all_actions(state=state)))
         else:
-            return random.sample(self.get_all_actions(state=state), 1)[0]
+            return random.choice(tuple(self.get_all_actions(state=state)))
 
     def set_observation_model(self, observation_model, use_heuristic=True):
         # Classes that inherit this class can override this
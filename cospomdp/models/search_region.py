@@ -13,6 +13,7 @@
 # limitations under the License.
 
 from ..domain.state import ObjectState
+from ..utils.spatial import PointIndex
 
 class SearchRegion:
     """domain-specific / abstraction-specific host of a set of locations. All that
@@ -44,6 +45,13 @@ class SearchRegion2D(SearchRegion):
                            for x in range(self._w)
                            for y in range(self._l)
                            if (x,y) not in locations}
+        self._index = None
+
+    def closest_location(self, loc):
+        """Returns the location in the search region closest to `loc`"""
+        if getattr(self, "_index", None) is None:  # search regions pickled before may not have _index
+            self._index = PointIndex(self.locations)
+        return self._index.nearest(loc)
 
     def object_state(self, objid, objclass, loc):
         return ObjectState(objid, objclass, loc)
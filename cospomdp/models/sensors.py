@@ -15,7 +15,7 @@
 import math
 import random
 import numpy as np
-from scipy.spatial.transform import Rotation as R
+from collections import OrderedDict
 
 from ..utils.math import (to_rad, to_deg, R2d,
                           euclidean_dist, pol2cart,
@@ -85,6 +85,11 @@ class FanSensor(SensorModel):
         self.max_range = max_range
         # this is not actually used unless the sensor model is far range.
         self.mean_range = params.get("mean_range", max_range)
+        # Maximum number of sensor poses whose footprint mask is cached; 0 disables the cache.
+        self.footprint_cache_size = params.get("footprint_cache_size", 1024)
+        self._footprints = OrderedDict()  # (sensor_pose, use_mean) -> (origin, mask)
+        self._footprint_hits = 0
+        self._footprint_misses = 0
 
     def __init__(self, name="laser2d_sensor", **params):
         """
@@ -140,7 +145,69 @@ class FanSensor(SensorModel):
         Args:
             point (x, y): 2D point
             sensor_pose (x, y, th): 2D robot pose
+        If the point is on the integer grid, the answer is looked up from
+        the footprint mask of the sensor pose (see footprint).
         """
+        if self.footprint_cache_size > 0 and len(point) == 2:
+            px, py = point
+            ix, iy = int(px), int(py)
+            if ix == px and iy == py:
+                (x0, y0), mask = self.footprint(sensor_pose, use_mean=use_mean)
+                if 0 <= ix - x0 < mask.shape[0] and 0 <= iy - y0 < mask.shape[1]:
+                    return bool(mask[ix - x0, iy - y0])
+                return False
+        return self._in_range(point, sensor_pose, use_mean=use_mean)
+
+    def footprint(self, sensor_pose, use_mean=False):
+        """
+        Returns ((x0, y0), mask) where mask is a boolean array such that
+        mask[x - x0, y - y0] is True iff the integer location (x, y) is in range
+        of the sensor at `sensor_pose`. Integer locations outside of the mask are
+        not in range. Masks are kept in an LRU cache of size footprint_cache_size.
+        """
+        key = self._footprint_key(sensor_pose, use_mean)
+        if key in self._footprints:
+            self._footprint_hits += 1
+            self._footprints.move_to_end(key)
+            return self._footprints[key]
+
+        self._footprint_misses += 1
+        footprint = self._compute_footprint(sensor_pose, use_mean=use_mean)
+        self._footprints[key] = footprint
+        if len(self._footprints) > self.footprint_cache_size:
+            self._footprints.popitem(last=False)
+        return footprint
+
+    def _footprint_key(self, sensor_pose, use_mean):
+        return (tuple(sensor_pose), use_mean)
+
+    def _compute_footprint(self, sensor_pose, use_mean=False):
+        """Builds the ((x0, y0), mask) returned by footprint, testing
+        every integer location in the bounding box at once."""
+        bound = max(self.max_range, self.mean_range) if use_mean else self.max_range
+        x0 = int(math.floor(sensor_pose[0] - bound))
+        y0 = int(math.floor(sensor_pose[1] - bound))
+        x1 = int(math.ceil(sensor_pose[0] + bound))
+        y1 = int(math.ceil(sensor_pose[1] + bound))
+        xs, ys = np.mgrid[x0:x1 + 1, y0:y1 + 1]
+        points = np.stack([xs.ravel(), ys.ravel()], axis=1)
+        mask = self.in_range_batch(points, sensor_pose, use_mean=use_mean).reshape(xs.shape)
+        return ((x0, y0), mask)
+
+    def footprint_cache_info(self):
+        """Returns a dict with the size, memory (bytes) and hit/miss
+        counts of the footprint cache"""
+        return dict(size=len(self._footprints),
+                    maxsize=self.footprint_cache_size,
+                    nbytes=sum(mask.nbytes for _, mask in self._footprints.values()),
+                    hits=self._footprint_hits,
+                    misses=self._footprint_misses)
+
+    def clear_footprint_cache(self):
+        self._footprints.clear()
+
+    def _in_range(self, point, sensor_pose, use_mean=False):
+        """The geometric test behind in_range"""
         if sensor_pose[:2] == point and self.min_range == 0:
             return True
         sensor_pose = (*sensor_pose[:2], to_rad(sensor_pose[2]))
@@ -158,6 +225,29 @@ class FanSensor(SensorModel):
                 return False
         return False
 
+    def in_range_batch(self, points, sensor_pose, use_mean=False):
+        """
+        Vectorized version of in_range.
+        Args:
+            points (array-like): N x 2 array of 2D points
+            sensor_pose (x, y, th): 2D robot pose
+        Returns:
+            numpy boolean array of length N
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        rx, ry = sensor_pose[:2]
+        rth = to_rad(sensor_pose[2])
+        dx = points[:, 0] - rx
+        dy = points[:, 1] - ry
+        dist = np.sqrt(dx**2 + dy**2)
+        bearing = (np.arctan2(dy, dx) - rth) % (2*math.pi)
+        range_bound = self.max_range if not use_mean else self.mean_range
+        result = (self.min_range <= dist) & (dist <= range_bound)\
+            & ((bearing <= self._fov_rad/2) | (bearing >= 2*math.pi - self._fov_rad/2))
+        if self.min_range == 0:
+            result |= (dx == 0) & (dy == 0)
+        return result
+
     def in_range_facing(self, point, sensor_pose,
                         angular_tolerance=15):
         desired_yaw = yaw_facing(sensor_pose[:2], point)
@@ -190,7 +280,10 @@ class FanSensor3D(FanSensor):
         # Note that because of the tilt, the range will change.
         super().__init__(**params)
         self.v_angles = params["v_angles"]
-        self._cache = {}
+        # pitch -> FanSensor with the projected parameters; an LRU cache
+        # bounded like the footprint cache. The footprint masks themselves
+        # are cached by this sensor (see _footprint_key), not by the projections.
+        self._cache = OrderedDict()
 
     @staticmethod
     def from_fan(fan, v_angles):
@@ -198,6 +291,7 @@ class FanSensor3D(FanSensor):
                            max_range=fan.max_range,
                            fov=fan.fov,
                            mean_range=fan.mean_range,
+                           footprint_cache_size=fan.footprint_cache_size,
                            v_angles=v_angles)
 
     def __str__(self):
@@ -234,25 +328,46 @@ class FanSensor3D(FanSensor):
         return fov_proj
 
     def _project2d(self, sensor_pose):
-        if sensor_pose in self._cache:
-            return self._cache[sensor_pose]
-        else:
-            x, y, height, pitch, yaw = sensor_pose
-            params_proj = self._project_range(height, pitch)
-            min_range_proj, max_range_proj, mean_range_proj = params_proj
-            fov_proj = self._project_fov(pitch)
-            fan2d = FanSensor(min_range=min_range_proj,
-                              max_range=max_range_proj,
-                              mean_range=mean_range_proj,
-                              fov=fov_proj)
-            self._cache[sensor_pose] = fan2d
+        # The projection only depends on the pitch
+        x, y, height, pitch, yaw = sensor_pose
+        if pitch in self._cache:
+            self._cache.move_to_end(pitch)
+            return self._cache[pitch]
+        params_proj = self._project_range(height, pitch)
+        min_range_proj, max_range_proj, mean_range_proj = params_proj
+        fov_proj = self._project_fov(pitch)
+        fan2d = FanSensor(min_range=min_range_proj,
+                          max_range=max_range_proj,
+                          mean_range=mean_range_proj,
+                          fov=fov_proj,
+                          footprint_cache_size=0)
+        self._cache[pitch] = fan2d
+        if len(self._cache) > max(1, self.footprint_cache_size):
+            self._cache.popitem(last=False)
         return fan2d
 
-    def in_range(self, point, sensor_pose, use_mean=False):
-        # Create a 2D sensor with projected parameters
+    def _footprint_key(self, sensor_pose, use_mean):
+        # Poses that differ only in height share the projected fan, so
+        # they share a mask too.
+        fan2d = self._project2d(sensor_pose)
+        x, y, height, pitch, yaw = sensor_pose
+        return ((fan2d.min_range, fan2d.max_range, fan2d.mean_range, fan2d.fov),
+                (x, y, yaw), use_mean)
+
+    def _compute_footprint(self, sensor_pose, use_mean=False):
+        fan2d = self._project2d(sensor_pose)
+        x, y, height, pitch, yaw = sensor_pose
+        return fan2d._compute_footprint((x, y, yaw), use_mean=use_mean)
+
+    def _in_range(self, point, sensor_pose, use_mean=False):
+        fan2d = self._project2d(sensor_pose)
+        x, y, height, pitch, yaw = sensor_pose
+        return fan2d._in_range(point, (x, y, yaw), use_mean=use_mean)
+
+    def in_range_batch(self, points, sensor_pose, use_mean=False):
         fan2d = self._project2d(sensor_pose)
         x, y, height, pitch, yaw = sensor_pose
-        return fan2d.in_range(point, (x, y, yaw), use_mean=use_mean)
+        return fan2d.in_range_batch(points, (x, y, yaw), use_mean=use_mean)
 
     def uniform_sample_sensor_region(self, sensor_pose):
         fan2d = self._project2d(sensor_pose)
@@ -488,6 +603,7 @@ class FrustumCamera(SensorModel):
         look = np.array([0.0, 0.0, -1.0])
 
         #transform up, look vector according to current camera pose
+        from scipy.spatial.transform import Rotation as R
         r = R.from_quat([rot[0],rot[1],rot[2],rot[3]])
         curr_up = r.apply(up)
         curr_look = r.apply(look)
@@ -0,0 +1,221 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Root-parallel POUCT: several independent search trees are built
+# from the same belief in separate processes; their root action
+# statistics are merged before choosing the action.
+
+import time
+import random
+import multiprocessing
+import numpy as np
+import pomdp_py
+
+# Set in each worker process by _init_worker, to the agent and planner
+# of the RootParallelPOUCT that owns the worker's pool. The initializer
+# arguments are inherited when forked (copy-on-write), so the agent is
+# never pickled. Only its belief is sent to the workers at each step.
+_WORKER_AGENT = None
+_WORKER_PLANNER = None
+
+
+def _init_worker(agent, planner):
+    """Pool initializer; runs in the worker process."""
+    global _WORKER_AGENT, _WORKER_PLANNER
+    _WORKER_AGENT, _WORKER_PLANNER = agent, planner
+
+
+def _plan_in_worker(args):
+    """Runs POUCT in a forked worker process on a fresh tree, from `belief`.
+    Returns ({action: (num_visits, value)}, num_sims)"""
+    seed, belief = args
+    random.seed(seed)
+    np.random.seed(seed % (2**32))
+    agent = _WORKER_AGENT
+    agent.set_belief(belief)
+    if hasattr(agent, "tree"):
+        del agent.tree  # the parent keeps (and reuses) its own tree
+    _WORKER_PLANNER.plan(agent)
+    return root_stats(agent.tree), _WORKER_PLANNER.last_num_sims
+
+
+def root_stats(tree):
+    """Returns {action: (num_visits, value)} for the children of the root"""
+    return {action: (tree[action].num_visits, tree[action].value)
+            for action in tree.children}
+
+
+def merge_root_stats(stats):
+    """Merges the root statistics of several trees. The number of visits
+    are summed, and the value is the visit-weighted average of values.
+
+    Args:
+        stats (list): list of {action: (num_visits, value)}
+    Returns:
+        {action: (num_visits, value)}"""
+    merged = {}
+    for tree_stats in stats:
+        for action, (num_visits, value) in tree_stats.items():
+            total_visits, total_value = merged.get(action, (0, 0.0))
+            merged[action] = (total_visits + num_visits,
+                              total_value + num_visits * value)
+    return {action: (num_visits, total_value / max(num_visits, 1))
+            for action, (num_visits, total_value) in merged.items()}
+
+
+class RootParallelPOUCT(pomdp_py.Planner):
+    """Runs `num_workers` POUCT searches from the same belief, each with a
+    different random seed, and picks the action with the highest merged
+    value (see merge_root_stats). One of the searches runs in the calling
+    process on `agent.tree`, so tree reuse through `update` and tree debugging
+    work just as with POUCT; the others run in forked processes on fresh
+    trees. With planning_time set, each step therefore gets about
+    `num_workers` times the simulations of POUCT; with num_sims set, each
+    tree runs num_sims simulations.
+
+    The worker processes are forked at the first call of `plan` and kept
+    for the following calls, which only send them the agent's current
+    belief. The workers therefore keep the agent's models as they were
+    when forked. If the models are changed in place (e.g. a new topological
+    map), or `plan` is called with a different agent, call `reset_workers`
+    so that the next `plan` forks again; `plan` does this by itself for a
+    different agent object. Call `close` (or use the planner as a context
+    manager) to end the workers.
+
+    Forking requires the 'fork' start method (i.e. Linux/macOS). If it
+    is not available, or num_workers is 1, this behaves exactly as POUCT.
+    """
+    def __init__(self, num_workers=2, seed=None, **pouct_args):
+        """
+        Args:
+            num_workers (int): number of search trees (processes) per step.
+            seed (int): seeds of the workers are derived from this. If None,
+                they are drawn from `random`.
+            pouct_args: arguments to pomdp_py.POUCT
+        """
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1")
+        self._pouct = pomdp_py.POUCT(**pouct_args)
+        self._num_workers = num_workers
+        if num_workers > 1 and "fork" not in multiprocessing.get_all_start_methods():
+            print("Warning: fork is unavailable; RootParallelPOUCT runs one tree.")
+            self._num_workers = 1
+        self._seed = seed
+        self._plan_count = 0
+        self._last_num_sims = 0
+        self._last_planning_time = 0.0
+        self._last_root_stats = {}
+        self._pool = None
+        self._pool_agent = None  # the agent the workers were forked with
+
+    @property
+    def num_workers(self):
+        return self._num_workers
+
+    @property
+    def last_num_sims(self):
+        """Total number of simulations, over all trees, in the last plan"""
+        return self._last_num_sims
+
+    @property
+    def last_planning_time(self):
+        return self._last_planning_time
+
+    @property
+    def last_root_stats(self):
+        """Merged root statistics {action: (num_visits, value)} of the last plan"""
+        return self._last_root_stats
+
+    @property
+    def updates_agent_belief(self):
+        return self._pouct.updates_agent_belief
+
+    def set_rollout_policy(self, rollout_policy):
+        self._pouct.set_rollout_policy(rollout_policy)
+
+    def _worker_seeds(self):
+        if self._seed is None:
+            return [random.randrange(2**31) for _ in range(self._num_workers - 1)]
+        base = self._seed + self._plan_count * self._num_workers
+        return [base + i for i in range(1, self._num_workers)]
+
+    def _workers_for(self, agent):
+        """Returns the pool of workers that hold (a fork of) `agent`"""
+        if self._pool is not None and self._pool_agent is not agent:
+            self.reset_workers()
+        if self._pool is None:
+            # The pool also runs the initializer in any worker it forks
+            # to replace one that exits.
+            self._pool = multiprocessing.get_context("fork").Pool(
+                self._num_workers - 1,
+                initializer=_init_worker,
+                initargs=(agent, self._pouct))
+            self._pool_agent = agent
+        return self._pool
+
+    def reset_workers(self):
+        """Ends the worker processes; the next `plan` forks new ones from the
+        agent as it is then. Needed after the agent's models change."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+        self._pool = None
+        self._pool_agent = None
+
+    def close(self):
+        """Ends the worker processes"""
+        self.reset_workers()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def plan(self, agent):
+        _start = time.time()
+        seeds = self._worker_seeds()
+        self._plan_count += 1
+        if len(seeds) == 0:
+            action = self._pouct.plan(agent)
+            self._last_num_sims = self._pouct.last_num_sims
+            self._last_root_stats = root_stats(agent.tree)
+            self._last_planning_time = time.time() - _start
+            return action
+
+        pool = self._workers_for(agent)
+        belief = agent.belief
+        async_results = pool.map_async(_plan_in_worker,
+                                       [(seed, belief) for seed in seeds],
+                                       chunksize=1)
+        self._pouct.plan(agent)
+        num_sims = self._pouct.last_num_sims
+        stats = [root_stats(agent.tree)]
+        for worker_stats, worker_num_sims in async_results.get():
+            stats.append(worker_stats)
+            num_sims += worker_num_sims
+
+        self._last_root_stats = merge_root_stats(stats)
+        self._last_num_sims = num_sims
+        self._last_planning_time = time.time() - _start
+        # Only actions at the root of the local tree can be chosen, so that
+        # `update` can always follow the chosen action in agent.tree.
+        return max(agent.tree.children,
+                   key=lambda action: self._last_root_stats[action][1])
+
+    def update(self, agent, real_action, real_observation):
+        self._pouct.update(agent, real_action, real_observation)
+
+    def clear_agent(self):
+        self._pouct.clear_agent()
@@ -14,3 +14,4 @@
 
 from .dist import JointDist
 from .tabular_dist import TabularDistribution, Event
+from .array_dist import ArrayDistribution
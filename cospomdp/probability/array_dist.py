@@ -0,0 +1,300 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A joint distribution stored as an N-dimensional numpy array, with one
+axis per variable. It offers the same operations as TabularDistribution
+(prob, condition, sum_out, marginal, to_df), but conditioning is
+slicing, summing out is a sum over axes and looking up a probability
+is integer indexing, instead of loops over a dict of Events. Prefer it
+for large tables (e.g. 10^5+ entries).
+"""
+
+import random
+import numpy as np
+from prettytable import PrettyTable
+from .dist import JointDist
+from .tabular_dist import Event, TabularDistribution
+
+def _to_setting(variables, values):
+    """Converts `values` to a dict from variable to value, the same way
+    TabularDistribution._convert_to_event does. `values` could be a dict,
+    an Event, a list of values in the same order as `variables`, or a list
+    of tuples (var_name, var_value)."""
+    if isinstance(values, Event):
+        return values.values
+    elif type(values) == dict:
+        return values
+    elif type(values) == list or type(values) == tuple:
+        setting = {}
+        for i, item in enumerate(values):
+            if type(item) == tuple:
+                var, val = item
+            else:
+                var, val = variables[i], item
+            setting[var] = val
+        return setting
+    elif len(variables) == 1:
+        return {variables[0]: values}
+    else:
+        raise TypeError("Unable to handle type of values {}".format(type(values)))
+
+
+class ArrayDistribution(JointDist):
+    """A joint distribution over `variables` stored in a numpy
+    array `table`, where table[i1, ..., iN] is the probability
+    of variables[0] = valranges[variables[0]][i1], etc."""
+
+    def __init__(self,
+                 variables,
+                 table,
+                 valranges,
+                 condition=None,
+                 normalize=True):
+        """
+        Args:
+            variables (list): List of variables. E.g. ["X", "Y"]
+            table (array-like): N-dimensional array; axis k corresponds
+                to variables[k] and has length len(valranges[variables[k]]).
+            valranges (dict): Maps from variable to the list of its values,
+                in the order of the table's axis for that variable.
+            condition (dict or Event): A mapping from variable name to value,
+                which is the event this distribution is conditioned on;
+                stored as `self.evidence`.
+            normalize (bool): True if the table should be normalized to sum to 1.
+        """
+        assert type(variables) == list, "variables must be of type list."
+        super().__init__(variables)
+        self.variables = variables
+        self.table = np.asarray(table, dtype=float)
+        if self.table.ndim != len(variables):
+            raise ValueError("table has {} dimensions but there are {} variables"
+                             .format(self.table.ndim, len(variables)))
+        self.ranges = {}    # Maps from variable name to the list of its values
+        self._index = {}    # Maps from variable name to {value -> index}
+        for axis, var in enumerate(variables):
+            values = list(valranges[var])
+            if len(values) != self.table.shape[axis]:
+                raise ValueError("{} has {} values but axis {} of the table has length {}"
+                                 .format(var, len(values), axis, self.table.shape[axis]))
+            self.ranges[var] = values
+            self._index[var] = {val: i for i, val in enumerate(values)}
+        self._axis = {var: axis for axis, var in enumerate(variables)}
+        self._cdf = None  # for sampling; computed on demand
+
+        self.evidence = None
+        if condition is not None:
+            self.evidence = Event(dict(_to_setting(variables, condition)))
+
+        if normalize:
+            self.normalize()
+
+    @classmethod
+    def from_weights(cls, variables, weights, condition=None, normalize=True):
+        """Builds an ArrayDistribution from weights given in the same
+        format accepted by TabularDistribution (a list [(values, prob), ...]
+        or a dict mapping from Event to probability). Settings of the
+        variables that do not appear in `weights` have probability 0."""
+        if type(weights) == dict:
+            items = [(event.values, weights[event]) for event in weights]
+        else:
+            items = list(weights)
+        rows = []
+        for values, prob in items:
+            setting = _to_setting(variables, values)
+            rows.append((tuple(setting[var] for var in variables), prob))
+
+        valranges = {var: [] for var in variables}
+        index = {var: {} for var in variables}
+        coords = np.empty((len(rows), len(variables)), dtype=np.int64)
+        probs = np.empty(len(rows), dtype=float)
+        for r, (row, prob) in enumerate(rows):
+            for k, var in enumerate(variables):
+                i = index[var].get(row[k])
+                if i is None:
+                    i = index[var][row[k]] = len(valranges[var])
+                    valranges[var].append(row[k])
+                coords[r, k] = i
+            probs[r] = prob
+        table = np.zeros(tuple(len(valranges[var]) for var in variables))
+        if len(rows) > 0:
+            np.add.at(table, tuple(coords.T), probs)
+        return cls(variables, table, valranges,
+                   condition=condition, normalize=normalize)
+
+    @classmethod
+    def from_tabular(cls, dist):
+        """Converts a TabularDistribution into an ArrayDistribution"""
+        # TabularDistribution stores its condition as an instance attribute
+        return cls.from_weights(list(dist.variables), dist.probs,
+                                condition=dist.__dict__.get("condition", None),
+                                normalize=False)
+
+    def to_tabular(self):
+        """Returns a TabularDistribution with the entries of this table
+        that have nonzero probability"""
+        weights = {}
+        for idx in zip(*np.nonzero(self.table)):
+            weights[Event(self._setting(idx))] = float(self.table[idx])
+        return TabularDistribution(list(self.variables), weights, normalize=False)
+
+    def normalize(self):
+        total_prob = self.table.sum()
+        if total_prob > 0.0:
+            self.table = self.table / total_prob
+        self._cdf = None
+
+    def has_var(self, var):
+        return var in self._axis
+
+    def valrange(self, var):
+        return self.ranges[var]
+
+    @property
+    def events(self):
+        return set(Event(self._setting(idx))
+                   for idx in np.ndindex(*self.table.shape))
+
+    def _setting(self, idx):
+        return {var: self.ranges[var][i]
+                for var, i in zip(self.variables, idx)}
+
+    def _indexer(self, setting):
+        """Returns a tuple that indexes self.table, with an integer
+        for every variable in `setting` and a full slice otherwise."""
+        for var in setting:
+            if var not in self._axis:
+                raise ValueError("{} is not a variable of this distribution".format(var))
+        indexer = []
+        for var in self.variables:
+            if var in setting:
+                i = self._index[var].get(setting[var])
+                if i is None:
+                    raise ValueError("{} is not a valid value of {}".format(setting[var], var))
+                indexer.append(i)
+            else:
+                indexer.append(slice(None))
+        return tuple(indexer)
+
+    def prob(self, values):
+        """
+        Returns the probability of the given setting of values. If not all
+        variables are given a value, the others are summed out.
+
+        Args:
+            values (tuple or list or dict or Event): Either a list of values in order or
+                a dictionary mapping from variable name to value
+        """
+        return float(np.sum(self.table[self._indexer(_to_setting(self.variables, values))]))
+
+    def __getitem__(self, values):
+        return self.prob(values)
+
+    def probs_of(self, settings):
+        """Vectorized prob: returns an array with the probability of
+        each full setting in `settings`, an (M x N) array of value
+        indices (one column per variable, in the order of self.variables)"""
+        settings = np.asarray(settings, dtype=np.int64)
+        return self.table[tuple(settings.T)]
+
+    def sample(self, rnd=random):
+        """Returns an Event sampled from this distribution"""
+        if self._cdf is None:
+            self._cdf = np.cumsum(self.table.ravel())
+        flat = int(np.searchsorted(self._cdf, rnd.random() * self._cdf[-1], side="right"))
+        flat = min(flat, len(self._cdf) - 1)
+        return Event(self._setting(np.unravel_index(flat, self.table.shape)))
+
+    def mpe(self):
+        """Returns the most probable setting as an Event"""
+        return Event(self._setting(np.unravel_index(np.argmax(self.table),
+                                                    self.table.shape)))
+
+    def condition(self, observation):
+        """
+        Returns an ArrayDistribution over the variables that are
+        not observed, given `observation`.
+
+        Args:
+            observation (dict or Event): a mapping from variable name to value or an event
+        """
+        setting = _to_setting(self.variables, observation)
+        try:
+            table = self.table[self._indexer(setting)]
+        except ValueError:
+            raise ValueError("The observations {} is not valid".format(observation))
+        remain_variables = [var for var in self.variables
+                            if var not in setting]
+        # If the total probability is 0, no event is probable for all ranges
+        # of the remaining variables; normalize() leaves the table as is.
+        return ArrayDistribution(remain_variables, np.array(table),
+                                 {var: self.ranges[var] for var in remain_variables},
+                                 condition=setting, normalize=True)
+
+    def sum_out(self, variables):
+        """Returns an ArrayDistribution after summing
+        out the given variables."""
+        summing_vars = set(variables)
+        axes = tuple(self._axis[var] for var in self.variables
+                     if var in summing_vars)
+        remain_vars = [var for var in self.variables
+                       if var not in summing_vars]
+        return ArrayDistribution(remain_vars, self.table.sum(axis=axes),
+                                 {var: self.ranges[var] for var in remain_vars},
+                                 normalize=True)
+
+    def marginal(self, outvars, evidence=None):
+        dist = self
+        if evidence is not None:
+            dist = self.condition(evidence)
+        elim_vars = [var for var in dist.variables
+                     if var not in outvars]
+        return dist.sum_out(elim_vars)
+
+    def product(self, other, normalize=True):
+        """Returns the pointwise product of this distribution and `other`
+        (another ArrayDistribution), as a distribution over the union of
+        their variables (a factor product). Shared variables must have
+        the same value ranges, in the same order."""
+        for var in other.variables:
+            if var in self._axis and self.ranges[var] != other.ranges[var]:
+                raise ValueError("Value ranges of {} do not match".format(var))
+        variables = self.variables + [var for var in other.variables
+                                      if var not in self._axis]
+        letters = {var: chr(ord('a') + i) for i, var in enumerate(variables)}
+        if len(variables) > 26:
+            raise ValueError("product supports at most 26 variables")
+        spec = "{},{}->{}".format("".join(letters[v] for v in self.variables),
+                                  "".join(letters[v] for v in other.variables),
+                                  "".join(letters[v] for v in variables))
+        table = np.einsum(spec, self.table, other.table)
+        valranges = dict(other.ranges)
+        valranges.update(self.ranges)
+        return ArrayDistribution(variables, table, valranges, normalize=normalize)
+
+    def to_df(self):
+        import pandas as pd
+        idx = np.indices(self.table.shape).reshape(len(self.variables), -1)
+        columns = {var: np.asarray(self.ranges[var], dtype=object)[idx[k]]
+                   for k, var in enumerate(self.variables)}
+        columns["prob"] = self.table.ravel()
+        return pd.DataFrame(columns, columns=self.variables + ["prob"])
+
+    def __str__(self):
+        """Use prettytable to create a table"""
+        t = PrettyTable(self.variables + ["Pr"])
+        for idx in np.ndindex(*self.table.shape):
+            row = [self.ranges[var][i] for var, i in zip(self.variables, idx)]
+            t.add_row(row + [self.table[idx]])
+        return str(t)
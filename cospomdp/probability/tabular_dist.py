@@ -20,7 +20,6 @@ of the variables.
 """
 
 from pomdp_py import Histogram
-import pandas as pd
 import random
 from prettytable import PrettyTable
 from .dist import JointDist
@@ -258,6 +257,7 @@ class TabularDistribution(Histogram, JointDist):
         return TabularDistribution(remain_variables, remain_weights, condition=observation)
 
     def to_df(self):
+        import pandas as pd
         rows = []
         for event in self.probs:
             row = []
@@ -12,9 +12,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import thortils.utils.colors as colors
-import thortils.utils.images as images
-import thortils.utils.keys as keys
+import importlib
+
+# These modules come from thortils, whose import pulls in ai2thor. They
+# are loaded at first access (PEP 562) so that `import cospomdp` stays fast.
+_THORTILS_MODULES = {"colors": "thortils.utils.colors",
+                     "images": "thortils.utils.images",
+                     "keys": "thortils.utils.keys"}
+
+def __getattr__(name):
+    if name in _THORTILS_MODULES:
+        module = importlib.import_module(_THORTILS_MODULES[name])
+        globals()[name] = module
+        return module
+    raise AttributeError("module {} has no attribute {}".format(__name__, name))
 
 class cfg:
     DEBUG_LEVEL = 0
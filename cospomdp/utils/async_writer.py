@@ -0,0 +1,98 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import queue
+import threading
+
+DROP_NEWEST = "drop-newest"
+DROP_OLDEST = "drop-oldest"
+BLOCK = "block"
+
+
+class AsyncWriter:
+    """Runs jobs (e.g. encoding and saving images) in a background
+    thread, in the order they are submitted, so that the caller does
+    not wait for disk I/O.
+
+    At most `max_queue` jobs wait in the queue. If it is full, submit()
+    follows `policy`:
+
+        'drop-newest': the submitted job is dropped
+        'drop-oldest': the oldest waiting job is dropped to make room
+        'block':       waits until there is room (never drops)
+
+    Usage:
+
+        writer = AsyncWriter(max_queue=64)
+        writer.submit(saveimg, img, path)
+        ...
+        writer.close()   # waits for the submitted jobs to finish
+    """
+    def __init__(self, max_queue=64, policy=DROP_NEWEST):
+        if policy not in {DROP_NEWEST, DROP_OLDEST, BLOCK}:
+            raise ValueError("Unknown drop policy {}".format(policy))
+        self.policy = policy
+        self.dropped = 0   # number of jobs dropped
+        self.errors = []   # exceptions raised by jobs
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._closed = False
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            func, args, kwargs = job
+            try:
+                func(*args, **kwargs)
+            except Exception as ex:
+                self.errors.append(ex)
+                print("AsyncWriter: job {} failed: {}".format(getattr(func, "__name__", func), ex))
+
+    def submit(self, func, *args, **kwargs):
+        """Queues func(*args, **kwargs). Returns False if the job is dropped."""
+        if self._closed:
+            raise ValueError("Cannot submit to a closed AsyncWriter")
+        job = (func, args, kwargs)
+        if self.policy == BLOCK:
+            self._queue.put(job)
+            return True
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except queue.Full:
+            if self.policy == DROP_NEWEST:
+                self.dropped += 1
+                return False
+            # DROP_OLDEST
+            try:
+                self._queue.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+            return self.submit(func, *args, **kwargs)
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def close(self):
+        """Waits for the submitted jobs to finish and stops the thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
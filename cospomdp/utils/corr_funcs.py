@@ -63,6 +63,13 @@ class ConditionalSpatialCorrelation:
             else:
                 return "correct"
 
+    def cache_key(self):
+        """Everything that determines the output of `func`; used to
+        detect stale correlation caches (see corr_content_hash)."""
+        return (tuple(self.target), tuple(self.other),
+                [float(d) for d in self._distances],
+                float(self._nearby_thres), self._reverse, self._learned)
+
     def should_be_close(self):
         if not self._reverse:
             return self._mean_dist < self._nearby_thres
@@ -19,8 +19,8 @@ import random
 from abc import ABC, abstractmethod
 from collections.abc import Iterable
 import copy
+import heapq
 from collections import deque
-import networkx as nx
 
 ########################################
 #  Node
@@ -394,32 +394,52 @@ class Graph(EdgeNodeSet):
         """
         Returns the path from src to dst (node ids), using Dijkstra's Algorithm.
         weight is a function that takes in an edge and outputs a weight number.
+        The path is a list of edge ids, or None if dst is not reachable.
         """
-        V = {nid for nid in self.nodes}
-        S = set()
-        d = {v:float("inf")
-             for v in V
-             if v != src}
-        d[src] = 0
+        _, prev = self.shortest_path_tree(src, weight, dst=dst)
+        return Graph.path_from_tree(prev, dst)
+
+    def shortest_path_tree(self, src, weight, dst=None):
+        """
+        Runs Dijkstra's Algorithm (with a binary heap) from src.
+        If dst is given, stops once dst is reached.
+
+        Returns:
+            (d, prev): d maps from node id to its distance from src;
+                prev maps from a reached node id to (previous node id, edge id)
+                on the shortest path from src, or None for src itself.
+        """
+        d = {src: 0}
         prev = {src: None}
-        while len(S) < len(V):
-            diff_set = V - S
-            v = min(diff_set, key=lambda v: d[v])
-            S.add(v)
+        done = set()
+        counter = 0  # tie breaker; node ids may not be comparable
+        heap = [(0, counter, src)]
+        while len(heap) > 0:
+            dv, _, v = heapq.heappop(heap)
+            if v in done:
+                continue
+            done.add(v)
+            if v == dst:
+                break
             for eid in self.edges_from(v):
                 edge = self.edges[eid]
                 w = edge.other(v).id
                 cost = weight(edge)
-                if d[v] + cost < d[w]:
-                    d[w] = d[v] + cost
+                if dv + cost < d.get(w, float("inf")):
+                    d[w] = dv + cost
                     prev[w] = (v, eid)
-
-        # Return a path
-        path = []
+                    counter += 1
+                    heapq.heappush(heap, (d[w], counter, w))
+        return d, prev
+
+    @staticmethod
+    def path_from_tree(prev, dst):
+        """Given `prev` from shortest_path_tree, returns the
+        list of edge ids from the source to dst, or None."""
         if dst not in prev:
             # Path not found
             return None
-
+        path = []
         pair = prev[dst]
         while pair is not None:
             v, eid = pair
@@ -619,6 +639,7 @@ class Graph(EdgeNodeSet):
 
     #--- Conversion ---#
     def to_nx_graph(self):
+        import networkx as nx
         if self._directed:
             G = nx.MultiDiGraph()
         else:
@@ -1185,11 +1206,8 @@ __all__ = [
 
 
 ################# Plotting ##################
-import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
-import matplotlib.lines as lines
-import matplotlib.patheffects as path_effects
-import sklearn.metrics
+# matplotlib and sklearn are imported within the functions that use them;
+# they are slow to import and not needed by the graph code above.
 
 
 def transform_coordinates(gx, gy, map_spec, img):
@@ -1204,6 +1222,8 @@ def transform_coordinates(gx, gy, map_spec, img):
     return ((gx - originX) / res, imgHeight - (gy - originY) / res)
 
 def plot_dot(ax, px, py, color='blue', dotsize=2, fill=True, zorder=0, linewidth=0, edgecolor=None, label_text=None, alpha=1.0):
+    import matplotlib.pyplot as plt
+    import matplotlib.patheffects as path_effects
     very_center = plt.Circle((px, py), dotsize, facecolor=color, fill=fill, zorder=zorder, linewidth=linewidth, edgecolor=edgecolor, alpha=alpha)
     ax.add_artist(very_center)
     if label_text:
@@ -1219,6 +1239,8 @@ def plot_dot(ax, px, py, color='blue', dotsize=2, fill=True, zorder=0, linewidth
 def plot_line(ax, p1, p2, linewidth=1, color='black', zorder=0, alpha=1.0):
     p1x, p1y = p1
     p2x, p2y = p2
+    import matplotlib.pyplot as plt
+    import matplotlib.lines as lines
     ax = plt.gca()
     line = lines.Line2D([p1x, p2x], [p1y, p2y], linewidth=linewidth, color=color, zorder=zorder,
                         alpha=alpha)
@@ -1249,6 +1271,7 @@ def plot_to_file(*args, labels=[], path="plot.png", xlabel=None, ylabel=None):
     Plot data in *args to a file specified by path. If
     path is None, just save to plot.png locally.
     """
+    import matplotlib.pyplot as plt
     for i, data in enumerate(args):
         if i < len(labels):
             plt.plot(data, label=labels[i])
@@ -1265,6 +1288,8 @@ def plot_to_file(*args, labels=[], path="plot.png", xlabel=None, ylabel=None):
 
 def plot_roc(roc_data, savepath='roc.png', names=[]):
     """roc_data is list of tuples (fpr, tpr)"""
+    import matplotlib.pyplot as plt
+    import sklearn.metrics
     from pylab import rcParams
     rcParams['figure.figsize'] = 4, 4
     for i, item in enumerate(roc_data):
@@ -15,12 +15,45 @@
 import numpy as np
 import random
 import math
-from scipy.spatial.transform import Rotation as scipyR
-import scipy.stats as stats
-import math
-import scipy.stats
-import pandas as pd
-from thortils.utils.math import *
+import importlib
+
+# The geometry functions below live in thortils.utils.math. Importing thortils
+# pulls in ai2thor (and with it flask, botocore etc.), so these are forwarded
+# to thortils on their first call instead of being imported here. Any other
+# name of thortils.utils.math is still reachable as an attribute of this
+# module through __getattr__.
+_THORTILS_MATH = "thortils.utils.math"
+
+def _thortils_math_func(name):
+    func = None
+    def _forward(*args, **kwargs):
+        nonlocal func
+        if func is None:
+            func = getattr(importlib.import_module(_THORTILS_MATH), name)
+        return func(*args, **kwargs)
+    _forward.__name__ = name
+    _forward.__qualname__ = name
+    _forward.__doc__ = "Forwards to {}.{}".format(_THORTILS_MATH, name)
+    return _forward
+
+to_rad = _thortils_math_func("to_rad")
+to_deg = _thortils_math_func("to_deg")
+R2d = _thortils_math_func("R2d")
+R_y = _thortils_math_func("R_y")
+R_quat = _thortils_math_func("R_quat")
+R_euler = _thortils_math_func("R_euler")
+T = _thortils_math_func("T")
+vec = _thortils_math_func("vec")
+pol2cart = _thortils_math_func("pol2cart")
+closest = _thortils_math_func("closest")
+in_range_inclusive = _thortils_math_func("in_range_inclusive")
+
+def __getattr__(name):
+    if name.startswith("__"):
+        raise AttributeError("module {} has no attribute {}".format(__name__, name))
+    value = getattr(importlib.import_module(_THORTILS_MATH), name)
+    globals()[name] = value
+    return value
 
 def indicator(cond, epsilon=0.0):
     return 1.0 - epsilon if cond else epsilon
@@ -156,6 +189,7 @@ def inverse_law_of_cos(a, b, c):
 ## Statistics
 # confidence interval
 def ci_normal(series, confidence_interval=0.95):
+    from scipy import stats
     series = np.asarray(series)
     tscore = stats.t.ppf((1 + confidence_interval)/2.0, df=len(series)-1)
     y_error = stats.sem(series)
@@ -175,6 +209,7 @@ def mean_ci_normal(series, confidence_interval=0.95):
     the interval. However, if the 95% CI excludes the null value, then the null
     hypothesis has been rejected, and the p-value must be < 0.05.
     """
+    import scipy.stats
     series = np.asarray(series)
     # this is the "percentage point function" which is the inverse of a cdf
     # divide by 2 because we are making a two-tailed claim
@@ -236,10 +271,12 @@ def perplexity(p, base=2):
     Parameters:
         p: A sequence of probabilities
     """
+    import scipy.stats
     H = scipy.stats.entropy(p, base=base)
     return base**H
 
 def kl_divergence(p, q, base=2):
+    import scipy.stats
     return scipy.stats.entropy(p, q, base=base)
 
 def normal_pdf_2d(point, variance, domain, normalize=True):
@@ -248,6 +285,7 @@ def normal_pdf_2d(point, variance, domain, normalize=True):
     such that the probability distribution is a 2d gaussian with mean
     at the given point and given variance.
     """
+    import scipy.stats
     dist = {}
     total_prob = 0.0
     for val in domain:
@@ -301,6 +339,7 @@ def entropy(p, base=2):
     Parameters:
         p: A sequence of probabilities
     """
+    import scipy.stats
     return scipy.stats.entropy(p, base=base)
 
 def euclidean_dist(p1, p2):
@@ -340,6 +379,7 @@ def tind_test(sample1, sample2):
     Returns:
         (tstatistic, pvalue)
     """
+    from scipy import stats
     res = stats.ttest_ind(a=sample1, b=sample2, equal_var=True)
     return res.statistic, res.pvalue
 
@@ -380,6 +420,7 @@ def wilcoxon_test(sample1, sample2):
     result. The cost of this applicability is that it has less statistical power
     than Student's t-test when the data are normally distributed.
     """
+    from scipy import stats
     def _all_zeros(sample):
         return all([abs(s) <= 1e-12 for s in sample])
     if _all_zeros(sample1) and _all_zeros(sample2):
@@ -403,6 +444,7 @@ def test_significance_pairwise(results, sigstr=False, method="t_ind"):
         pd.DataFrame: (X, Y) entry will be the statistical significance between
             method X and method Y.
     """
+    import pandas as pd
     method_names = list(results.keys())
     rows = []
     for meth1 in method_names:
@@ -0,0 +1,51 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+class PointIndex:
+    """
+    Nearest neighbor queries over a fixed set of points (e.g. grid
+    locations), backed by a KD-tree; Each query is O(log n) instead of
+    a linear min over all points. When several points are equally close,
+    any one of them may be returned.
+    """
+    def __init__(self, points):
+        """
+        points (list of tuples): points of the same dimension; must not be empty.
+        """
+        self.points = [tuple(p) for p in points]
+        if len(self.points) == 0:
+            raise ValueError("PointIndex requires at least one point")
+        self._tree = cKDTree(np.asarray(self.points, dtype=float))
+
+    def __len__(self):
+        return len(self.points)
+
+    def nearest_index(self, point):
+        """Returns the index (into self.points) of the point closest to `point`"""
+        _, i = self._tree.query(np.asarray(point, dtype=float))
+        return int(i)
+
+    def nearest(self, point):
+        """Returns the point closest to `point`"""
+        return self.points[self.nearest_index(point)]
+
+    def nearest_batch(self, points):
+        """Returns a list with the closest point to each of `points`"""
+        if len(points) == 0:
+            return []
+        _, idx = self._tree.query(np.asarray(points, dtype=float))
+        return [self.points[i] for i in idx]
@@ -0,0 +1,86 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+from contextlib import contextmanager
+
+
+class StepTimer:
+    """Records the wall time spent in named phases (e.g. planning,
+    belief_update), separately for every step. Phases may be nested
+    (e.g. goal_handler includes local planning), so the times of
+    different phases in a step do not necessarily add up.
+
+    Usage:
+
+        with timer.timeit("planning"):
+            action = planner.plan(agent)
+        ...
+        step_timings = timer.end_step()   # {"planning": 0.53, ...}
+    """
+    def __init__(self):
+        self.history = []   # list of {phase: seconds}, one per finished step
+        self._current = {}
+
+    @contextmanager
+    def timeit(self, phase):
+        _start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - _start)
+
+    def add(self, phase, seconds):
+        """Adds `seconds` to the time of `phase` in the current step"""
+        self._current[phase] = self._current.get(phase, 0.0) + seconds
+
+    @property
+    def current(self):
+        return self._current
+
+    def end_step(self):
+        """Finishes the current step; Returns its {phase: seconds}"""
+        step_timings = self._current
+        self.history.append(step_timings)
+        self._current = {}
+        return step_timings
+
+    def totals(self):
+        """Returns {phase: total seconds} over all finished steps"""
+        totals = {}
+        for step_timings in self.history:
+            for phase in step_timings:
+                totals[phase] = totals.get(phase, 0.0) + step_timings[phase]
+        return totals
+
+    def scoped(self, prefix):
+        """Returns a timer that records into this one, with phase
+        names prefixed by '{prefix}.'; Useful for a sub-agent
+        (e.g. the local search agent) that records the same phases."""
+        return ScopedStepTimer(self, prefix)
+
+
+class ScopedStepTimer:
+    """See StepTimer.scoped"""
+    def __init__(self, timer, prefix):
+        self._timer = timer
+        self._prefix = prefix
+
+    @contextmanager
+    def timeit(self, phase):
+        with self._timer.timeit("{}.{}".format(self._prefix, phase)):
+            yield
+
+    def add(self, phase, seconds):
+        self._timer.add("{}.{}".format(self._prefix, phase), seconds)
@@ -14,9 +14,11 @@
 
 import random
 import pomdp_py
+import numpy as np
 from cospomdp.utils.math import normalize, euclidean_dist
 from tqdm import tqdm
 from cospomdp.domain.state import CosState
+from cospomdp.models.belief import LogHistogram, SparseHistogram
 
 def initialize_target_belief_2d(target, search_region, belief_type, prior, *args):
     def _prob(prior, loc):
@@ -28,6 +30,10 @@ def initialize_target_belief_2d(target, search_region, belief_type, prior, *args
             search_region.object_state(target_id, target_class, loc): _prob(prior, loc)
             for loc in search_region.locations
         })
+        if belief_type == "histogram-log":
+            return LogHistogram.from_histogram(hist)
+        elif belief_type == "histogram-sparse":
+            return SparseHistogram.from_histogram(hist)
         return pomdp_py.Histogram(hist)
 
     else:
@@ -42,13 +48,60 @@ def update_target_belief_2d(current_btarget,
     """
     current_btarget: current target belief
     srobot: robot state corresponding to the observation.
+    belief_type: 'histogram' (exact), 'histogram-approx',
+        'histogram-vectorized' (exact; uses the observation model's
+        probability_vector instead of looping over target states), or
+        'histogram-log' (exact; a LogHistogram updated by adding the
+        observation log likelihoods, normalized only when queried), or
+        'histogram-sparse' (approximate; a SparseHistogram that prunes the
+        least likely locations, see bu_args below)
+    bu_args: for 'histogram-sparse', 'prune_mass' is the total probability
+        that may be pruned, and 'residual_samples' the number of pruned
+        target states used to estimate the likelihood of the pruned mass.
     """
     random_starget = current_btarget.random()
     Starget_class = random_starget.__class__
     target_id = random_starget.id
     target_class = random_starget.objclass
 
-    if belief_type.startswith("histogram"):
+    if belief_type == "histogram-log":
+        if not isinstance(current_btarget, LogHistogram):
+            current_btarget = LogHistogram.from_histogram(current_btarget)
+        loglik = observation_model.log_probability_vector(
+            observation, current_btarget.values, next_srobot)
+        new_btarget = current_btarget.update(loglik)
+
+    elif belief_type == "histogram-sparse":
+        prune_mass = bu_args.get("prune_mass", SparseHistogram.DEFAULT_PRUNE_MASS)
+        if not isinstance(current_btarget, SparseHistogram):
+            current_btarget = SparseHistogram.from_histogram(current_btarget, prune_mass)
+        # Target states at locations in the observation get their own entry
+        current_btarget = current_btarget.with_support(
+            [Starget_class(target_id, target_class, zi.loc)
+             for zi in observation if zi.loc is not None])
+        pr_z = observation_model.probability_vector(
+            observation, current_btarget.support, next_srobot)
+        pruned_samples = current_btarget.sample_pruned(bu_args.get("residual_samples", 100))
+        pr_z_pruned = 0.0
+        if len(pruned_samples) > 0:
+            pr_z_pruned = float(np.mean(observation_model.probability_vector(
+                observation, pruned_samples, next_srobot)))
+        new_btarget = current_btarget.update(pr_z, pr_z_pruned, prune_mass=prune_mass)
+
+    elif belief_type == "histogram-vectorized":
+        # Exact update; computes the likelihood of the observation for
+        # all target states at once with array operations.
+        assert isinstance(current_btarget, pomdp_py.Histogram)
+        target_states = list(current_btarget.get_histogram().keys())
+        pr_z = observation_model.probability_vector(observation, target_states, next_srobot)
+        prior = np.array([current_btarget[starget] for starget in target_states])
+        posterior = pr_z * prior
+        total = posterior.sum()
+        if total > 0:
+            posterior /= total
+        new_btarget = pomdp_py.Histogram(dict(zip(target_states, posterior.tolist())))
+
+    elif belief_type.startswith("histogram"):
         assert isinstance(current_btarget, pomdp_py.Histogram)
 
         all_target_states = set(current_btarget.get_histogram().keys())
@@ -0,0 +1,305 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Procedurally generated worlds (in the worldstr format of parser.py)
+# for benchmarking the COS-POMDP stack without AI2-THOR.
+#
+# Example:
+#
+#    python -m cospomdp_apps.basic.benchmark --sizes 10 25 50 --nsteps 10
+#    python -m cospomdp_apps.basic.benchmark --sizes 25 --planning-time 1 --num-workers 4
+import time
+import random
+import resource
+import tracemalloc
+import argparse
+import multiprocessing
+import pomdp_py
+from concurrent.futures import ProcessPoolExecutor
+
+from cospomdp.planning import RootParallelPOUCT
+from .basic_env import BasicEnv2D
+from .parser import create_instance
+
+OBJECT_SYMBOLS = "ABCDEFGHIJKLMNOPQSUVWYZ"  # excludes R (robot), T (target), X
+
+
+def generate_worldstr(width, length,
+                      obstacle_density=0.1,
+                      num_objects=2,
+                      corr_types=("around",),
+                      corr_dist=2,
+                      fov=90,
+                      max_range=3,
+                      quality=(0.8, 0.1),
+                      goal_dist=2.0,
+                      seed=None):
+    """Returns a worldstr (see parse_worldstr) for a random
+    `width` x `length` grid world.
+
+    Args:
+        obstacle_density (float): fraction of cells that are obstacles.
+        num_objects (int): number of objects in addition to the target.
+        corr_types (list): correlation types ('around' or 'apart') used
+            between the target and the other objects, in a round-robin way.
+            Objects are placed so that the correlation is true in the world.
+        corr_dist (float): the 'd' argument of the correlation.
+        fov, max_range, quality: detector parameters (fan-nofp), the same for
+            all objects.
+        seed (int): random seed
+    """
+    if num_objects > len(OBJECT_SYMBOLS):
+        raise ValueError("At most {} objects are supported".format(len(OBJECT_SYMBOLS)))
+    rnd = random.Random(seed)
+    cells = [(x, y) for x in range(width) for y in range(length)]
+    num_obstacles = int(round(obstacle_density * len(cells)))
+    obstacles = set(rnd.sample(cells, num_obstacles))
+    free = [c for c in cells if c not in obstacles]
+    if len(free) < num_objects + 2:
+        raise ValueError("Not enough free cells for the robot and objects")
+
+    target_loc = rnd.choice(free)
+    placed = {"T": target_loc}
+    corrs = []
+    for i in range(num_objects):
+        symbol = OBJECT_SYMBOLS[i]
+        corr_type = corr_types[i % len(corr_types)]
+        if corr_type == "around":
+            satisfies = lambda c: (c[0]-target_loc[0])**2 + (c[1]-target_loc[1])**2 <= corr_dist**2
+        elif corr_type == "apart":
+            satisfies = lambda c: (c[0]-target_loc[0])**2 + (c[1]-target_loc[1])**2 >= corr_dist**2
+        else:
+            raise ValueError("Unknown correlation type {}".format(corr_type))
+        candidates = [c for c in free
+                      if c not in placed.values() and satisfies(c)]
+        if len(candidates) == 0:
+            candidates = [c for c in free if c not in placed.values()]
+        placed[symbol] = rnd.choice(candidates)
+        corrs.append("T {} {}: d={}".format(corr_type, symbol, corr_dist))
+    robot_loc = rnd.choice([c for c in free if c not in placed.values()])
+
+    grid = [["." for x in range(width)] for y in range(length)]
+    for x, y in obstacles:
+        grid[y][x] = "x"
+    for symbol, (x, y) in placed.items():
+        grid[y][x] = symbol
+    grid[robot_loc[1]][robot_loc[0]] = "R"
+    # y=0 is the last line in a worldstr
+    maplines = ["".join(row) for row in reversed(grid)]
+
+    detectors = ["{}: fan-nofp | fov={}, min_range=0, max_range={} | {}"\
+                 .format(symbol, fov, max_range, quality)
+                 for symbol in placed]
+    return "\n".join(["### map", *maplines, "",
+                      "### robotconfig", "th: 0", "",
+                      "### corr", *corrs, "",
+                      "### detectors", *detectors, "",
+                      "### goal", "find: T, {}".format(goal_dist), "",
+                      "### END"])
+
+
+def run_benchmark(worldstr, nsteps=10,
+                  solver="pomdp_py.POUCT",
+                  solver_args={},
+                  corr_backend="tabular",
+                  belief_type="histogram",
+                  trace_memory=False):
+    """Runs the same loop as search.solve (without visualization) for
+    `nsteps` steps and returns a dict of timings, in seconds.
+    `solver` is either 'pomdp_py.POUCT' or 'cospomdp.RootParallelPOUCT'.
+    The result contains:
+
+        setup: building the CosAgent (incl. correlation distributions)
+        planning, transition, observation_sampling, belief_update, tree_update:
+            the total time of each phase over all steps.
+
+    It also contains 'steps' (number of steps actually run), 'num_sims'
+    (total number of POUCT simulations), 'peak_rss_mb' (peak resident memory
+    of the process so far; it never goes down, so it only describes this run
+    if the run has its own process, see run_suite) and, if `trace_memory`
+    is True, 'peak_traced_mb',
+    the peak memory allocated by python during this run (tracemalloc slows
+    everything down, so the timings are then less meaningful)."""
+    if trace_memory:
+        tracemalloc.start()
+
+    _start = time.time()
+    agent, objlocs = create_instance(worldstr,
+                                     corr_backend=corr_backend,
+                                     belief_type=belief_type)[:2]
+    timings = {"setup": time.time() - _start,
+               "planning": 0.0,
+               "transition": 0.0,
+               "observation_sampling": 0.0,
+               "belief_update": 0.0,
+               "tree_update": 0.0}
+
+    if solver == "pomdp_py.POUCT":
+        planner = pomdp_py.POUCT(**solver_args,
+                                 rollout_policy=agent.policy_model)
+    elif solver == "cospomdp.RootParallelPOUCT":
+        planner = RootParallelPOUCT(**solver_args,
+                                    rollout_policy=agent.policy_model)
+    else:
+        raise ValueError("Unsupported solver {}".format(solver))
+    env = BasicEnv2D(agent.belief.mpe().s(agent.robot_id),
+                     objlocs,
+                     agent.target_id,
+                     agent.transition_model.robot_trans_model.reachable_positions,
+                     agent.reward_model)
+
+    num_sims = 0
+    step = 0
+    for step in range(1, nsteps+1):
+        _start = time.time()
+        action = planner.plan(agent)
+        timings["planning"] += time.time() - _start
+        num_sims += planner.last_num_sims
+
+        _start = time.time()
+        env.state_transition(action, execute=True)
+        timings["transition"] += time.time() - _start
+
+        _start = time.time()
+        observation = env.provide_observation(agent.observation_model, action)
+        timings["observation_sampling"] += time.time() - _start
+
+        _start = time.time()
+        agent.update(action, observation)
+        timings["belief_update"] += time.time() - _start
+
+        _start = time.time()
+        planner.update(agent, action, observation)
+        timings["tree_update"] += time.time() - _start
+
+        if action.name == "done":
+            break
+    if isinstance(planner, RootParallelPOUCT):
+        planner.close()
+
+    result = dict(timings,
+                  steps=step,
+                  num_sims=num_sims,
+                  peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["peak_traced_mb"] = peak / 1024**2
+    return result
+
+
+def run_suite(sizes=(10, 25, 50, 100),
+              nsteps=10,
+              obstacle_density=0.1,
+              num_objects=2,
+              corr_types=("around",),
+              solver="pomdp_py.POUCT",
+              solver_args={},
+              corr_backend="tabular",
+              belief_type="histogram",
+              trace_memory=False,
+              seed=100,
+              isolate=True):
+    """Runs `run_benchmark` on square worlds of the given `sizes`.
+    Returns a list of dicts, one per world size, each containing
+    the world parameters as well as the result of run_benchmark.
+
+    If `isolate` is True, each world runs in a fresh process, so that
+    'peak_rss_mb' is the peak memory of that world alone, rather than
+    the peak of all worlds run so far."""
+    rows = []
+    for size in sizes:
+        worldstr = generate_worldstr(size, size,
+                                     obstacle_density=obstacle_density,
+                                     num_objects=num_objects,
+                                     corr_types=corr_types,
+                                     seed=seed)
+        kwargs = dict(nsteps=nsteps,
+                      solver=solver,
+                      solver_args=solver_args,
+                      corr_backend=corr_backend,
+                      belief_type=belief_type,
+                      trace_memory=trace_memory)
+        if isolate:
+            with ProcessPoolExecutor(max_workers=1,
+                                     mp_context=multiprocessing.get_context("spawn")) as executor:
+                result = executor.submit(run_benchmark, worldstr, **kwargs).result()
+        else:
+            result = run_benchmark(worldstr, **kwargs)
+        row = dict(size=size,
+                   obstacle_density=obstacle_density,
+                   num_objects=num_objects,
+                   corr_types=",".join(corr_types),
+                   solver=solver,
+                   corr_backend=corr_backend,
+                   belief_type=belief_type,
+                   **result)
+        print(_format_row(row))
+        rows.append(row)
+    return rows
+
+
+def _format_row(row):
+    return ("size={size:<4d} steps={steps:<3d} num_sims={num_sims:<6d} setup={setup:.3f}s planning={planning:.3f}s "
+            "transition={transition:.3f}s obz_sampling={observation_sampling:.3f}s "
+            "belief_update={belief_update:.3f}s tree_update={tree_update:.3f}s "
+            "peak_rss={peak_rss_mb:.1f}MB".format(**row))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark COS-POMDP on generated 2D worlds")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 25, 50, 100])
+    parser.add_argument("--nsteps", type=int, default=10)
+    parser.add_argument("--obstacle-density", type=float, default=0.1)
+    parser.add_argument("--num-objects", type=int, default=2)
+    parser.add_argument("--corr-types", type=str, nargs="+", default=["around"])
+    parser.add_argument("--corr-backend", type=str, default="sparse",
+                        choices=["tabular", "dense", "sparse"],
+                        help="tabular is very slow to set up beyond ~25x25; dense needs"
+                        " O(size^4) memory, too much for 100x100")
+    parser.add_argument("--belief-type", type=str, default="histogram-vectorized",
+                        help="see update_target_belief_2d in cospomdp_apps.basic.belief;"
+                        " histogram (non-vectorized) is slow beyond ~25x25")
+    parser.add_argument("--num-sims", type=int, default=200)
+    parser.add_argument("--planning-time", type=float, default=None,
+                        help="if given, plan for this many seconds per step instead of --num-sims")
+    parser.add_argument("--num-workers", type=int, default=1,
+                        help="if > 1, plan with RootParallelPOUCT using this many trees")
+    parser.add_argument("--trace-memory", action="store_true")
+    parser.add_argument("--seed", type=int, default=100)
+    args = parser.parse_args()
+
+    solver_args = dict(max_depth=15,
+                       discount_factor=0.95,
+                       exploration_const=100)
+    if args.planning_time is not None:
+        solver_args["planning_time"] = args.planning_time
+    else:
+        solver_args["num_sims"] = args.num_sims
+    solver = "pomdp_py.POUCT"
+    if args.num_workers > 1:
+        solver = "cospomdp.RootParallelPOUCT"
+        solver_args["num_workers"] = args.num_workers
+
+    run_suite(sizes=args.sizes,
+              nsteps=args.nsteps,
+              obstacle_density=args.obstacle_density,
+              num_objects=args.num_objects,
+              corr_types=args.corr_types,
+              solver=solver,
+              solver_args=solver_args,
+              corr_backend=args.corr_backend,
+              belief_type=args.belief_type,
+              trace_memory=args.trace_memory,
+              seed=args.seed)
@@ -96,11 +96,16 @@ def parse_worldstr(worldstr):
         raise ValueError("worldstr syntax error: does not contain '### END'")
     return sofar
 
-def create_instance(worldstr):
+def create_instance(worldstr, corr_backend="tabular", belief_type="histogram"):
     """Given worldstr (see parse_worldstr for format), parse it
     and then construct a CosAgent accordingly with uniform prior,
     then return that agent.
 
+    Args:
+        corr_backend (str): backend of the CorrelationDists
+            (tabular, dense or sparse); see CorrelationDist.
+        belief_type (str): belief representation of the CosAgent.
+
     Returns: CosAgent, {objid: (x,y)}"""
     spec = parse_worldstr(worldstr)
 
@@ -134,7 +139,8 @@ def create_instance(worldstr):
                                                 objects[target_id],
                                                 search_region,
                                                 corr_func,
-                                                corr_func_args=corr_func_args)
+                                                corr_func_args=corr_func_args,
+                                                backend=corr_backend)
     detectors = spec["detectors"]
     reward_model = spec["reward_model"]
     init_robot_state = RobotState2D(robot_id, init_robot_pose)
@@ -149,7 +155,8 @@ def create_instance(worldstr):
                      detectors,
                      reward_model,
                      initialize_target_belief_2d,
-                     update_target_belief_2d)
+                     update_target_belief_2d,
+                     belief_type=belief_type)
     if "colors" in spec:
         return agent, spec['objectlocs'], spec["colors"]
     else:
@@ -15,6 +15,7 @@
 # This is a toy domain for 2D COS-POMDP
 import pomdp_py
 from cospomdp.models.reward_model import ObjectSearchRewardModel
+from cospomdp.planning import RootParallelPOUCT
 from .visual import BasicViz2D
 from .basic_env import BasicEnv2D
 from .parser import create_instance
@@ -25,6 +26,9 @@ def solve(worldstr, nsteps=50, solver="pomdp_py.POUCT", solver_args={}):
     if solver == "pomdp_py.POUCT":
         planner = pomdp_py.POUCT(**solver_args,
                                  rollout_policy=agent.policy_model)
+    elif solver == "cospomdp.RootParallelPOUCT":
+        planner = RootParallelPOUCT(**solver_args,
+                                    rollout_policy=agent.policy_model)
 
     env = BasicEnv2D(agent.belief.mpe().s(agent.robot_id),
                      objlocs,
@@ -44,7 +48,7 @@ def solve(worldstr, nsteps=50, solver="pomdp_py.POUCT", solver_args={}):
         observation, reward = env.execute(action, agent.observation_model)
 
         planner_info = ""
-        if isinstance(planner, pomdp_py.POUCT):
+        if isinstance(planner, (pomdp_py.POUCT, RootParallelPOUCT)):
             planner_info += "   NumSims: %d" % planner.last_num_sims
             planner_info += "   PlanTime: %.5f" % planner.last_planning_time
             pomdp_py.utils.TreeDebugger(agent.tree).mbp
@@ -56,6 +60,8 @@ def solve(worldstr, nsteps=50, solver="pomdp_py.POUCT", solver_args={}):
                       draw_belief=is_search_task)
         if action.name == "done":
             break
+    if isinstance(planner, RootParallelPOUCT):
+        planner.close()
 
 
 WORLD =\
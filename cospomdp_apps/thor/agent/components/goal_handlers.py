@@ -244,6 +244,37 @@ class LocalSearchHandler(GoalHandler):
     def cos_agent(self):
         return self._local_cos_agent
 
+    def _build_local_cos_agent(self, agent, local_robot_state, prior):
+        """Constructs the CosAgent used for local search."""
+        raise NotImplementedError
+
+    def _new_local_cos_agent(self, agent, local_robot_state, prior):
+        cos_agent = self._build_local_cos_agent(agent, local_robot_state, prior)
+        if hasattr(agent, "timer"):
+            # times of the local agent are recorded as e.g. 'local.planning'
+            cos_agent.timer = agent.timer.scoped("local")
+        return cos_agent
+
+    def _reuse_local_cos_agent(self, agent, local_robot_state, prior):
+        """Returns the local CosAgent kept by `agent` for this kind of
+        local search, with its belief reset to `prior` and `local_robot_state`.
+        The CosAgent is only built the first time; after that, its
+        observation model (and the correlation marginals in it) and other
+        pose-independent models are shared across Stay goals.
+
+        Args:
+            agent (ThorObjectSearchCompleteCosAgent)
+        """
+        local_agents = getattr(agent, "local_cos_agents", None)
+        if local_agents is None:
+            return self._new_local_cos_agent(agent, local_robot_state, prior)
+        key = self.__class__.__name__
+        if key not in local_agents:
+            local_agents[key] = self._new_local_cos_agent(agent, local_robot_state, prior)
+        else:
+            local_agents[key].reset_belief(local_robot_state, prior=prior)
+        return local_agents[key]
+
     @property
     def detectable_objects(self):
         return self.cos_agent.detectable_objects
@@ -274,38 +305,41 @@ class LocalSearchBasicHandler(LocalSearchHandler, ThorObjectSearchBasicCosAgent)
         self.target_id = agent.robot_id
 
         self.search_region = agent.search_region
-        reachable_positions = agent.reachable_positions
 
         movement_params = agent.task_config["nav_config"]["movement_params"]
         self.navigation_actions = grid_navigation_actions2d(movement_params,
                                                        agent.grid_map.grid_size)
-        robot_trans_model = basic.RobotTransition2D(self.robot_id, reachable_positions)
-        reward_model = agent.cos_agent.reward_model # the reward model is the same
-        policy_model = basic.PolicyModel2D(robot_trans_model, reward_model,
-                                           movements=self.navigation_actions)
-
         _btarget = agent.belief.b(self.target_id)
         prior = {s.loc : _btarget[s] for s in _btarget}
-        self._local_cos_agent = cospomdp.CosAgent(agent.target,
-                                                  local_robot_state,
-                                                  self.search_region,
-                                                  robot_trans_model,
-                                                  policy_model,
-                                                  agent.corr_dists,
-                                                  agent.detectors,
-                                                  reward_model,
-                                                  initialize_target_belief_2d,
-                                                  update_target_belief_2d,
-                                                  prior=prior)
+        self._local_cos_agent = self._reuse_local_cos_agent(agent, local_robot_state, prior)
         pouct_params = params.get("pouct", params)  # backwards compatibliity
         self.solver = pomdp_py.POUCT(**pouct_params,
                                      rollout_policy=self._local_cos_agent.policy_model)
         self._done = False
 
 
+    def _build_local_cos_agent(self, agent, local_robot_state, prior):
+        reachable_positions = agent.reachable_positions
+        robot_trans_model = basic.RobotTransition2D(self.robot_id, reachable_positions)
+        reward_model = agent.cos_agent.reward_model # the reward model is the same
+        policy_model = basic.PolicyModel2D(robot_trans_model, reward_model,
+                                           movements=self.navigation_actions)
+        return cospomdp.CosAgent(agent.target,
+                                 local_robot_state,
+                                 self.search_region,
+                                 robot_trans_model,
+                                 policy_model,
+                                 agent.corr_dists,
+                                 agent.detectors,
+                                 reward_model,
+                                 initialize_target_belief_2d,
+                                 update_target_belief_2d,
+                                 prior=prior)
+
     def step(self):
         print("Planning locally")
-        action = self.solver.plan(self._local_cos_agent)
+        with self._local_cos_agent.timer.timeit("planning"):
+            action = self.solver.plan(self._local_cos_agent)
         #### DEBUGGING TREE #####
         dd = pomdp_py.TreeDebugger(self._local_cos_agent.tree)
         print(dd)
@@ -325,7 +359,8 @@ class LocalSearchBasicHandler(LocalSearchHandler, ThorObjectSearchBasicCosAgent)
         # interpret low level action
         action = self.interpret_action(tos_action)
         observation = self.interpret_observation(tos_observation)
-        self.solver.update(self._local_cos_agent, action, observation)
+        with self._local_cos_agent.timer.timeit("tree_update"):
+            self.solver.update(self._local_cos_agent, action, observation)
 
         self._local_cos_agent.set_belief(self._parent.belief)
         self._done = tos_action.name.lower() == "done"
@@ -359,42 +394,46 @@ class LocalSearch3DHandler(LocalSearchBasicHandler, ThorObjectSearchBasicCosAgen
         self.target_id = agent.target_id
 
         self.search_region = agent.search_region
-        reachable_positions = agent.reachable_positions
 
         movement_params = agent.task_config["nav_config"]["movement_params"]
         self.navigation_actions = grid_navigation_actions(movement_params,
                                                           agent.grid_map.grid_size)
         self.camera_look_actions = grid_camera_look_actions(movement_params)
-        v_angles = [grid_pitch(va) for va in agent.task_config['nav_config']['v_angles']]
-        robot_trans_model = RobotTransition3D(self.robot_id, reachable_positions, v_angles)
-        reward_model = agent.cos_agent.reward_model
-        policy_model = PolicyModel3D(robot_trans_model, reward_model,
-                                     movements=self.navigation_actions,
-                                     camera_looks=self.camera_look_actions)
-
         _btarget = agent.belief.b(self.target_id)
         prior_loc = {s.loc: _btarget.loc_belief[s] for s in _btarget}
         prior_height = _btarget.height_belief
-        self._local_cos_agent = cospomdp.CosAgent(agent.target,
-                                                  local_robot_state,
-                                                  self.search_region,
-                                                  robot_trans_model,
-                                                  policy_model,
-                                                  agent.corr_dists,
-                                                  agent.detectors,
-                                                  reward_model,
-                                                  initialize_target_belief_3d,
-                                                  update_target_belief_3d,
-                                                  prior=(prior_loc, prior_height),
-                                                  binit_args={"grid_size": agent.grid_map.grid_size})
+        self._local_cos_agent = self._reuse_local_cos_agent(agent, local_robot_state,
+                                                            (prior_loc, prior_height))
         pouct_params = params.get("pouct", params)  # backwards compatibility
         self.solver = pomdp_py.POUCT(**pouct_params,
                                      rollout_policy=self._local_cos_agent.policy_model)
         self._done = False
 
+    def _build_local_cos_agent(self, agent, local_robot_state, prior):
+        reachable_positions = agent.reachable_positions
+        v_angles = [grid_pitch(va) for va in agent.task_config['nav_config']['v_angles']]
+        robot_trans_model = RobotTransition3D(self.robot_id, reachable_positions, v_angles)
+        reward_model = agent.cos_agent.reward_model
+        policy_model = PolicyModel3D(robot_trans_model, reward_model,
+                                     movements=self.navigation_actions,
+                                     camera_looks=self.camera_look_actions)
+        return cospomdp.CosAgent(agent.target,
+                                 local_robot_state,
+                                 self.search_region,
+                                 robot_trans_model,
+                                 policy_model,
+                                 agent.corr_dists,
+                                 agent.detectors,
+                                 reward_model,
+                                 initialize_target_belief_3d,
+                                 update_target_belief_3d,
+                                 prior=prior,
+                                 binit_args={"grid_size": agent.grid_map.grid_size})
+
     def step(self):
         print("Planning locally")
-        action = self.solver.plan(self._local_cos_agent)
+        with self._local_cos_agent.timer.timeit("planning"):
+            action = self.solver.plan(self._local_cos_agent)
         #### DEBUGGING TREE #####
         dd = pomdp_py.TreeDebugger(self._local_cos_agent.tree)
         print(dd)
@@ -414,7 +453,8 @@ class LocalSearch3DHandler(LocalSearchBasicHandler, ThorObjectSearchBasicCosAgen
         # interpret low level action
         action = self.interpret_action(tos_action)
         observation = self.interpret_observation(tos_observation)
-        self.solver.update(self._local_cos_agent, action, observation)
+        with self._local_cos_agent.timer.timeit("tree_update"):
+            self.solver.update(self._local_cos_agent, action, observation)
 
         self._local_cos_agent.set_belief(self._parent.belief)
         self._done = tos_action.name.lower() == "done"
@@ -0,0 +1,110 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import deque, OrderedDict
+from cospomdp.utils.spatial import PointIndex
+
+def grid_neighbors(x, y):
+    """4-connected neighbors of a grid cell"""
+    return [(x+1, y), (x-1,y),
+            (x,y+1), (x,y-1)]
+
+
+class NavGrid:
+    """
+    Answers shortest path queries on the grid of reachable positions
+    (4-connected, no edge weight). The adjacency of reachable positions
+    is built once; the BFS tree rooted at a source is computed the first
+    time that source is queried, and kept in an LRU cache, so that repeated
+    queries from the same source (e.g. from a topo node, or from the robot's
+    position to many viewpoints) do not redo the search.
+    """
+    def __init__(self, reachable_positions, max_cached_sources=256):
+        """
+        reachable_positions (list or set of tuples): grid locations the robot can be at.
+        max_cached_sources (int): maximum number of BFS trees kept in memory.
+        """
+        self.reachable_positions = set(reachable_positions)
+        self.max_cached_sources = max_cached_sources
+        self._adj = {pos: self._compute_neighbors(pos)
+                     for pos in self.reachable_positions}
+        self._trees = OrderedDict()  # maps from source to {loc: previous loc}
+        self._index = None
+
+    @property
+    def position_index(self):
+        """PointIndex over the reachable positions"""
+        if self._index is None:
+            self._index = PointIndex(self.reachable_positions)
+        return self._index
+
+    def closest_reachable(self, loc):
+        """Returns the reachable position closest to `loc`"""
+        return self.position_index.nearest(loc)
+
+    def _compute_neighbors(self, loc):
+        return [nb_loc for nb_loc in grid_neighbors(*loc)
+                if nb_loc in self.reachable_positions]
+
+    def neighbors(self, loc):
+        if loc in self._adj:
+            return self._adj[loc]
+        else:
+            # e.g. the source is not a reachable position
+            return self._compute_neighbors(loc)
+
+    def bfs_tree(self, src):
+        """Returns a dict that maps from every location reachable
+        from src to its previous location on a shortest path from src
+        (None for src)."""
+        if src in self._trees:
+            self._trees.move_to_end(src)
+            return self._trees[src]
+
+        prev = {src: None}
+        q = deque()
+        q.append(src)
+        while len(q) > 0:
+            loc = q.popleft()
+            for nb_loc in self.neighbors(loc):
+                if nb_loc not in prev:
+                    prev[nb_loc] = loc
+                    q.append(nb_loc)
+        self._trees[src] = prev
+        if len(self._trees) > self.max_cached_sources:
+            self._trees.popitem(last=False)
+        return prev
+
+    def shortest_path(self, src, dst):
+        """
+        Returns the shortest path between src and dst as a list of locations
+        that begins at dst and ends at src; None if dst is not reachable.
+        """
+        prev = self.bfs_tree(src)
+        if dst not in prev:
+            return None
+        path = [dst]
+        v = dst
+        while v != src:
+            v = prev[v]
+            path.append(v)
+        return path
+
+    def distance(self, src, dst):
+        """Number of steps on the shortest path from src to dst;
+        float('inf') if not reachable"""
+        path = self.shortest_path(src, dst)
+        if path is None:
+            return float("inf")
+        return len(path) - 1
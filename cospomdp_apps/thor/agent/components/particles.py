@@ -0,0 +1,107 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pomdp_py
+from cospomdp.domain.state import ObjectState
+from cospomdp.utils.math import euclidean_dist
+
+
+def systematic_resample(weights, num_samples, rng=np.random):
+    """Systematic resampling. Returns an array of `num_samples` indices
+    into `weights` (which need not be normalized); index i appears
+    either floor or ceil of num_samples * w_i times.
+    rng (np.random.RandomState): source of randomness; the global
+        numpy random state by default."""
+    cumsum = np.cumsum(weights)
+    cumsum /= cumsum[-1]
+    positions = (rng.uniform() + np.arange(num_samples)) / num_samples
+    indices = np.searchsorted(cumsum, positions, side="right")
+    return np.minimum(indices, len(weights) - 1)
+
+
+class ParticleBelief:
+    """
+    Weighted particles over the location of an object, stored as an
+    N x 2 integer array of locations and an array of N log weights.
+    The probability of a location is the total weight of the particles
+    there, normalized, which is how condensed WeightedParticles behave.
+
+    Provides the subset of the pomdp_py distribution interface used by
+    GreedyNbvAgent (mpe, random, __getitem__); use `to_weighted_particles`
+    to get a pomdp_py.WeightedParticles (e.g. for visualization).
+    """
+    def __init__(self, objid, objclass, locs, log_weights):
+        self.objid = objid
+        self.objclass = objclass
+        self.locs = np.asarray(locs, dtype=int).reshape(-1, 2)
+        self.log_weights = np.asarray(log_weights, dtype=float)
+        self._condensed = None
+
+    def __len__(self):
+        return len(self.locs)
+
+    @property
+    def weights(self):
+        """Normalized weights; all zero if every log weight is -inf"""
+        if len(self.log_weights) == 0 or not np.isfinite(self.log_weights.max()):
+            return np.zeros(len(self.log_weights))
+        w = np.exp(self.log_weights - self.log_weights.max())
+        return w / w.sum()
+
+    def condensed(self):
+        """Returns (unique_locs, probs), merging particles at the same location"""
+        if self._condensed is None:
+            unique_locs, inverse = np.unique(self.locs, axis=0, return_inverse=True)
+            probs = np.bincount(inverse.reshape(-1), weights=self.weights,
+                                minlength=len(unique_locs))
+            self._condensed = (unique_locs, probs,
+                               {tuple(loc): i for i, loc in enumerate(unique_locs.tolist())})
+        return self._condensed[:2]
+
+    @property
+    def num_unique(self):
+        return len(self.condensed()[0])
+
+    def object_state(self, loc):
+        return ObjectState(self.objid, self.objclass, tuple(int(v) for v in loc))
+
+    def prob(self, loc):
+        unique_locs, probs = self.condensed()
+        index = self._condensed[2].get(tuple(loc), None)
+        return 0.0 if index is None else probs[index]
+
+    def __getitem__(self, si):
+        return self.prob(si.loc)
+
+    def mpe(self):
+        unique_locs, probs = self.condensed()
+        return self.object_state(unique_locs[np.argmax(probs)])
+
+    def sample_locs(self, num_samples, rng=np.random):
+        """Samples `num_samples` locations (N x 2 array) according to the weights,
+        using `rng` (np.random.RandomState; the global numpy random state by default)"""
+        indices = rng.choice(len(self.locs), size=num_samples, p=self.weights)
+        return self.locs[indices]
+
+    def random(self, rng=np.random):
+        return self.object_state(self.sample_locs(1, rng=rng)[0])
+
+    def to_weighted_particles(self):
+        unique_locs, probs = self.condensed()
+        return pomdp_py.WeightedParticles(
+            [(self.object_state(loc), prob)
+             for loc, prob in zip(unique_locs, probs)],
+            approx_method="nearest",
+            distance_func=lambda s1, s2: euclidean_dist(s1.loc, s2.loc))
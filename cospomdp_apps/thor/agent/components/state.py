@@ -146,6 +146,12 @@ class RobotState3D(RobotState):
         else:
             return sensor.in_range(loc, self.pose, **kwargs)
 
+    def locs_in_range(self, sensor, locs, **kwargs):
+        if isinstance(sensor, FanSensor3D):
+            return sensor.in_range_batch(locs, self.pose3d, **kwargs)
+        else:
+            return sensor.in_range_batch(locs, self.pose, **kwargs)
+
     def in_range_facing(self, sensor, sobj, **kwargs):
         if isinstance(sensor, FanSensor3D):
             return sensor.in_range_facing(sobj.loc3d, self.pose3d, **kwargs)
@@ -12,13 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import cv2
 import numpy as np
 from collections import deque
 from cospomdp.utils.graph import Node, Graph, Edge
 from cospomdp.utils.math import euclidean_dist
-from thortils.utils.colors import lighter
-import networkx as nx
+from cospomdp.utils.spatial import PointIndex
 
 class TopoNode(Node):
     """TopoNode is a node on the grid map."""
@@ -75,10 +73,34 @@ class TopoMap(Graph):
     construct a mapping called e.g. `edges` that maps from edge id to Edge,
     and do TopoMap(edges)."""
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, precompute_paths=True, **kwargs):
+        """
+        precompute_paths (bool): If True, the first shortest path query
+            computes the shortest path trees from all nodes, so that
+            later path and distance queries are table lookups.
+        """
         super().__init__(*args, **kwargs)
+        self._precompute_paths = precompute_paths
+        self.invalidate_caches()
+
+    def invalidate_caches(self):
+        """Must be called if the nodes or edges of this map are changed"""
         self._cache_closest = {}
         self._cache_shortest_path = {}
+        self._node_index = None  # (PointIndex over node positions, node ids)
+        self._path_dists = None  # maps from src to {dst: distance}
+        self._path_trees = None  # maps from src to 'prev' (see Graph.shortest_path_tree)
+        self._loc_assignment = None  # (location -> row, node index per row, node ids, node sizes)
+        self._node_probs = None  # (belief version, {nid: prob}) of the last node_probs call
+
+    def compute_all_pairs_paths(self):
+        """Computes the shortest paths (in grid distance) between all pairs of nodes"""
+        self._path_dists = {}
+        self._path_trees = {}
+        for nid in self.nodes:
+            d, prev = self.shortest_path_tree(nid, lambda e: e.grid_dist)
+            self._path_dists[nid] = d
+            self._path_trees[nid] = prev
 
     def closest_node(self, x, y):
         """Given a point at (x,y) find the node that is closest to this point.
@@ -86,8 +108,11 @@ class TopoMap(Graph):
         if (x,y) in self._cache_closest:
             return self._cache_closest[(x,y)]
         else:
-            nid = min(self.nodes,
-                       key=lambda nid: euclidean_dist(self.nodes[nid].pos, (x,y)))
+            if self._node_index is None:
+                nids = list(self.nodes)
+                self._node_index = (PointIndex([self.nodes[nid].pos for nid in nids]), nids)
+            index, nids = self._node_index
+            nid = nids[index.nearest_index((x,y))]
             self._cache_closest[(x,y)] = nid
             return nid
 
@@ -119,18 +144,104 @@ class TopoMap(Graph):
         if (src, dst) in self._cache_shortest_path:
             return self._cache_shortest_path[(src, dst)]
         else:
-            path = super().shortest_path(src, dst, lambda e: e.grid_dist)
+            if self._precompute_paths and self._path_trees is None:
+                self.compute_all_pairs_paths()
+            if self._path_trees is not None:
+                path = Graph.path_from_tree(self._path_trees[src], dst)
+            else:
+                path = super().shortest_path(src, dst, lambda e: e.grid_dist)
             self._cache_shortest_path[(src, dst)] = path
             return path
 
-    def total_prob(self, target_hist):
-        return sum(self.nodes[nid].prob(target_hist)
-                   for nid in self.nodes)
+    def path_distance(self, src, dst):
+        """Returns the grid distance of the shortest path from
+        src to dst; float('inf') if there is no path"""
+        if self._precompute_paths and self._path_dists is None:
+            self.compute_all_pairs_paths()
+        if self._path_dists is not None:
+            return self._path_dists[src].get(dst, float("inf"))
+        path = self.shortest_path(src, dst)
+        if path is None:
+            return float("inf")
+        return sum(self.edges[eid].grid_dist for eid in path)
+
+    def _compute_loc_assignment(self):
+        """Assigns every search region location covered by the nodes
+        to the node that covers it. The nodes are expected to cover
+        disjoint locations; otherwise, a location counts towards the
+        first node that covers it."""
+        nids = list(self.nodes)
+        loc_index = {}
+        assignment = []
+        for i, nid in enumerate(nids):
+            for loc in self.nodes[nid].search_region_locs:
+                if loc not in loc_index:
+                    loc_index[loc] = len(assignment)
+                    assignment.append(i)
+        assignment = np.array(assignment, dtype=np.intp)
+        sizes = np.bincount(assignment, minlength=len(nids)).astype(float)
+        self._loc_assignment = (loc_index, assignment, nids, sizes)
+
+    def node_probs(self, target_hist, residual_prob=None, version=None):
+        """Returns a dictionary that maps from node id to the probability
+        that the target is at a location covered by that node. Computed
+        for all nodes in one pass over target_hist.
+
+        Args:
+            target_hist (dict): maps from location to probability.
+            residual_prob (float): If given, target_hist may contain only some
+                locations (e.g. the support of a SparseHistogram); every other
+                location has probability `residual_prob`. The cost then
+                scales with the size of target_hist.
+            version: If not None, identifies the belief target_hist comes from
+                (e.g. a counter of belief updates). The result is cached, and
+                calling again with the same version returns it without
+                looking at target_hist.
+        """
+        cached = self.cached_node_probs(version)
+        if cached is not None:
+            return cached
+
+        if self._loc_assignment is None:
+            self._compute_loc_assignment()
+        loc_index, assignment, nids, sizes = self._loc_assignment
+        rows = np.fromiter((loc_index.get(loc, -1) for loc in target_hist),
+                           dtype=np.intp, count=len(target_hist))
+        probs = np.fromiter((target_hist[loc] for loc in target_hist),
+                            dtype=float, count=len(target_hist))
+        covered = rows >= 0
+        base = 0.0 if residual_prob is None else residual_prob
+        masses = base * sizes + np.bincount(assignment[rows[covered]],
+                                            weights=probs[covered] - base,
+                                            minlength=len(nids))
+        result = {nid: float(masses[i]) for i, nid in enumerate(nids)}
+        if version is not None:
+            self._node_probs = (version, result)
+        return result
+
+    def cached_node_probs(self, version):
+        """Returns the result of the last node_probs call made with
+        `version`, or None if there is no such result."""
+        if version is not None\
+           and self._node_probs is not None\
+           and self._node_probs[0] == version:
+            return self._node_probs[1]
+        return None
+
+    def total_prob(self, target_hist, residual_prob=None, version=None):
+        """Returns the probability that the target is at a location covered
+        by the nodes of this map. See node_probs for the arguments."""
+        return sum(self.node_probs(target_hist,
+                                   residual_prob=residual_prob,
+                                   version=version).values())
 
 
 #------ Visualization -----#
 # In all fucntions, r means resolution, in pygmae visualziation
+# cv2 and thortils are imported by the functions that draw, so that the
+# topo map itself can be used without them.
 def draw_edge(img, pos1, pos2, r, thickness=2, color=(0, 0, 0)):
+    import cv2
     x1, y1 = pos1
     x2, y2 = pos2
     cv2.line(img, (y1*r+r//2, x1*r+r//2), (y2*r+r//2, x2*r+r//2),
@@ -145,6 +256,8 @@ def draw_topo(img, topo_map, r, draw_grid_path=False, path_color=(52, 235, 222),
     linewidth: the linewidth of the bounding box when drawing grid path
     edge_thickness: the thickness of the edge on the topo map.
     """
+    import cv2
+    from thortils.utils.colors import lighter
     for eid in topo_map.edges:
         edge = topo_map.edges[eid]
         if draw_grid_path:
@@ -171,6 +284,7 @@ def draw_topo(img, topo_map, r, draw_grid_path=False, path_color=(52, 235, 222),
     return img
 
 def mark_cell(img, pos, nid, r, linewidth=1, unmark=False):
+    import cv2
     if unmark:
         color = (255, 255, 255, 255)
     else:
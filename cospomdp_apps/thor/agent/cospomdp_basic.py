@@ -34,6 +34,7 @@ import thortils as tt
 
 import cospomdp
 from cospomdp.utils.math import indicator, normalize, euclidean_dist, roundany, closest
+from cospomdp.models.correlation import corr_content_hash
 from cospomdp_apps.basic import PolicyModel2D, RobotTransition2D
 from cospomdp_apps.basic.action import Move2D, ALL_MOVES_2D, Done
 from cospomdp_apps.basic.belief import initialize_target_belief_2d, update_target_belief_2d
@@ -44,6 +45,7 @@ from .components.state import grid_full_pose
 
 from ..common import TOS_Action, ThorAgent
 from ..replay import ReplaySolver
+from ..assets import get_asset
 from .. import constants
 from .. import paths
 
@@ -54,6 +56,13 @@ class GridMapSearchRegion(cospomdp.SearchRegion2D):
         self.scene = scene
 
 
+def corr_dist_name(scene, target_class, corr_class, corr_type):
+    """Name of the file (without extension) under which the correlation
+    distribution Pr(corr_class | target_class) in `scene` is saved"""
+    scene_type = tt.ithor_scene_type(scene)
+    return f"corr-dist_{scene_type}_{target_class}-{corr_class}_{scene}_{corr_type}"
+
+
 class ThorObjectSearchCosAgent(ThorAgent):
     AGENT_USES_CONTROLLER = False
 
@@ -153,12 +162,19 @@ class ThorObjectSearchCosAgent(ThorAgent):
     def _build_corr_dists(self, corr_specs, objects, corr_dists_path):
         return ThorObjectSearchCosAgent.build_corr_dists(
             self.target[0], self.search_region,
-            corr_specs, objects, corr_dists_path=corr_dists_path)
+            corr_specs, objects, corr_dists_path=corr_dists_path,
+            backend=self.task_config.get("corr_backend", "tabular"))
 
     @staticmethod
-    def build_corr_dists(target_id, search_region, corr_specs, objects, corr_dists_path=None):
+    def build_corr_dists(target_id, search_region, corr_specs, objects, corr_dists_path=None,
+                         backend="tabular"):
         """
         corr_dists_path (str): Path to the directory that contains corr_dists pickle files
+        backend (str): CorrelationDist backend. For 'dense' or 'sparse', the
+            distributions are cached as memory-mapped arrays (CorrelationDist.save_mmap)
+            instead of pickle files, so that concurrent trials share one
+            page-cached copy; a cache whose content hash does not match the
+            search region and correlation spec is rebuilt.
         """
         target = objects[target_id]
         corr_dists = {}
@@ -178,28 +194,41 @@ class ThorObjectSearchCosAgent(ThorAgent):
 
                 loaded = False
                 if corr_dists_path is not None:
-                    scene = search_region.scene
-                    scene_type = tt.ithor_scene_type(scene)
-
-                    cdist_path = os.path.join(
-                        corr_dists_path, f"corr-dist_{scene_type}_{target[1]}-{corr_object[1]}_{scene}_{corr_type}.pkl")
-                    if os.path.exists(cdist_path):
-                        print(f"Loading corr dist of type '{corr_type}' Pr({corr_object[1]} | {target[1]})")
-                        corr_dists[other] = cospomdp.CorrelationDist.load(cdist_path)
-                        loaded = True
+                    cdist_name = corr_dist_name(search_region.scene, target[1],
+                                                corr_object[1], corr_type)
+                    if backend == "tabular":
+                        cdist_path = os.path.join(corr_dists_path, f"{cdist_name}.pkl")
+                        if os.path.exists(cdist_path):
+                            print(f"Loading corr dist of type '{corr_type}' Pr({corr_object[1]} | {target[1]})")
+                            # shared by trials in the same process; see ..assets
+                            corr_dists[other] = get_asset(
+                                cdist_path, lambda: cospomdp.CorrelationDist.load(cdist_path))
+                            loaded = True
+                    else:
+                        cdist_path = os.path.join(corr_dists_path, f"{cdist_name}_{backend}")
+                        content_hash = corr_content_hash(search_region, corr_object, target,
+                                                         corr_func, corr_func_args, backend=backend)
+                        cdist = cospomdp.CorrelationDist.load_mmap(cdist_path, search_region, content_hash)
+                        if cdist is not None:
+                            print(f"Loading corr dist of type '{corr_type}' Pr({corr_object[1]} | {target[1]}) (mmap)")
+                            corr_dists[other] = cdist
+                            loaded = True
 
                 if not loaded:
                     if type(corr_func) == str:
                         corr_func = eval(corr_func)
                     corr_dists[other] = cospomdp.CorrelationDist(
                         corr_object, target, search_region, corr_func,
-                        corr_func_args=corr_func_args)
+                        corr_func_args=corr_func_args, backend=backend)
 
                     if corr_dists_path is not None:
                         # save
                         print(f"Saving corr dist of type '{corr_type}' Pr({corr_object[1]} | {target[1]}) to {cdist_path}")
                         os.makedirs(corr_dists_path, exist_ok=True)
-                        corr_dists[other].save(cdist_path)
+                        if backend == "tabular":
+                            corr_dists[other].save(cdist_path)
+                        else:
+                            corr_dists[other].save_mmap(cdist_path, content_hash)
 
         return corr_dists
 
@@ -223,8 +252,7 @@ class ThorObjectSearchCosAgent(ThorAgent):
             # we don't want to lose this detection because it is at 'unknown'.
             # so we will map it to the closest one
             if (x,z) not in self.search_region.locations:
-                x, z = min(self.search_region.locations,
-                           key=lambda l: euclidean_dist(l, (x,z)))
+                x, z = self.search_region.closest_location((x,z))
             objobzs[cls] = cospomdp.Loc(cls, (x, z))
         return objobzs
 
@@ -269,7 +297,9 @@ class ThorObjectSearchBasicCosAgent(ThorObjectSearchCosAgent):
                  grid_map,
                  thor_camera_pose,
                  thor_prior={},
-                 approx_belief=False):
+                 approx_belief=False,
+                 log_belief=False,
+                 belief_prune_mass=None):
         """
         controller (ai2thor Controller)
         task_config (dict) configuration; see make_config
@@ -302,15 +332,26 @@ class ThorObjectSearchBasicCosAgent(ThorObjectSearchCosAgent):
         prior = {grid_map.to_grid_pos(p[0], p[2]): thor_prior[p]
                  for p in thor_prior}
         belief_type = "histogram" if not approx_belief else "histogram-approx"
+        if log_belief:
+            belief_type = "histogram-log"
+        bu_args = {}
+        if belief_prune_mass is not None:
+            belief_type = "histogram-sparse"
+            bu_args["prune_mass"] = belief_prune_mass
         self.cos_agent = cospomdp.CosAgent(self.target, init_robot_state,
                                            self.search_region, robot_trans_model, policy_model,
                                            self.corr_dists, self.detectors, reward_model,
                                            initialize_target_belief_2d, update_target_belief_2d,
-                                           prior=prior, belief_type=belief_type)
+                                           prior=prior, belief_type=belief_type,
+                                           bu_args=bu_args)
+        self.cos_agent.timer = self.timer
         # construct solver
         if solver == "pomdp_py.POUCT":
             self.solver = pomdp_py.POUCT(**solver_args,
                                          rollout_policy=self.cos_agent.policy_model)
+        elif solver == "cospomdp.RootParallelPOUCT":
+            self.solver = cospomdp.RootParallelPOUCT(**solver_args,
+                                                     rollout_policy=self.cos_agent.policy_model)
         else:
             self.solver = eval(solver)(**solver_args)
 
@@ -318,7 +359,8 @@ class ThorObjectSearchBasicCosAgent(ThorObjectSearchCosAgent):
         """
         Output a TOS_Action
         """
-        action = self.solver.plan(self.cos_agent)
+        with self.timer.timeit("planning"):
+            action = self.solver.plan(self.cos_agent)
         print("     Num Sims:", self.solver.last_num_sims)
 
         # Need to return TOS_Action
@@ -363,7 +405,8 @@ class ThorObjectSearchBasicCosAgent(ThorObjectSearchCosAgent):
         Here, action, observation are already interpreted.
         """
         self.cos_agent.update(action, observation)
-        self.solver.update(self.cos_agent, action, observation)
+        with self.timer.timeit("tree_update"):
+            self.solver.update(self.cos_agent, action, observation)
 
     @property
     def primitive_motions(self):
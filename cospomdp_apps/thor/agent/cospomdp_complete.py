@@ -15,13 +15,13 @@
 import pomdp_py
 import time
 import random
-from collections import deque
 import concurrent.futures
 
 from thortils.navigation import find_navigation_plan, get_navigation_actions
 
 from cospomdp.utils.math import euclidean_dist, normalize
 import cospomdp
+from cospomdp.models.belief import SparseHistogram
 from cospomdp_apps.basic.belief import initialize_target_belief_2d, update_target_belief_2d
 
 from ..constants import GOAL_DISTANCE
@@ -31,6 +31,7 @@ from .cospomdp_basic import GridMapSearchRegion, ThorObjectSearchCosAgent
 from .components.action import Move, MoveTopo, Stay, grid_h_angles, grid_pitch
 from .components.state import RobotStateTopo, grid_full_pose
 from .components.topo_map import TopoNode, TopoMap, TopoEdge
+from .components.navigation import NavGrid
 from .components.transition_model import RobotTransitionTopo
 from .components.policy_model import PolicyModelTopo
 from .components.goal_handlers import (MoveTopoHandler,
@@ -45,36 +46,24 @@ def _shortest_path(reachable_positions, gloc1, gloc2):
     """
     Computes the shortest distance between two locations.
     The two locations will be snapped to the closest free cell.
+
+    Note: If there are repeated queries over the same reachable_positions,
+    use a NavGrid instead; This function builds one every call.
     """
-    def neighbors(x,y):
-        return [(x+1, y), (x-1,y),
-                (x,y+1), (x,y-1)]
-
-    def get_path(s, t, prev):
-        v = t
-        path = [t]
-        while v != s:
-            v = prev[v]
-            path.append(v)
-        return path
-
-    # BFS; because no edge weight
-    reachable_positions = set(reachable_positions)
-    visited = set()
-    q = deque()
-    q.append(gloc1)
-    prev = {gloc1:None}
-    while len(q) > 0:
-        loc = q.popleft()
-        if loc == gloc2:
-            return get_path(gloc1, gloc2, prev)
-        for nb_loc in neighbors(*loc):
-            if nb_loc in reachable_positions:
-                if nb_loc not in visited:
-                    q.append(nb_loc)
-                    visited.add(nb_loc)
-                    prev[nb_loc] = loc
-    return None
+    return NavGrid(reachable_positions).shortest_path(gloc1, gloc2)
+
+
+def _reachable_pos_mapping(search_region_locs, nav_grid):
+    """Returns a dict that maps from reachable position to the list of
+    search region locations for which it is the closest reachable position."""
+    mapping = {}
+    search_region_locs = list(search_region_locs)
+    closest_positions = nav_grid.position_index.nearest_batch(search_region_locs)
+    for loc, closest_reachable_pos in zip(search_region_locs, closest_positions):
+        if closest_reachable_pos not in mapping:
+            mapping[closest_reachable_pos] = []
+        mapping[closest_reachable_pos].append(loc)
+    return mapping
 
 
 def _sample_topo_map(target_hist,
@@ -83,7 +72,9 @@ def _sample_topo_map(target_hist,
                      degree=(3,5),
                      sep=4.0,
                      rnd=random,
-                     robot_pos=None):
+                     robot_pos=None,
+                     nav_grid=None,
+                     mapping=None):
     """Given a search region, a distribution over target locations in the
     search region, return a TopoMap with nodes within
     reachable_positions.
@@ -113,6 +104,11 @@ def _sample_topo_map(target_hist,
             to have degree less than or equal to the maximum degree.
         sep (float): minimum distance between two places (grid cells)
         robot_pos (x,y): If not None, will add a node at where the robot is.
+        nav_grid (NavGrid): used to snap locations to reachable positions and
+            to compute the grid paths of edges; If None, one is built from
+            reachable_positions.
+        mapping (dict): the output of _reachable_pos_mapping for the locations
+            in target_hist; computed if not given.
 
     Returns:
         TopologicalMap.
@@ -126,13 +122,12 @@ def _sample_topo_map(target_hist,
             raise ValueError("Invalid argument for degree {}."
                              "Accepts int or (int, int)".format(degree))
 
-    mapping = {}  # maps from reachable pos to a list of search region locs
-    for loc in target_hist:
-        closest_reachable_pos = min(reachable_positions,
-                                    key=lambda robot_pos: euclidean_dist(loc, robot_pos))
-        if closest_reachable_pos not in mapping:
-            mapping[closest_reachable_pos] = []
-        mapping[closest_reachable_pos].append(loc)
+    if nav_grid is None:
+        nav_grid = NavGrid(reachable_positions)
+
+    if mapping is None:
+        # maps from reachable pos to a list of search region locs
+        mapping = _reachable_pos_mapping(target_hist.keys(), nav_grid)
 
     # distribution over reachable positions
     reachable_pos_dist = {}
@@ -164,46 +159,190 @@ def _sample_topo_map(target_hist,
         pos_to_nid[pos] = i
 
     # Now, we need to connect the places to form a graph.
-    _conns = {}
     edges = {}
-    for nid in nodes:
-        if nid not in _conns:
-            _conns[nid] = set()
-        neighbors = _conns[nid]
+    _connect_topo_nodes(nodes, list(nodes), {}, edges, degree_range, nav_grid)
+    if len(edges) == 0:
+        edges[0] = TopoEdge(0, nodes[next(iter(nodes))], None, [])
+
+    topo_map = TopoMap(edges)
+    # Verification
+    for nid in topo_map.nodes:
+        assert len(topo_map.edges_from(nid)) <= degree_range[1]
+
+    return topo_map
+
+
+def _connect_topo_nodes(nodes, nids, conns, edges, degree_range, nav_grid):
+    """Connects each node in `nids` to its closest nodes until it has
+    degree_range[0] neighbors, without giving any node more than
+    degree_range[1] neighbors. New TopoEdges are added to `edges`.
+
+    Args:
+        nodes (dict): maps from node id to TopoNode; all nodes of the graph
+        nids (list): ids of the nodes to connect
+        conns (dict): maps from node id to the set of its neighbor ids; updated.
+        edges (dict): maps from edge id to TopoEdge; updated.
+        nav_grid (NavGrid): used to compute the grid paths of the edges.
+    """
+    places = {nodes[nid].pos for nid in nodes}
+    pos_to_nid = {nodes[nid].pos: nid for nid in nodes}
+    next_eid = max(list(edges.keys()) + [999]) + 1
+    for nid in nids:
+        if nid not in conns:
+            conns[nid] = set()
+        neighbors = conns[nid]
         neighbor_positions = {nodes[nbnid].pos for nbnid in neighbors}
-        candidates = set(places) - {nodes[nid].pos} - neighbor_positions
+        candidates = places - {nodes[nid].pos} - neighbor_positions
         degree_needed = degree_range[0] - len(neighbors)
         if degree_needed <= 0:
             continue
         new_neighbors = list(sorted(candidates, key=lambda pos: euclidean_dist(pos, nodes[nid].pos)))[:degree_needed]
         for nbpos in new_neighbors:
             nbnid = pos_to_nid[nbpos]
-            if nbnid not in _conns or len(_conns[nbnid]) < degree_range[1]:
-                _conns[nid].add(nbnid)
-                if nbnid not in _conns:
-                    _conns[nbnid] = set()
-                _conns[nbnid].add(nid)
-
-                path = _shortest_path(reachable_positions,
-                                      nodes[nbnid].pos,
-                                      nodes[nid].pos)
+            if nbnid not in conns or len(conns[nbnid]) < degree_range[1]:
+                conns[nid].add(nbnid)
+                if nbnid not in conns:
+                    conns[nbnid] = set()
+                conns[nbnid].add(nid)
+
+                path = nav_grid.shortest_path(nodes[nbnid].pos,
+                                              nodes[nid].pos)
                 if path is None:
                     # Skip this edge because we cannot find path
                     continue
-                eid = len(edges) + 1000
-                edges[eid] = TopoEdge(eid,
-                                      nodes[nid],
-                                      nodes[nbnid],
-                                      path)
+                edges[next_eid] = TopoEdge(next_eid,
+                                           nodes[nid],
+                                           nodes[nbnid],
+                                           path)
+                next_eid += 1
+
+
+def _update_topo_map(topo_map,
+                     target_hist,
+                     reachable_positions,
+                     num_samples,
+                     degree=(3,5),
+                     sep=4.0,
+                     rnd=random,
+                     robot_pos=None,
+                     nav_grid=None,
+                     mapping=None,
+                     cover_thresh=0.5,
+                     keep_thresh=None):
+    """Incremental version of _sample_topo_map. Keeps the nodes of `topo_map`
+    that still cover enough probability, adds (or swaps in) as few newly
+    sampled places as needed to cover `cover_thresh` of the target
+    probability, and computes grid paths only for the edges of nodes
+    whose neighbors changed. Kept nodes and edges are reused as they are,
+    so their ids stay the same.
+
+    Args:
+        topo_map (TopoMap): the current topo map
+        target_hist, reachable_positions, num_samples, degree, sep, rnd,
+            robot_pos, nav_grid, mapping: see _sample_topo_map. The topo map
+            has at most num_samples + 1 nodes.
+        cover_thresh (float): desired total probability covered by the nodes
+        keep_thresh (float): nodes covering less probability than this are
+            removed; defaults to the average probability of a reachable
+            position, so that only nodes better than a random place are kept.
+
+    Returns:
+        TopologicalMap (a new object)
+    """
+    if type(degree) == int:
+        degree_range = (degree, degree)
+    else:
+        degree_range = degree
+        if len(degree_range) != 2:
+            raise ValueError("Invalid argument for degree {}."
+                             "Accepts int or (int, int)".format(degree))
+    if nav_grid is None:
+        nav_grid = NavGrid(reachable_positions)
+    if mapping is None:
+        mapping = _reachable_pos_mapping(target_hist.keys(), nav_grid)
+    max_nodes = num_samples + 1
+    if keep_thresh is None:
+        keep_thresh = 1.0 / len(mapping)
+
+    # distribution over reachable positions
+    reachable_pos_dist = normalize({pos: sum(target_hist.get(loc, 0.0) for loc in mapping[pos])
+                                    for pos in mapping})
+
+    # Keep the nodes with enough probability (and the node at robot_pos)
+    nodes = {}
+    node_prob = {}
+    for nid in topo_map.nodes:
+        node = topo_map.nodes[nid]
+        prob = reachable_pos_dist.get(node.pos, 0.0)
+        if prob >= keep_thresh or node.pos == robot_pos:
+            nodes[nid] = node
+            node_prob[nid] = prob
+    next_nid = max(list(topo_map.nodes.keys()) + [-1]) + 1
+    changed = set()
+    if robot_pos is not None and robot_pos not in {nodes[nid].pos for nid in nodes}:
+        nodes[next_nid] = TopoNode(next_nid, robot_pos, mapping.get(robot_pos, set()))
+        node_prob[next_nid] = reachable_pos_dist.get(robot_pos, 0.0)
+        changed.add(next_nid)
+        next_nid += 1
+
+    # Sample new places where the kept nodes do not cover enough probability
+    covered = sum(node_prob.values())
+    places = {nodes[nid].pos for nid in nodes}
+    candidates = {pos: reachable_pos_dist[pos] for pos in reachable_pos_dist
+                  if pos not in places and reachable_pos_dist[pos] > 0}
+    if len(candidates) > 0:
+        hist = pomdp_py.Histogram(normalize(candidates))
+        for i in range(num_samples):
+            if covered >= cover_thresh:
+                break
+            pos = hist.random(rnd=rnd)
+            if pos in places or (len(places) > 0 and
+                                 min(euclidean_dist(pos, c) for c in places) < sep):
+                continue
+            if len(nodes) >= max_nodes:
+                # replace the node covering the least probability, if worse
+                replaceable = [nid for nid in nodes if nodes[nid].pos != robot_pos]
+                if len(replaceable) == 0:
+                    break
+                worst = min(replaceable, key=lambda nid: node_prob[nid])
+                if node_prob[worst] >= candidates[pos]:
+                    continue
+                covered -= node_prob[worst]
+                places.remove(nodes[worst].pos)
+                del nodes[worst], node_prob[worst]
+                changed.discard(worst)
+            nodes[next_nid] = TopoNode(next_nid, pos, mapping.get(pos, set()))
+            node_prob[next_nid] = candidates[pos]
+            covered += candidates[pos]
+            places.add(pos)
+            changed.add(next_nid)
+            next_nid += 1
+
+    # Keep the edges between kept nodes; reconnect nodes that lost neighbors
+    edges = {}
+    conns = {nid: set() for nid in nodes}
+    for eid in topo_map.edges:
+        edge = topo_map.edges[eid]
+        if edge.degenerate:
+            continue
+        node1, node2 = edge.nodes
+        if node1.id in nodes and node2.id in nodes:
+            edges[eid] = edge
+            conns[node1.id].add(node2.id)
+            conns[node2.id].add(node1.id)
+    for nid in nodes:
+        if nid in topo_map.nodes and len(conns[nid]) < len(topo_map.neighbors(nid)):
+            changed.add(nid)
+    _connect_topo_nodes(nodes, sorted(changed), conns, edges, degree_range, nav_grid)
     if len(edges) == 0:
         edges[0] = TopoEdge(0, nodes[next(iter(nodes))], None, [])
 
-    topo_map = TopoMap(edges)
+    new_topo_map = TopoMap(edges)
     # Verification
-    for nid in topo_map.nodes:
-        assert len(topo_map.edges_from(nid)) <= degree_range[1]
+    for nid in new_topo_map.nodes:
+        assert len(new_topo_map.edges_from(nid)) <= degree_range[1]
 
-    return topo_map
+    return new_topo_map
 
 def _convert_to_3d_detectors(detectors, v_angles):
     """
@@ -245,9 +384,12 @@ class ThorObjectSearchCompleteCosAgent(ThorObjectSearchCosAgent):
                  topo_map_degree=(3,5),
                  places_sep=4.0,
                  topo_cover_thresh=0.5,
+                 incremental_topo_map=False,
                  local_search_type="basic",
                  local_search_params={},
                  approx_belief=False,
+                 log_belief=False,
+                 belief_prune_mass=None,
                  prior_height={},
                  seed=1000):
         """
@@ -259,6 +401,9 @@ class ThorObjectSearchCompleteCosAgent(ThorObjectSearchCosAgent):
                          grid_map,
                          thor_camera_pose)
 
+        # Used to compute grid paths between topo nodes; built once per scene.
+        self.nav_grid = NavGrid(self.reachable_positions)
+
         # Form initial topological graph for navigation.
         prior = {loc: 1e-12 for loc in self.search_region}
         for thor_loc in thor_prior:
@@ -270,13 +415,20 @@ class ThorObjectSearchCompleteCosAgent(ThorObjectSearchCosAgent):
         self._topo_map_degree = topo_map_degree
         self._seed = seed
         self._topo_cover_thresh = topo_cover_thresh
+        self._incremental_topo_map = incremental_topo_map
+        # Closest reachable position of every search region location; fixed per scene.
+        self._topo_mapping = _reachable_pos_mapping(prior.keys(), self.nav_grid)
+        # Counts belief updates; node probabilities on the topo map are cached per version.
+        self._belief_version = 0
         self.topo_map = _sample_topo_map(prior,
                                          self.reachable_positions,
                                          self._num_place_samples,
                                          degree=self._topo_map_degree,
                                          sep=self._places_sep,
                                          rnd=random.Random(self._seed),
-                                         robot_pos=self._init_robot_pose[:2])
+                                         robot_pos=self._init_robot_pose[:2],
+                                         nav_grid=self.nav_grid,
+                                         mapping=self._topo_mapping)
         init_topo_nid = self.topo_map.closest_node(*self._init_robot_pose[:2])
         init_robot_state = RobotStateTopo(self.robot_id, self._init_robot_pose, self._height,
                                           self._init_pitch, init_topo_nid)
@@ -289,6 +441,12 @@ class ThorObjectSearchCompleteCosAgent(ThorObjectSearchCosAgent):
         prior_loc = {grid_map.to_grid_pos(p[0], p[2]): thor_prior[p]
                      for p in thor_prior}
         belief_type = "histogram" if not approx_belief else "histogram-approx"
+        if log_belief:
+            belief_type = "histogram-log"
+        bu_args = {"v_angles": v_angles}
+        if belief_prune_mass is not None:
+            belief_type = "histogram-sparse"
+            bu_args["prune_mass"] = belief_prune_mass
 
         if local_search_type == "basic":
             target_belief_initializer = initialize_target_belief_2d
@@ -330,12 +488,19 @@ class ThorObjectSearchCompleteCosAgent(ThorObjectSearchCosAgent):
                                            belief_type=belief_type,
                                            prior=prior,
                                            binit_args=binit_args,
-                                           bu_args={"v_angles": v_angles})
+                                           bu_args=bu_args)
+        self.cos_agent.timer = self.timer
         self._local_search_type = local_search_type
         self._local_search_params = local_search_params
+        # CosAgents used by local search handlers; kept across Stay goals
+        # so that their models are built only once.
+        self.local_cos_agents = {}
         if solver == "pomdp_py.POUCT":
             self.solver = pomdp_py.POUCT(**solver_args,
                                          rollout_policy=self.cos_agent.policy_model)
+        elif solver == "cospomdp.RootParallelPOUCT":
+            self.solver = cospomdp.RootParallelPOUCT(**solver_args,
+                                                     rollout_policy=self.cos_agent.policy_model)
         else:
             self.solver = eval(solver)(**solver_args)
 
@@ -354,7 +519,8 @@ class ThorObjectSearchCompleteCosAgent(ThorObjectSearchCosAgent):
             print(f"Goal: {goal}")
             return action_taken
 
-        goal = self.solver.plan(self.cos_agent)
+        with self.timer.timeit("planning"):
+            goal = self.solver.plan(self.cos_agent)
         if isinstance(goal, MoveTopo):
             from pomdp_py.utils import TreeDebugger
             dd = TreeDebugger(self.cos_agent.tree)
@@ -362,11 +528,12 @@ class ThorObjectSearchCompleteCosAgent(ThorObjectSearchCosAgent):
             print("*****************************")
 
         print("Goal: {}".format(goal), "Num Sims:", self.solver.last_num_sims)
-        if self._goal_handler is None or goal != self._goal_handler.goal:
-            # Goal is different now. We try to handle this goal
-            self._goal_handler = self.handle(goal)
+        with self.timer.timeit("goal_handler"):
+            if self._goal_handler is None or goal != self._goal_handler.goal:
+                # Goal is different now. We try to handle this goal
+                self._goal_handler = self.handle(goal)
 
-        action = self._goal_handler.step()
+            action = self._goal_handler.step()
         if action is None:
             if self._loop_counter >= 5:
                 # too much replanning - take a random action
@@ -401,13 +568,16 @@ class ThorObjectSearchCompleteCosAgent(ThorObjectSearchCosAgent):
     def update(self, tos_action, tos_observation):
         # Update the goal handler with low-level sensory observation
         if self._goal_handler.updates_first:
-            self._goal_handler.update(tos_action, tos_observation)
+            with self.timer.timeit("goal_handler"):
+                self._goal_handler.update(tos_action, tos_observation)
 
         # Also update COS-POMDP with the low-level observation
         super().update(tos_action, tos_observation)
+        self._belief_version += 1
 
         if not self._goal_handler.updates_first:
-            self._goal_handler.update(tos_action, tos_observation)
+            with self.timer.timeit("goal_handler"):
+                self._goal_handler.update(tos_action, tos_observation)
 
         # this shouldn't hurt, theoretically; It is necessary in order
         # to prevent replanning goals from the same, out-dated tree while
@@ -417,10 +587,15 @@ class ThorObjectSearchCompleteCosAgent(ThorObjectSearchCosAgent):
 
         # Update the topo map (resample it, because belief has changed),
         # if the belief update makes the current one undesirable
-        btarget = self.belief.b(self.target_id)
-        target_hist = {s.loc: btarget[s] for s in btarget}
-        if self.topo_map.total_prob(target_hist) < self._topo_cover_thresh:
-            self._resample_topo_map(target_hist)
+        covered_prob = sum(self.topo_node_probs().values())
+        if covered_prob < self._topo_cover_thresh:
+            btarget = self.belief.b(self.target_id)
+            btarget_loc = getattr(btarget, "loc_belief", btarget)  # TargetBelief3D
+            if isinstance(btarget_loc, SparseHistogram):
+                btarget = btarget_loc
+            target_hist = {s.loc: btarget[s] for s in btarget}
+            with self.timer.timeit("topo_map_resampling"):
+                self._resample_topo_map(target_hist)
             # since we updated the topological map,
             # existing search tree is invalid.
             if hasattr(self.cos_agent, "tree"):
@@ -428,6 +603,27 @@ class ThorObjectSearchCompleteCosAgent(ThorObjectSearchCosAgent):
 
 
 
+    def topo_node_probs(self):
+        """Returns a dictionary that maps from topo node id to the
+        probability, under the current belief, that the target is at a
+        location covered by that node. Cached until the next belief update
+        or topo map change."""
+        node_probs = self.topo_map.cached_node_probs(self._belief_version)
+        if node_probs is not None:
+            return node_probs
+        btarget = self.belief.b(self.target_id)
+        btarget_loc = getattr(btarget, "loc_belief", btarget)  # TargetBelief3D
+        if isinstance(btarget_loc, SparseHistogram):
+            # Only look at the support; the pruned locations share the residual
+            target_hist = {s.loc: prob for s, prob in btarget_loc.support_items()}
+            residual_prob = btarget_loc.residual_prob
+        else:
+            target_hist = {s.loc: btarget[s] for s in btarget}
+            residual_prob = None
+        return self.topo_map.node_probs(target_hist,
+                                        residual_prob=residual_prob,
+                                        version=self._belief_version)
+
     def interpret_robot_obz(self, tos_observation):
         # Here, we will build a pose of format (x, y, pitch, yaw, nid)
         x, y, height, pitch, yaw = grid_full_pose(tos_observation.camera_pose,
@@ -468,20 +664,39 @@ class ThorObjectSearchCompleteCosAgent(ThorObjectSearchCosAgent):
                 new_nid = self.topo_map.closest_node(*srobot_old.pose[:2])
                 self._update_belief_topo_nid(srobot_old, new_nid)
 
-            self.solver.update(self.cos_agent, self._goal_handler.goal, observation)
+            with self.timer.timeit("tree_update"):
+                self.solver.update(self.cos_agent, self._goal_handler.goal, observation)
 
 
     def _resample_topo_map(self, target_hist):
         srobot_old = self.cos_agent.belief.b(self.robot_id).mpe()
-        topo_map = _sample_topo_map(target_hist,
-                                    self.reachable_positions,
-                                    self._num_place_samples,
-                                    degree=self._topo_map_degree,
-                                    sep=self._places_sep,
-                                    rnd=random.Random(self._seed),
-                                    robot_pos=srobot_old.pose[:2])
+        if self._incremental_topo_map:
+            topo_map = _update_topo_map(self.topo_map,
+                                        target_hist,
+                                        self.reachable_positions,
+                                        self._num_place_samples,
+                                        degree=self._topo_map_degree,
+                                        sep=self._places_sep,
+                                        rnd=random.Random(self._seed),
+                                        robot_pos=srobot_old.pose[:2],
+                                        nav_grid=self.nav_grid,
+                                        mapping=self._topo_mapping,
+                                        cover_thresh=self._topo_cover_thresh)
+        else:
+            topo_map = _sample_topo_map(target_hist,
+                                        self.reachable_positions,
+                                        self._num_place_samples,
+                                        degree=self._topo_map_degree,
+                                        sep=self._places_sep,
+                                        rnd=random.Random(self._seed),
+                                        robot_pos=srobot_old.pose[:2],
+                                        nav_grid=self.nav_grid,
+                                        mapping=self._topo_mapping)
         self.cos_agent.transition_model.robot_trans_model.update(topo_map)
         self.cos_agent.policy_model.update(topo_map)
+        if isinstance(self.solver, cospomdp.RootParallelPOUCT):
+            # its workers hold the models with the old topo map
+            self.solver.reset_workers()
         self.topo_map = topo_map
         self._update_belief_topo_nid(srobot_old,
                                      topo_map.closest_node(*srobot_old.pose[:2]))
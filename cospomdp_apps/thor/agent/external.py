@@ -17,7 +17,6 @@ import os
 ABS_PATH = os.path.dirname(os.path.abspath(__file__))
 
 from ..mjolnir.datasets.offline_controller_with_small_rotation import ACTIONS_LIST
-import torch
 
 from ..common import TOS_Action, ThorAgent
 from cospomdp_apps.basic.action import ALL_MOVES_2D
@@ -130,6 +129,7 @@ class ThorObjectSearchExternalAgent(ThorAgent):
         shared_model = model_create_fn(args)
 
         print("Loading model...")
+        import torch
         try:
             saved_state = torch.load(
                 load_model_path, map_location=lambda storage, loc: storage
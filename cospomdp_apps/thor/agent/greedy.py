@@ -40,6 +40,7 @@ from thortils.navigation import _pitch_facing as thor_pitch_facing
 from cospomdp.models.agent import build_cos_observation_model
 from cospomdp.models.sensors import yaw_facing
 from cospomdp.utils.math import euclidean_dist
+from cospomdp.utils.timing import StepTimer
 import cospomdp
 
 from ..common import TOS_Action
@@ -47,14 +48,17 @@ from ..replay import ReplaySolver
 from .cospomdp_basic import (ThorObjectSearchCosAgent,
                              GridMapSearchRegion,
                              ThorObjectSearchBasicCosAgent)
-from .cospomdp_complete import _shortest_path
+from .components.navigation import NavGrid
+from .components.particles import ParticleBelief, systematic_resample
 from .components.action import MoveViewpoint, grid_h_angles, thor_camera_look_actions
 from .components.goal_handlers import MacroMoveHandler, DoneHandler, DummyGoalHandler
 
-def weighted_particles(particles):
-    return pomdp_py.WeightedParticles(
-        particles, approx_method="nearest",
-        distance_func=lambda s1, s2: euclidean_dist(s1.loc, s2.loc))
+def _dense_row(matrix, row):
+    """Row of a (numpy or scipy.sparse) matrix as a flat numpy array"""
+    row = matrix[row]
+    if hasattr(row, "toarray"):
+        row = row.toarray()
+    return np.asarray(row).ravel()
 
 class GreedyNbvAgent:
     """Greedy next-best-view agent.
@@ -95,7 +99,9 @@ class GreedyNbvAgent:
                  done_check_thres=0.2,
                  num_viewpoint_samples=10,
                  is3d=False,
-                 decision_params={}):
+                 decision_params={},
+                 nav_grid=None,
+                 seed=None):
         """
         prior: Maps from object_id to a map from search region location to a float.
         detectors: Maps from objid to a DetectionModel Pr(zi | si, srobot')
@@ -110,9 +116,22 @@ class GreedyNbvAgent:
             will check if should take Done. Because usually there is a blob
             of particles, this threshold doesn't need to be very high,
             otherwise the robot may be very hesitant and finds nothing.
+        nav_grid (NavGrid): for navigation distances over reachable_positions;
+            If None, one is built.
+        seed (int): seed of the random state used by the particle filter and
+            viewpoint sampling; if None, the random state is seeded from the OS.
         """
         self.search_region = search_region
         self.reachable_positions = reachable_positions
+        self._rng = np.random.RandomState(seed)
+        self._region_locs = np.array(list(search_region.locations))
+        self._region_offset = self._region_locs.min(axis=0)
+        self._region_mask = np.zeros(self._region_locs.max(axis=0) - self._region_offset + 1,
+                                     dtype=bool)
+        self._region_mask[tuple((self._region_locs - self._region_offset).T)] = True
+        if nav_grid is None:
+            nav_grid = NavGrid(reachable_positions)
+        self.nav_grid = nav_grid
         self.detectors = detectors
         self._init_robot_state = init_robot_state
         self.target = target
@@ -133,13 +152,16 @@ class GreedyNbvAgent:
 
         self._current_goal = None
         self.last_viewpoints = []
+        # Records time spent in belief update
+        self.timer = StepTimer()
 
     def sensor(self, objid):
         return self.observation_model.zi_models[objid].detection_model.sensor
 
     @property
     def belief(self):
-        return pomdp_py.OOBelief({**self.particle_beliefs,
+        return pomdp_py.OOBelief({**{objid: self.particle_beliefs[objid].to_weighted_particles()
+                                     for objid in self.particle_beliefs},
                                   **{self.robot_id: self.brobot}})
 
     @property
@@ -163,22 +185,25 @@ class GreedyNbvAgent:
         # For every detectable object, maintain a set of particle beliefs
         # The initial belief is
         if len(prior) > 0:
-            hist = pomdp_py.Histogram(prior)
+            prior_locs = list(prior.keys())
+            prior_probs = np.array([prior[loc] for loc in prior_locs], dtype=float)
+            prior_probs /= prior_probs.sum()
+            indices = self._rng.choice(len(prior_locs), size=self._num_particles, p=prior_probs)
+            locs = np.array(prior_locs)[indices]
+            weights = prior_probs[indices]
         else:
-            hist = None
-        particles = []
-        for i in range(self._num_particles):
-            if hist is not None:
-                loc = hist.random()
-                weight = hist[loc]
-            else:
-                loc = random.sample(self.search_region.locations, 1)[0]
-                weight = 1.0 / len(self.search_region.locations)
-            si = self.search_region.object_state(
-                objid, cls, loc
-            )
-            particles.append((si, weight))
-        return weighted_particles(particles)
+            indices = self._rng.randint(len(self._region_locs), size=self._num_particles)
+            locs = self._region_locs[indices]
+            weights = np.full(self._num_particles, 1.0 / len(self._region_locs))
+        return ParticleBelief(objid, cls, locs, np.log(weights))
+
+    def _in_search_region(self, locs):
+        """Returns a boolean array; True for locations in the search region"""
+        shifted = locs - self._region_offset
+        inside = np.all((shifted >= 0) & (shifted < self._region_mask.shape), axis=1)
+        result = np.zeros(len(locs), dtype=bool)
+        result[inside] = self._region_mask[tuple(shifted[inside].T)]
+        return result
 
     def update(self, action, observation):
         """
@@ -191,17 +216,18 @@ class GreedyNbvAgent:
         next_brobot = pomdp_py.WeightedParticles([(next_srobot, 1.0)])
         self.brobot = next_brobot
 
-        btarget = self.particle_beliefs[self.target_id]
-        next_btarget = self._update_target_particles(btarget, next_srobot, observation, self._num_particles)
-        new_particle_beliefs = {self.target_id : next_btarget}
-        for objid in self.particle_beliefs:
-            if objid != self.target_id:
-                bobj = self.particle_beliefs[objid]
-                next_bobj = self._update_object_particles(objid, bobj, observation,
-                                                          next_btarget, next_srobot,
-                                                          self._num_particles)
-                new_particle_beliefs[objid] = next_bobj
-        self.particle_beliefs = new_particle_beliefs
+        with self.timer.timeit("belief_update"):
+            btarget = self.particle_beliefs[self.target_id]
+            next_btarget = self._update_target_particles(btarget, next_srobot, observation, self._num_particles)
+            new_particle_beliefs = {self.target_id : next_btarget}
+            for objid in self.particle_beliefs:
+                if objid != self.target_id:
+                    bobj = self.particle_beliefs[objid]
+                    next_bobj = self._update_object_particles(objid, bobj, observation,
+                                                              next_btarget, next_srobot,
+                                                              self._num_particles)
+                    new_particle_beliefs[objid] = next_bobj
+            self.particle_beliefs = new_particle_beliefs
 
     def _reinvigorate(self, objid, particles):
         """
@@ -214,48 +240,47 @@ class GreedyNbvAgent:
         Because we don't have B(Rj), we will only do the first kind of reinvigoration
 
         Args:
-            particles (WeightedParticles)
+            particles (ParticleBelief)
         """
+        cls = self.detectable_objects[objid][1]
         if len(particles) == 0:
             print("Particle depletion. Reinvigorate all particles.")
-            cls = self.detectable_objects[objid][1]
             return self._init_obj_belief(objid, cls)
 
-        _srnd = particles.random()
-        _objid = _srnd.id
-        _cls = _srnd.objclass
-        new_particles = [p for p in particles.particles]
-        if len(particles) <= self._num_particles * 0.2:
-            for _ in range(self._num_particles - len(particles)):
-                # Most of the time, sample according to current belief
-                si = particles.random()
-                weight = particles[si]
-                # add random shift
-                si = si.__class__(si.id, si.objclass,
-                                  (si.loc[0] + random.randint(0,1),
-                                   si.loc[1] + random.randint(0,1)))
-                if si.loc in self.search_region:
-                    new_particles.append((si, weight))
-        return weighted_particles(new_particles)
+        locs, probs = particles.condensed()
+        if len(locs) <= self._num_particles * 0.2:
+            num_new = self._num_particles - len(locs)
+            # Most of the time, sample according to current belief
+            indices = self._rng.choice(len(locs), size=num_new, p=probs)
+            # add random shift
+            new_locs = locs[indices] + self._rng.randint(0, 2, size=(num_new, 2))
+            keep = self._in_search_region(new_locs)
+            locs = np.concatenate([locs, new_locs[keep]])
+            probs = np.concatenate([probs, probs[indices][keep]])
+        with np.errstate(divide="ignore"):
+            return ParticleBelief(objid, cls, locs, np.log(probs))
+
+    def _resample(self, objid, locs, weights, num_particles):
+        """Systematic resampling of the particles at `locs` with `weights`.
+        As before, each resampled particle keeps its weight. Returns
+        an empty ParticleBelief if all weights are zero."""
+        cls = self.detectable_objects[objid][1]
+        if weights.sum() <= 0:
+            return ParticleBelief(objid, cls, np.zeros((0, 2)), np.zeros(0))
+        indices = systematic_resample(weights, num_particles, rng=self._rng)
+        with np.errstate(divide="ignore"):
+            return ParticleBelief(objid, cls, locs[indices], np.log(weights[indices]))
 
     def _update_target_particles(self, btarget, next_srobot, observation, num_particles):
-        _temp_particles = []
-        for _ in range(num_particles):
-            starget = btarget.random()
-            next_state = cospomdp.CosState({self.target_id: starget,
-                                            next_srobot.id: next_srobot})
-            weight = self.observation_model.probability(observation, next_state)
-            _temp_particles.append((starget, weight))
-        # resampling
-        _temp_particles = pomdp_py.WeightedParticles(_temp_particles)
-        resampled_particles = []
-        for _ in range(num_particles):
-            starget = _temp_particles.random()
-            weight = _temp_particles[starget]
-            resampled_particles.append((starget, weight))
-
-        belief = weighted_particles(resampled_particles).condense()
-        print(belief.mpe(), belief[belief.mpe()])
+        locs = btarget.sample_locs(num_particles, rng=self._rng)
+        # The likelihood is computed once per distinct location.
+        unique_locs, inverse = np.unique(locs, axis=0, return_inverse=True)
+        target_states = [btarget.object_state(loc) for loc in unique_locs]
+        pr_z = self.observation_model.probability_vector(observation, target_states, next_srobot)
+        weights = pr_z[inverse.reshape(-1)]
+        belief = self._resample(self.target_id, locs, weights, num_particles)
+        if len(belief) > 0:
+            print(belief.mpe(), belief[belief.mpe()])
         return self._reinvigorate(self.target_id, belief)
 
     def _update_object_particles(self, objid, bobj, observation, next_btarget, next_srobot, num_particles):
@@ -266,24 +291,23 @@ class GreedyNbvAgent:
                           = Pr(zi | si') B(si') * Pr(si' | starget') Pr(starget' | B, a, z)
 
         Note that Pr(starget' | B, a, z) has been updated already."""
-        _temp_particles = []
-        for _ in range(num_particles):
-            starget = next_btarget.random()
-            zi_model = self.observation_model.zi_models[objid]
-            dist_si = zi_model.corr_cond_dist(starget)
-            si = dist_si.sample()[objid]
-            zi = observation.z(objid)
-            zi_detection_model = zi_model.detection_model
-            zi_prob = zi_detection_model.probability(zi, si, next_srobot)
-            weight = zi_prob
-            _temp_particles.append((si, weight))
-        _temp_particles = pomdp_py.WeightedParticles(_temp_particles)
-        resampled_particles = []
-        for _ in range(num_particles):
-            si = _temp_particles.random()
-            weight = _temp_particles[si]
-            resampled_particles.append((si, weight))
-        belief = weighted_particles(resampled_particles).condense()
+        zi_model = self.observation_model.zi_models[objid]
+        target_locs = next_btarget.sample_locs(num_particles, rng=self._rng)
+        unique_target_locs, inverse = np.unique(target_locs, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        # sample si ~ Pr(si | starget) for each particle, one batch per
+        # distinct target location.
+        si_locs, cond_matrix = zi_model.corr_cond_rows(unique_target_locs.tolist())
+        locs = np.zeros((num_particles, 2), dtype=int)
+        for t in range(len(unique_target_locs)):
+            members = np.nonzero(inverse == t)[0]
+            cdf = np.cumsum(_dense_row(cond_matrix, t))
+            si_indices = np.searchsorted(cdf, self._rng.uniform(size=len(members)) * cdf[-1],
+                                         side="right")
+            locs[members] = si_locs[np.minimum(si_indices, len(cdf) - 1)]
+        zi = observation.z(objid)
+        weights = zi_model.detection_model.probability_batch(zi, next_srobot, locs)
+        belief = self._resample(objid, locs, weights, num_particles)
         return self._reinvigorate(objid, belief)
 
     def act(self):
@@ -315,11 +339,11 @@ class GreedyNbvAgent:
 
         viewpoints = []
         for _ in range(self._num_viewpoint_samples):
-            starget = btarget.random()
+            starget = btarget.random(rng=self._rng)
             # a view point is a pose. Get the position from starget,
             # and choose the robot reachable position closest to the target,
             # then get the yaw facing the target
-            robot_pos = min(self.reachable_positions, key=lambda p: euclidean_dist(p, starget.loc))
+            robot_pos = self.nav_grid.closest_reachable(starget.loc)
             yaw = yaw_facing(srobot.loc, starget.loc, self._h_angles)
             robot_pose = (*robot_pos, yaw)
             viewpoints.append((robot_pose, starget, btarget[starget]))
@@ -332,8 +356,7 @@ class GreedyNbvAgent:
         sigma = self._decision_params.get("sigma", 0.5)
         for robot_pose, starget, weight_target in viewpoints:
             # because path is over grid map, its length is the length of the path
-            navigation_distance = len(_shortest_path(self.reachable_positions,
-                                                     srobot.loc, robot_pose[:2]))
+            navigation_distance = len(self.nav_grid.shortest_path(srobot.loc, robot_pose[:2]))
             # Trades off going for the target with any other object.
             # We sample other object states conditioned on the target object location.
             # and check if the robot can observe them from the view point
@@ -398,6 +421,7 @@ class ThorObjectSearchGreedyNbvAgent(ThorObjectSearchCosAgent):
                                            self.corr_dists, self.detectors, self.detectable_objects, h_angles,
                                            goal_distance=goal_distance, is3d=is3d,
                                            **greedy_params)
+        self.greedy_agent.timer = self.timer
 
         self._thor_v_angles = self.task_config['nav_config']['v_angles']
         self._thor_camera_look_actions = thor_camera_look_actions(task_config["nav_config"]["movement_params"])
@@ -431,22 +455,24 @@ class ThorObjectSearchGreedyNbvAgent(ThorObjectSearchCosAgent):
             self._look_action = None
             return look
 
-        goal = self.greedy_agent.act()
+        with self.timer.timeit("planning"):
+            goal = self.greedy_agent.act()
         print("Goal: {}".format(goal))
         if isinstance(goal, cospomdp.Done):
             self._goal_handler = DoneHandler(goal, self)
             return self._goal_handler.step()
 
-        if self._goal_handler is None\
-           or goal != self._goal_handler.goal\
-           or self._goal_handler.done:
-            assert isinstance(goal, MoveViewpoint)
-            self._goal_handler = MacroMoveHandler(goal.dst_pose[:2], self,
-                                                  rot=(0, goal.dst_pose[2], 0),
-                                                  angle_tolerance=5,
-                                                  goal=goal)
-
-        action = self._goal_handler.step()
+        with self.timer.timeit("goal_handler"):
+            if self._goal_handler is None\
+               or goal != self._goal_handler.goal\
+               or self._goal_handler.done:
+                assert isinstance(goal, MoveViewpoint)
+                self._goal_handler = MacroMoveHandler(goal.dst_pose[:2], self,
+                                                      rot=(0, goal.dst_pose[2], 0),
+                                                      angle_tolerance=5,
+                                                      goal=goal)
+
+            action = self._goal_handler.step()
         if action is None:
             # The goal handler is done already; plan size is zero. Replan,
             # but will make sure to not get into infinite loop.
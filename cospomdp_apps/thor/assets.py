@@ -0,0 +1,38 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Read-only assets (e.g. grid maps, correlation distributions) that are
+loaded once per process and reused by every trial that runs in it.
+
+The parallel trial runner (cospomdp_apps.thor.parallel) preloads the assets
+in the parent process before forking the workers, so the workers share
+the memory copy-on-write instead of each loading its own copy.
+Assets must therefore never be modified by the code that uses them.
+"""
+
+_ASSETS = {}
+
+def get_asset(key, loader):
+    """Returns the asset cached under `key`; If not cached,
+    calls loader() to load it and caches the result."""
+    if key not in _ASSETS:
+        _ASSETS[key] = loader()
+    return _ASSETS[key]
+
+def has_asset(key):
+    return key in _ASSETS
+
+def clear_assets():
+    _ASSETS.clear()
@@ -17,6 +17,7 @@ import numpy as np
 import time
 from thortils.scene import ithor_scene_type
 from cospomdp_apps.thor.detector import YOLODetector, GroundtruthDetector
+from cospomdp.utils.timing import StepTimer
 from dataclasses import dataclass, field
 from typing import List, Dict
 from . import constants
@@ -60,6 +61,7 @@ class ThorEnv:
     def __init__(self, controller):
         self.controller = controller
         self._history = []  # stores the history so far
+        self.timer = StepTimer()  # records env_step and detection times
         self._init_state = self.get_state(self.controller)
         self.update_history(self._init_state, None, None, 0)
 
@@ -73,11 +75,12 @@ class ThorEnv:
 
     def execute(self, agent, action):
         state = self.get_state(self.controller)
-        if action.name in constants.get_acceptable_thor_actions():
-            event = self.controller.step(action=action.name, **action.params)
-            event = self.controller.step(action="Pass")   # https://github.com/allenai/ai2thor/issues/538
-        else:
-            event = self.controller.step(action="Pass")
+        with self.timer.timeit("env_step"):
+            if action.name in constants.get_acceptable_thor_actions():
+                event = self.controller.step(action=action.name, **action.params)
+                event = self.controller.step(action="Pass")   # https://github.com/allenai/ai2thor/issues/538
+            else:
+                event = self.controller.step(action="Pass")
 
         next_state = self.get_state(event)
         observation = self.get_observation(event, action, detector=agent.detector)
@@ -133,6 +136,8 @@ class ThorAgent:
         will be loaded with the model_path and data_config provided
         in the task_config.
         """
+        # records the time spent in each phase of act and update per step
+        self.timer = StepTimer()
         if "vision_detector" in task_config["detector_config"]:
             # detector already provided. No need to load.
             self._detector = task_config["detector_config"]["vision_detector"]
@@ -180,6 +185,7 @@ class ThorAgent:
             visualize=detector_config["plot_detections"],
             detection_sep=detector_config["detection_sep"],
             max_repeated_detections=detector_config["max_repeated_detections"],
+            detection_log_window=detector_config.get("detection_log_window", None),
             detection_ranges=detector_config["expected_detection_ranges"])
 
         if use_vision_detector:
@@ -236,6 +242,9 @@ class TaskArgs:
     detectables: set
     agent_init_inputs: List = field(default_factory=lambda: [])  # inputs e.g. grid map provided at agent creation
     scene: str = 'FloorPlan1'
+    # directory of a scene recording; If given, trials replay it
+    # with a FakeController instead of launching ai2thor.
+    thor_recording: str = None
     target: str = "Apple"
     task_env: str = "ThorObjectSearch"
     agent_class: str = "ThorObjectSearchOptimalAgent"
@@ -244,6 +253,7 @@ class TaskArgs:
     save_grid_map: bool = True
     # use & load corr dists
     save_load_corr: bool = False
+    corr_backend: str = "tabular"  # 'tabular', 'dense' or 'sparse'; see CorrelationDist
     # detectors
     use_vision_detector: bool = False
     bbox_margin: float = 0.25 # percentage of the bbox to exclude along each axis
@@ -252,17 +262,21 @@ class TaskArgs:
     plot_detections: bool = False
     detection_sep: float = constants.GRID_SIZE
     max_repeated_detections: int = 1
+    detection_log_window: int = None  # forget detection locations not seen for this many steps
     # agent detectors
     agent_detector_specs: Dict = field(default_factory=lambda: {})
     # correlations
     corr_specs: Dict = field(default_factory=lambda: {})
     # Belief update
     approx_belief: bool = True
+    log_belief: bool = False   # keep the target belief in log space (LogHistogram)
+    belief_prune_mass: float = None  # if set, prune the target belief (SparseHistogram)
 
 # Make configs
 def make_config(args):
     """Make config based on TaskArgs"""
-    thor_config = {**constants.CONFIG, **{"scene": args.scene}}
+    thor_config = {**constants.CONFIG, **{"scene": args.scene,
+                                          "recording": args.thor_recording}}
 
     expected_detection_ranges = {}
     for cls in args.agent_detector_specs:
@@ -301,6 +315,7 @@ def make_config(args):
             "plot_detections": args.plot_detections,
             "detection_sep": args.detection_sep,
             "max_repeated_detections": args.max_repeated_detections,
+            "detection_log_window": args.detection_log_window,
             "expected_detection_ranges": expected_detection_ranges
         },
         "discount_factor": 0.95,
@@ -317,6 +332,7 @@ def make_config(args):
         task_config["save_grid_map"] = args.save_grid_map
 
     task_config["save_load_corr"] = args.save_load_corr
+    task_config["corr_backend"] = args.corr_backend
 
     config = {
         "thor": thor_config,
@@ -339,6 +355,8 @@ def make_config(args):
        and not (agent_class == agentlib.ThorObjectSearchRandomAgent)\
        and not (agent_class == agentlib.ThorObjectSearchKeyboardAgent):
         config["agent_config"]["approx_belief"] = args.approx_belief
+        config["agent_config"]["log_belief"] = args.log_belief
+        config["agent_config"]["belief_prune_mass"] = args.belief_prune_mass
 
     # You are expected to modify config['agent_config']
     # afterwards to tailor to your agent.
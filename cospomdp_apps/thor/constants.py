@@ -89,7 +89,6 @@ EXCLUDED_RECEPTACLES=[]   # not actually used
 
 #-------------------------------------------------------------------------------
 # What scenes are we using
-from thortils.scene import ithor_scene_names
 LEVELS = {
     "kitchen": [i for i in range(1, 31)],
     "living_room": [i for i in range(1, 31)],
@@ -97,14 +96,20 @@ LEVELS = {
     "bathroom": [i for i in range(1, 31)],
 }
 SCENE_TYPES = list(LEVELS.keys())
-KITCHEN_TRAIN_SCENES = ithor_scene_names("kitchen", range(1,21))
-KITCHEN_VAL_SCENES   = ithor_scene_names("kitchen", range(21,31))
-LIVING_ROOM_TRAIN_SCENES = ithor_scene_names("living_room", range(1,21))
-LIVING_ROOM_VAL_SCENES   = ithor_scene_names("living_room", range(21,31))
-BEDROOM_TRAIN_SCENES = ithor_scene_names("bedroom", range(1,21))
-BEDROOM_VAL_SCENES   = ithor_scene_names("bedroom", range(21,31))
-BATHROOM_TRAIN_SCENES = ithor_scene_names("bathroom", range(1,21))
-BATHROOM_VAL_SCENES   = ithor_scene_names("bathroom", range(21,31))
+# The scene lists (e.g. KITCHEN_TRAIN_SCENES) are computed at first access
+# (PEP 562), because thortils.scene pulls in ai2thor.
+_SCENE_SPLITS = {"TRAIN": range(1,21),
+                 "VAL": range(21,31)}
+
+def __getattr__(name):
+    for scene_type in SCENE_TYPES:
+        for split in _SCENE_SPLITS:
+            if name == "{}_{}_SCENES".format(scene_type.upper(), split):
+                from thortils.scene import ithor_scene_names
+                scenes = ithor_scene_names(scene_type, _SCENE_SPLITS[split])
+                globals()[name] = scenes
+                return scenes
+    raise AttributeError("module {} has no attribute {}".format(__name__, name))
 
 
 #-------------------------------------------------------------------------------
@@ -14,8 +14,10 @@
 
 # Create training datasets for YOLOv5 and Faster R-CNN
 import os
+import json
 import yaml
 import random
+import multiprocessing
 from tqdm import tqdm
 from thortils import (launch_controller,
                       thor_reachable_positions,
@@ -24,8 +26,12 @@ from thortils import (launch_controller,
                       thor_object_type,
                       ithor_scene_names)
 from .. import constants
+from ..fake_controller import FakeController
 from thortils.vision.general import xyxy_to_normalized_xywh, saveimg, make_colors
 
+# directory (under {datadir}/{train or val}) of the manifests of completed samples
+MANIFESTS_DIR = "manifests"
+
 def yolo_create_dataset_yaml(datadir, classes, name="yolov5"):
     """
     create the yaml file as specified in
@@ -54,14 +60,61 @@ def yolo_create_dataset_yaml(datadir, classes, name="yolov5"):
 def yolo_generate_dataset(datadir, scenes, objclasses, for_train,
                           num_samples=100,
                           v_angles=constants.V_ANGLES,
-                          h_angles=constants.H_ANGLES):
+                          h_angles=constants.H_ANGLES,
+                          num_workers=1,
+                          shards_per_scene=1,
+                          write_batch=32,
+                          recordings_dir=None,
+                          seed=None):
+    """
+    Generates `num_samples` samples for each scene in `scenes`
+    (see yolo_generate_dataset_for_scene).
+
+    The reachable positions of each scene are split into `shards_per_scene`
+    shards, and each shard is generated by a job with its own controller.
+    With num_workers > 1, the jobs run in a process pool. Generation
+    resumes from the manifests of completed samples, so an interrupted
+    run can be restarted with the same arguments.
+
+    Args:
+        num_workers (int): number of jobs run at the same time.
+        shards_per_scene (int): number of jobs per scene
+        write_batch (int): number of samples kept in memory before writing
+        recordings_dir (str): If given, a scene with a recording at
+            {recordings_dir}/{scene} (see cospomdp_apps.thor.fake_controller)
+            is replayed with a FakeController instead of ai2thor.
+        seed (int): If given, the positions are sampled deterministically.
+    """
+    jobs = []
     for scene in scenes:
-        print("Generating YOLO data for", scene)
-        yolo_generate_dataset_for_scene(
-            datadir, scene, objclasses, for_train,
-            num_samples=num_samples,
-            v_angles=v_angles,
-            h_angles=h_angles)
+        recording = None
+        if recordings_dir is not None\
+           and os.path.exists(os.path.join(recordings_dir, scene)):
+            recording = os.path.join(recordings_dir, scene)
+        for shard in range(shards_per_scene):
+            # split num_samples as evenly as possible
+            shard_samples = num_samples // shards_per_scene\
+                + (1 if shard < num_samples % shards_per_scene else 0)
+            jobs.append(dict(datadir=datadir, scene=scene, objclasses=objclasses,
+                             for_train=for_train, num_samples=shard_samples,
+                             v_angles=v_angles, h_angles=h_angles,
+                             shard=shard, num_shards=shards_per_scene,
+                             write_batch=write_batch, recording=recording,
+                             seed=None if seed is None else f"{seed}-{scene}-{shard}"))
+
+    if num_workers <= 1:
+        for job in jobs:
+            print("Generating YOLO data for", _shard_name(job["scene"], job["shard"], job["num_shards"]))
+            yolo_generate_dataset_for_scene(**job)
+    else:
+        print("Generating YOLO data for {} scenes ({} jobs) with {} workers"\
+              .format(len(scenes), len(jobs), num_workers))
+        with multiprocessing.Pool(num_workers) as pool:
+            for _ in tqdm(pool.imap_unordered(_yolo_generate_job, jobs), total=len(jobs)):
+                pass
+
+def _yolo_generate_job(job):
+    yolo_generate_dataset_for_scene(**job, show_progress=False)
 
 def yolo_generate_dataset_for_scene(datadir,
                                     scene,
@@ -69,7 +122,13 @@ def yolo_generate_dataset_for_scene(datadir,
                                     for_train,
                                     num_samples=100,
                                     v_angles=constants.V_ANGLES,
-                                    h_angles=constants.H_ANGLES):
+                                    h_angles=constants.H_ANGLES,
+                                    shard=0,
+                                    num_shards=1,
+                                    write_batch=32,
+                                    recording=None,
+                                    seed=None,
+                                    show_progress=True):
     """Places the agent at random position within the scene.
     Then, make the agent look around, for all possible
     horizontal and vertical angles. Then grab the frame and object
@@ -89,6 +148,11 @@ def yolo_generate_dataset_for_scene(datadir,
     says: YOLOv5 locates labels automatically for each image by replacing the
     last instance of /images/ in each image path with /labels/
 
+    Samples are written `write_batch` at a time, and then listed in the manifest
+    {datadir}/{type}/manifests/{scene}.jsonl (one line per sample with its file
+    name and pose). If the manifest exists, the samples in it are kept, and
+    generation continues with the positions not in it.
+
     Args:
         for_train (bool): True if use intending to use this dataset for training.
         objclasses (list): List of object classes we want to annotate.
@@ -96,25 +160,68 @@ def yolo_generate_dataset_for_scene(datadir,
             will be used as the integer class in the YOLO file format.
         v_angles (list): List of acceptable pitch angles
         h_angles (list): List of acceptable yaw angles
-
+        shard, num_shards (int): Only the reachable positions whose index (in
+            sorted order) modulo num_shards is shard are used. If num_shards > 1,
+            `scene` in the file names above becomes {scene}-s{shard}.
+        write_batch (int): number of samples kept in memory before writing
+        recording (str): If given, path to a recording of the scene to replay
+            with a FakeController instead of launching ai2thor.
+        seed: If given, seeds the sampling of positions.
     """
     objclasses = {objclasses[i]: i for i in range(len(objclasses))}  # convert the list to dict
-    thor_config = {**constants.CONFIG, **{"scene": scene}}
-    controller = launch_controller(thor_config)
-    reachable_positions = thor_reachable_positions(controller)
+    name = _shard_name(scene, shard, num_shards)
+    partition = "train" if for_train else "val"
+    datadir = os.path.join(datadir, partition)
+    os.makedirs(os.path.join(datadir, "images"), exist_ok=True)
+    os.makedirs(os.path.join(datadir, "labels"), exist_ok=True)
+    os.makedirs(os.path.join(datadir, MANIFESTS_DIR), exist_ok=True)
+    manifest_path = os.path.join(datadir, MANIFESTS_DIR, name + ".jsonl")
+    completed = _yolo_load_manifest(manifest_path)
+    if len(completed) >= num_samples:
+        print("{} already has {} samples".format(name, len(completed)))
+        return
+
+    if recording is not None:
+        controller = FakeController(recording)
+    else:
+        thor_config = {**constants.CONFIG, **{"scene": scene}}
+        controller = launch_controller(thor_config)
+    reachable_positions = sorted(thor_reachable_positions(controller))[shard::num_shards]
+    visited = {tuple(entry["pose"][:2]) for entry in completed}
+    positions = [pos for pos in reachable_positions if pos not in visited]
+    random.Random(seed).shuffle(positions)
+
+    _count = len(completed)
+    _pbar = tqdm(total=num_samples, initial=_count, disable=not show_progress)
+    batch = []  # list of (file_name, img, annotations, pose)
+    for img, annotations, pose in _yolo_examples(controller, positions, objclasses,
+                                                 v_angles, h_angles):
+        batch.append(("{}-img{}".format(name, _count), img, annotations, pose))
+        _count += 1
+        _pbar.update(1)
+        if len(batch) >= write_batch:
+            _yolo_write_examples(datadir, manifest_path, batch)
+            batch = []
+        if _count >= num_samples:
+            break
+    _yolo_write_examples(datadir, manifest_path, batch)
+    _pbar.close()
+    controller.stop()
+    if _count < num_samples:
+        print("Warning: {} has only {} samples; no more positions to sample."\
+              .format(name, _count))
+
+def _shard_name(scene, shard, num_shards):
+    return scene if num_shards == 1 else "{}-s{}".format(scene, shard)
+
+def _yolo_examples(controller, positions, objclasses, v_angles, h_angles):
+    """Yields (img, annotations, pose) for every position, pitch and yaw
+    where at least one object of objclasses is in view."""
     agent_pose = thor_agent_pose(controller.last_event)
-    examples = []  # list of (img, annotations)
     y = agent_pose[0]['y']
     roll = agent_pose[1]['z']
     _body_pitch = agent_pose[1]['x']
-    _count = 0
-    _chosen = set()
-    _pbar = tqdm(total=num_samples)
-    while _count < num_samples:
-        x, z = random.sample(reachable_positions, 1)[0]
-        if (x, z) in _chosen:
-            continue
-        _chosen.add((x,z))
+    for x, z in positions:
         for pitch in v_angles:
             for yaw in h_angles:
                 event = thor_teleport(controller,
@@ -132,24 +239,28 @@ def yolo_generate_dataset_for_scene(datadir,
                             xyxy_to_normalized_xywh(bbox2D, img.shape[:2], center=True)
                         annotations.append([class_int, x_center, y_center, w, h])
                 if len(annotations) > 0:
-                    examples.append((img, annotations))
-                    _count += 1
-                    _pbar.update(1)
-    _pbar.close()
-    controller.stop()
-    # Output the data
-    partition = "train" if for_train else "val"
-    datadir = os.path.join(datadir, partition)
-    os.makedirs(os.path.join(datadir, "images"), exist_ok=True)
-    os.makedirs(os.path.join(datadir, "labels"), exist_ok=True)
-    for i, (img, annotations) in enumerate(examples):
-        file_name = "{}-img{}".format(scene, i)
+                    yield img, annotations, (x, z, pitch, yaw)
+
+def _yolo_write_examples(datadir, manifest_path, examples):
+    """Writes the examples, then lists them in the manifest; So the
+    manifest only contains samples whose files are complete."""
+    for file_name, img, annotations, _ in examples:
         img_path = os.path.join(datadir, "images", file_name + ".jpg")
         annotations_path = os.path.join(datadir, "labels", file_name + ".txt")
         saveimg(img, img_path)
         with open(annotations_path, "w") as f:
             for row in annotations:
                 f.write(" ".join(map(str, row)) + "\n")
+    with open(manifest_path, "a") as f:
+        for file_name, _, _, pose in examples:
+            f.write(json.dumps({"file": file_name, "pose": pose}) + "\n")
+
+def _yolo_load_manifest(manifest_path):
+    """Returns the list of samples (dicts with 'file' and 'pose') in the manifest"""
+    if not os.path.exists(manifest_path):
+        return []
+    with open(manifest_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
 
 
 if __name__ == "__main__":
@@ -178,6 +289,15 @@ if __name__ == "__main__":
                         "samples per scene", default=120)
     parser.add_argument("--num-val-samples", type=int, help="Number of validation."
                         "samples per scene", default=40)
+    parser.add_argument("--num-workers", type=int, default=1,
+                        help="Number of scenes (or shards) generated at the same time")
+    parser.add_argument("--shards-per-scene", type=int, default=1,
+                        help="Split the positions of each scene among this many jobs")
+    parser.add_argument("--write-batch", type=int, default=32,
+                        help="Number of samples kept in memory before writing")
+    parser.add_argument("--recordings-dir", type=str, default=None,
+                        help="Directory of scene recordings to replay instead of running ai2thor")
+    parser.add_argument("--seed", type=int, default=None)
     args = parser.parse_args()
     if args.name is None:
         args.name = args.model
@@ -221,10 +341,15 @@ if __name__ == "__main__":
     print("Building training dataset")
     abs_outdir = os.path.abspath(args.outdir)
     yolo_create_dataset_yaml(abs_outdir, object_classes)
+    parallel_args = dict(num_workers=args.num_workers,
+                         shards_per_scene=args.shards_per_scene,
+                         write_batch=args.write_batch,
+                         recordings_dir=args.recordings_dir,
+                         seed=args.seed)
     yolo_generate_dataset(abs_outdir, scenes["train"], object_classes, True,
-                          num_samples=args.num_train_samples)
+                          num_samples=args.num_train_samples, **parallel_args)
     print("--------------------------------------------------------")
     print("Building val dataset")
     yolo_create_dataset_yaml(abs_outdir, object_classes)
     yolo_generate_dataset(abs_outdir, scenes["val"], object_classes, False,
-                          num_samples=args.num_val_samples)
+                          num_samples=args.num_val_samples, **parallel_args)
@@ -17,11 +17,11 @@
 # "ModuleNotFoundError: No module named 'models.yolo'"
 # You may want to check if there is any conflict in you
 # sys.path in which there is a module named 'models'.
-import torch
 import numpy as np
-import cv2
 from PIL import Image
 import yaml
+import math
+from collections import OrderedDict
 import thortils as tt
 from thortils.vision.plotting import plot_one_box
 from thortils.vision.general import saveimg, shrink_bbox
@@ -34,15 +34,99 @@ from .paths import YOLOV5_REPO_PATH
 def _2d(position):
     return position[0], position[2]
 
+
+class DetectionLog:
+    """
+    Counts how many times each class is detected at each location.
+    A detection within `sep` (3D) of a recorded location of the same class
+    counts towards that location. Recorded locations are bucketed in a
+    spatial hash keyed by class and horizontal (x, z) grid cell of size
+    `sep`, so looking up the locations near a detection only visits the
+    3x3 cells around it, regardless of how many locations are recorded.
+
+    If `window` is given, a location that has not been detected in
+    the last `window` calls to tick() is forgotten.
+    """
+    def __init__(self, sep, window=None):
+        self._sep = sep
+        self._cell_size = sep if sep > 0 else 1.0
+        self._window = window
+        self._buckets = {}  # maps from (cls, cell) -> {loc -> count}
+        self._last_seen = OrderedDict()  # (cls, loc) -> time; least recent first
+        self._time = 0
+
+    def _cell(self, loc):
+        return (math.floor(loc[0] / self._cell_size),
+                math.floor(loc[2] / self._cell_size))
+
+    def _nearby(self, cls, loc):
+        """Yields recorded locations of `cls` within `sep` of `loc` horizontally"""
+        cx, cz = self._cell(loc)
+        for dx in (-1, 0, 1):
+            for dz in (-1, 0, 1):
+                bucket = self._buckets.get((cls, (cx + dx, cz + dz)))
+                if bucket is None:
+                    continue
+                for recorded in bucket:
+                    if euclidean_dist(_2d(recorded), _2d(loc)) <= self._sep:
+                        yield recorded
+
+    def closest(self, cls, loc):
+        """Returns the recorded location of `cls` closest to `loc`
+        among those within `sep` horizontally, or None"""
+        return min(self._nearby(cls, loc),
+                   key=lambda recorded: euclidean_dist(recorded, loc),
+                   default=None)
+
+    def record(self, cls, loc):
+        closest = self.closest(cls, loc)
+        if closest is not None and euclidean_dist(closest, loc) <= self._sep:
+            loc = closest
+        bucket = self._buckets.setdefault((cls, self._cell(loc)), {})
+        bucket[loc] = bucket.get(loc, 0) + 1
+        self._last_seen[(cls, loc)] = self._time
+        self._last_seen.move_to_end((cls, loc))
+
+    def count(self, cls, loc):
+        """Returns the number of detections of `cls` recorded at
+        the location closest to `loc` (within `sep`), or 0"""
+        closest = self.closest(cls, loc)
+        if closest is None:
+            return 0
+        return self._buckets[(cls, self._cell(closest))][closest]
+
+    def tick(self):
+        """Advances time by one step; Forgets the locations
+        that are not detected within the window."""
+        self._time += 1
+        if self._window is None:
+            return
+        while len(self._last_seen) > 0:
+            (cls, loc), t = next(iter(self._last_seen.items()))
+            if self._time - t <= self._window:
+                break
+            self._last_seen.popitem(last=False)
+            key = (cls, self._cell(loc))
+            del self._buckets[key][loc]
+            if len(self._buckets[key]) == 0:
+                del self._buckets[key]
+
+    def __len__(self):
+        return len(self._last_seen)
+
 class Detector:
     def __init__(self,
                  detectables="any", detection_ranges={},
                  bbox_margin=0.0, visualize=False,
                  detection_sep=GRID_SIZE,
-                 max_repeated_detections=100):
+                 max_repeated_detections=100,
+                 detection_log_window=None):
         """
         detection_ranges (dict): maps from cls -> expected distance of detection
             detections beyond this range will be dropped.
+        detection_log_window (int): If not None, a location where
+            detections are recorded is forgotten if nothing is detected
+            there for this many calls of record_detections.
         """
         self._bbox_margin = bbox_margin
         self.detectable_classes = detectables
@@ -50,7 +134,8 @@ class Detector:
         self._detection_sep = detection_sep
         self._max_repeated_detections = max_repeated_detections
         self._detection_ranges = detection_ranges
-        self._log = {}  # maps from cls -> set(locations it was detected)
+        # counts of detections of each class at the locations it was detected
+        self._log = DetectionLog(detection_sep, window=detection_log_window)
 
     def detectable(self, cls):
         if self.detectable_classes == "any":
@@ -123,33 +208,15 @@ class Detector:
                 continue
 
             avg_loc = self._avg_loc(thor_locs)
-            if cls not in self._log:
-                self._log[cls] = {avg_loc : 1}
-            else:
-                closest = min(self._log[cls].keys(),
-                              key=lambda loc: euclidean_dist(loc, avg_loc))
-                if euclidean_dist(closest, avg_loc) <= self._detection_sep:
-                    self._log[cls][closest] += 1
-                else:
-                    self._log[cls][avg_loc] = 1
+            self._log.record(cls, avg_loc)
+        self._log.tick()
 
     def is_overly_repeated_detection(self, detection):
         if len(detection) == 3:
             print("WARNING: cannot check detection repetition it doesn't contain locations")
         xyxy, conf, cls, thor_locs = detection
         avg_loc = self._avg_loc(thor_locs)
-        if cls not in self._log:
-            return False
-
-        closest = min(self._log[cls].keys(),
-                      key=lambda loc: euclidean_dist(loc, avg_loc))
-        if euclidean_dist(_2d(closest), _2d(avg_loc)) <= self._detection_sep:
-            avg_loc = closest
-
-        if avg_loc not in self._log[cls]:
-            return False
-        else:
-            return self._log[cls][avg_loc] > self._max_repeated_detections
+        return self._log.count(cls, avg_loc) > self._max_repeated_detections
 
     def within_expected_range(self, detection, camera_position):
         xyxy, conf, cls, thor_locs = detection
@@ -212,6 +279,7 @@ class YOLODetector(Detector):
         print("Loading YOLOv5 vision detector...")
         print(f"    model path: {model_path}")
         print(f"    data config: {data_config}")
+        import torch  # slow to import; only needed by the YOLO detector
         self.model = torch.hub.load(YOLOV5_REPO_PATH, 'custom',
                                     path=self.model_path,
                                     source="local")
@@ -223,6 +291,50 @@ class YOLODetector(Detector):
         """
         results = self.model(frame)
         preds = results.pred[0]  # get the prediction tensor
+        detections = self._process_preds(preds)
+
+        if visualize is None:
+            visualize = self._visualize
+
+        if visualize:
+            self._visualize_detections(frame, detections)
+        return detections
+
+    def detect_batch(self, frames, batch_size=16):
+        """
+        Detects objects in each frame, running the model on up to
+        `batch_size` frames at a time. The result for each frame is the
+        same as detect(frame, visualize=False).
+
+        Frames of different sizes are never batched together, so
+        that every frame is resized and padded (letterboxed) by the
+        model exactly as it is when passed alone.
+
+        Args:
+            frames (list): list of RGB image arrays
+            batch_size (int): maximum number of frames per forward pass
+        Returns:
+            list: the detections for each frame, in the order of `frames`.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1; got {}".format(batch_size))
+        by_shape = {}
+        for i, frame in enumerate(frames):
+            by_shape.setdefault(np.shape(frame), []).append(i)
+
+        outputs = [None] * len(frames)
+        for indices in by_shape.values():
+            for start in range(0, len(indices), batch_size):
+                chunk = indices[start:start+batch_size]
+                results = self.model([frames[i] for i in chunk])
+                for j, i in enumerate(chunk):
+                    outputs[i] = self._process_preds(results.pred[j])
+        return outputs
+
+    def _process_preds(self, preds):
+        """Given the prediction tensor of the model for a frame, returns
+        the most confident detection above threshold for each detectable class"""
+        import torch
         detections = [(torch.round(preds[i][:4]).cpu().detach().numpy(),  # bounding box
                        float(preds[i][4]),  # confidence
                        self.classes[int(preds[i][5])])
@@ -245,12 +357,6 @@ class YOLODetector(Detector):
                 processed2.append(chosen)
             else:
                 processed2.append(processed1[cls][0])
-
-        if visualize is None:
-            visualize = self._visualize
-
-        if visualize:
-            self._visualize_detections(frame, processed2)
         return processed2
 
     def detect_project(self, frame, depth_frame, camera_intrinsic, camera_pose):
@@ -273,6 +379,7 @@ class YOLODetector(Detector):
 
 
     def _visualize_detections(self, frame, detections):
+        import cv2
         img = self.plot_detections(frame, detections)
         cv2.imshow("yolov5", img)
         cv2.waitKey(50)
@@ -348,6 +455,7 @@ class GroundtruthDetector(Detector):
                                for d in detections]
         else:
             _viz_detections = detections
+        import cv2
         img = self.plot_detections(frame, _viz_detections)
         cv2.imshow("groundtruth", img)
         cv2.waitKey(50)
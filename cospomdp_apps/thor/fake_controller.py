@@ -0,0 +1,432 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A fake ai2thor controller that replays a recorded scene without
+rendering, so that ThorTrials can run on machines without a Unity
+binary (e.g. for benchmarking). A recording is a directory with:
+
+    scene.json      scene name, initialization parameters, initial
+                    agent pose, reachable positions and object metadata
+    grid_map.json   (optional) the GridMap of the scene
+    frames/         (optional) pre-recorded frames, one .npz per camera pose
+
+Record one from a real controller by
+
+    python -m cospomdp_apps.thor.fake_controller FloorPlan1 ./recordings/FloorPlan1
+
+When a frame is not recorded for the current camera pose, the RGB frame
+is blank, and the depth frame and the 2D bounding boxes are synthesized
+by projecting the objects in the field of view onto the image (there is
+no occlusion, except for objects inside closed receptacles).
+"""
+import os
+import json
+import math
+import argparse
+import numpy as np
+from ai2thor.controller import Controller
+from ai2thor.server import Event
+
+import thortils as tt
+from . import constants
+
+SCENE_FILE = "scene.json"
+GRID_MAP_FILE = "grid_map.json"
+FRAMES_DIR = "frames"
+
+# how far (thor units) behind the farthest visible surface the synthesized
+# depth frame places the background.
+BACKGROUND_DEPTH = 10.0
+
+
+class FakeController(Controller):
+    """
+    Drop-in replacement of ai2thor's Controller backed by a recording.
+    It subclasses Controller (so that thortils treats it as a controller)
+    but never launches Unity. Supported actions are movements, rotations,
+    looks, Pass, Teleport(Full), GetReachablePositions and Open/CloseObject;
+    Other actions fail (lastActionSuccess is False) without changing anything.
+    """
+    def __init__(self, recording_dir):
+        with open(os.path.join(recording_dir, SCENE_FILE)) as f:
+            rec = json.load(f)
+        self.recording_dir = recording_dir
+        self.scene = rec["scene"]
+        self.initialization_parameters = rec["initialization_parameters"]
+        self.server = None
+
+        params = self.initialization_parameters
+        self._grid_size = params["gridSize"]
+        self._width = params["width"]
+        self._height = params["height"]
+        self._fov = params["fieldOfView"]
+        self._visibility_distance = params["visibilityDistance"]
+        self._camera_height = rec["camera_height"]
+
+        self._reachable_positions = rec["reachable_positions"]
+        self._reachable_cells = {self._cell(p["x"], p["z"])
+                                 for p in self._reachable_positions}
+        self._objects = {obj["objectId"]: dict(obj) for obj in rec["objects"]}
+
+        gmap_path = os.path.join(recording_dir, GRID_MAP_FILE)
+        self.grid_map = tt.GridMap.load(gmap_path) if os.path.exists(gmap_path) else None
+        self._frames_dir = os.path.join(recording_dir, FRAMES_DIR)
+        self._blank_frame = np.zeros((self._height, self._width, 3), dtype=np.uint8)
+
+        agent = rec["agent"]
+        self._position = dict(agent["position"])
+        self._rotation = dict(agent["rotation"])
+        self._horizon = agent["cameraHorizon"]
+        self.last_event = self._make_event("Initialize", True)
+
+    def _cell(self, x, z):
+        return (int(round(x / self._grid_size)), int(round(z / self._grid_size)))
+
+    def reset(self, scene=None, **init_params):
+        if scene is not None and scene != self.scene:
+            raise ValueError("FakeController recorded {} cannot reset to {}"\
+                             .format(self.scene, scene))
+        return self.last_event
+
+    def stop(self):
+        pass
+
+    def step(self, action=None, **action_args):
+        if isinstance(action, dict):
+            action_args = {**action, **action_args}
+            action = action_args.pop("action")
+
+        success, error, action_return = True, "", None
+        if action == "Pass":
+            pass
+        elif action in {"MoveAhead", "MoveBack", "MoveLeft", "MoveRight"}:
+            success = self._move(action, action_args.get("moveMagnitude", self._grid_size))
+        elif action in {"RotateLeft", "RotateRight"}:
+            degrees = action_args.get("degrees", constants.H_ROTATION)
+            sign = 1 if action == "RotateRight" else -1
+            self._rotation["y"] = (self._rotation["y"] + sign*degrees) % 360
+        elif action in {"LookUp", "LookDown"}:
+            degrees = action_args.get("degrees", constants.V_ROTATION)
+            sign = 1 if action == "LookDown" else -1
+            horizon = self._horizon + sign*degrees
+            if min(constants.V_ANGLES) <= horizon <= max(constants.V_ANGLES):
+                self._horizon = horizon
+            else:
+                success = False
+        elif action in {"Teleport", "TeleportFull"}:
+            success = self._teleport(**action_args)
+        elif action == "GetReachablePositions":
+            action_return = [dict(p) for p in self._reachable_positions]
+        elif action in {"OpenObject", "CloseObject"}:
+            success = self._open_close(action_args.get("objectId"),
+                                       action == "OpenObject")
+        else:
+            success = False
+            error = "Action {} is not supported by FakeController".format(action)
+
+        if not success and not error:
+            error = "{} failed".format(action)
+        self.last_event = self._make_event(action, success,
+                                           error=error, action_return=action_return)
+        return self.last_event
+
+    def _move(self, action, magnitude):
+        yaw = math.radians(self._rotation["y"])
+        forward = (math.sin(yaw), math.cos(yaw))
+        right = (math.cos(yaw), -math.sin(yaw))
+        direction = {"MoveAhead": forward,
+                     "MoveBack": (-forward[0], -forward[1]),
+                     "MoveRight": right,
+                     "MoveLeft": (-right[0], -right[1])}[action]
+        x = self._position["x"] + magnitude*direction[0]
+        z = self._position["z"] + magnitude*direction[1]
+        if self._cell(x, z) not in self._reachable_cells:
+            return False
+        self._position["x"] = round(x, 4)
+        self._position["z"] = round(z, 4)
+        return True
+
+    def _teleport(self, position=None, rotation=None, horizon=None, **kwargs):
+        if position is not None:
+            if not isinstance(position, dict):
+                position = dict(zip("xyz", position))
+            if self._cell(position["x"], position["z"]) not in self._reachable_cells:
+                return False
+            self._position = dict(x=position["x"],
+                                  y=position.get("y", self._position["y"]),
+                                  z=position["z"])
+        if rotation is not None:
+            if isinstance(rotation, dict):
+                yaw = rotation["y"]
+            elif hasattr(rotation, "__len__"):
+                yaw = rotation[1]
+            else:
+                yaw = rotation
+            self._rotation["y"] = yaw % 360
+        if horizon is not None:
+            self._horizon = horizon
+        return True
+
+    def _open_close(self, object_id, open_it):
+        obj = self._objects.get(object_id)
+        if obj is None or not obj.get("openable", False):
+            return False
+        obj["isOpen"] = open_it
+        return True
+
+    # --- Observation --- #
+    def _camera_position(self):
+        return dict(x=self._position["x"],
+                    y=self._position["y"] + self._camera_height,
+                    z=self._position["z"])
+
+    def _camera_axes(self):
+        """Returns the right, up and forward unit vectors (in thor's
+        x, y, z frame) of the camera."""
+        yaw = math.radians(self._rotation["y"])
+        pitch = math.radians(self._horizon)  # positive looks down
+        forward_h = np.array([math.sin(yaw), 0.0, math.cos(yaw)])
+        right = np.array([math.cos(yaw), 0.0, -math.sin(yaw)])
+        forward = math.cos(pitch)*forward_h + np.array([0.0, -math.sin(pitch), 0.0])
+        up = math.sin(pitch)*forward_h + np.array([0.0, math.cos(pitch), 0.0])
+        return right, up, forward
+
+    def _focal_length(self):
+        return (self._height / 2) / math.tan(math.radians(self._fov / 2))
+
+    def _project(self, points):
+        """Projects thor points (N x 3) onto the image; Returns
+        pixel coordinates u, v and depth (N,) arrays."""
+        c = self._camera_position()
+        d = np.asarray(points, dtype=float) - np.array([c["x"], c["y"], c["z"]])
+        right, up, forward = self._camera_axes()
+        depth = d @ forward
+        f = self._focal_length()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            u = self._width / 2 + f * (d @ right) / depth
+            v = self._height / 2 - f * (d @ up) / depth
+        return u, v, depth
+
+    def _enclosed(self, obj):
+        """True if the object is inside a closed receptacle"""
+        for parent_id in obj.get("parentReceptacles") or []:
+            parent = self._objects.get(parent_id)
+            if parent is not None and parent.get("openable", False)\
+               and not parent.get("isOpen", False):
+                return True
+        return False
+
+    def _object_points(self, obj):
+        bbox = obj.get("axisAlignedBoundingBox")
+        if bbox is not None and bbox.get("cornerPoints"):
+            return np.array(bbox["cornerPoints"]), bbox["center"]
+        p = obj["position"]
+        h = self._grid_size / 4
+        corners = [(p["x"] + sx*h, p["y"] + sy*h, p["z"] + sz*h)
+                   for sx in (-1, 1) for sy in (-1, 1) for sz in (-1, 1)]
+        return np.array(corners), p
+
+    def _synthesize_detections(self):
+        """Returns {objectId -> (x1, y1, x2, y2)} and a depth frame,
+        by projecting objects within the visibility distance"""
+        c = self._camera_position()
+        cpos = np.array([c["x"], c["y"], c["z"]])
+        boxes, depths = {}, {}
+        for object_id, obj in self._objects.items():
+            corners, center = self._object_points(obj)
+            center = np.array([center["x"], center["y"], center["z"]])
+            if np.linalg.norm(center - cpos) > self._visibility_distance\
+               or self._enclosed(obj):
+                continue
+            u, v, depth = self._project(np.vstack([corners, center]))
+            if depth[-1] <= 0:
+                continue
+            u, v = u[:-1][depth[:-1] > 0], v[:-1][depth[:-1] > 0]
+            x1, x2 = max(0, int(np.min(u))), min(self._width - 1, int(np.max(u)))
+            y1, y2 = max(0, int(np.min(v))), min(self._height - 1, int(np.max(v)))
+            if x1 >= x2 or y1 >= y2:
+                continue
+            boxes[object_id] = (x1, y1, x2, y2)
+            depths[object_id] = depth[-1]
+
+        depth_frame = np.full((self._height, self._width), BACKGROUND_DEPTH, dtype=np.float32)
+        # paint far to near so that nearer objects cover farther ones
+        for object_id in sorted(boxes, key=lambda oid: -depths[oid]):
+            x1, y1, x2, y2 = boxes[object_id]
+            depth_frame[y1:y2+1, x1:x2+1] = depths[object_id]
+        return boxes, depth_frame
+
+    def _frame_path(self):
+        return os.path.join(self._frames_dir,
+                            pose_key(self._position, self._rotation, self._horizon) + ".npz")
+
+    def _make_event(self, action, success, error="", action_return=None):
+        frame_path = self._frame_path()
+        if os.path.exists(frame_path):
+            recorded = np.load(frame_path)
+            frame = recorded["frame"]
+            depth_frame = recorded["depth_frame"]
+            boxes = {str(oid): tuple(int(b) for b in box)
+                     for oid, box in zip(recorded["object_ids"], recorded["boxes"])}
+        else:
+            frame = self._blank_frame
+            boxes, depth_frame = self._synthesize_detections()
+
+        c = self._camera_position()
+        objects = []
+        for object_id, obj in self._objects.items():
+            p = obj["position"]
+            obj = dict(obj)
+            obj["distance"] = math.sqrt((p["x"] - c["x"])**2
+                                        + (p["y"] - c["y"])**2
+                                        + (p["z"] - c["z"])**2)
+            obj["visible"] = object_id in boxes\
+                and obj["distance"] <= self._visibility_distance
+            objects.append(obj)
+
+        metadata = {
+            "agent": {"position": dict(self._position),
+                      "rotation": dict(self._rotation),
+                      "cameraHorizon": self._horizon,
+                      "isStanding": True},
+            "cameraPosition": c,
+            "objects": objects,
+            "sceneName": self.scene,
+            "lastAction": action,
+            "lastActionSuccess": success,
+            "errorMessage": error,
+            "actionReturn": action_return,
+            "fov": self._fov,
+            "screenWidth": self._width,
+            "screenHeight": self._height,
+        }
+        event = Event(metadata)
+        event.frame = frame
+        event.depth_frame = depth_frame
+        event.instance_detections2D = boxes
+        return event
+
+
+def pose_key(position, rotation, horizon):
+    """Key of a recorded frame for the given camera pose"""
+    return "{:.2f}_{:.2f}_{}_{}".format(position["x"], position["z"],
+                                        int(round(rotation["y"])) % 360,
+                                        int(round(horizon)))
+
+
+def save_recording(savedir, scene, initialization_parameters, agent,
+                   camera_height, reachable_positions, objects, grid_map=None):
+    """
+    Saves a recording that FakeController can load.
+
+    Args:
+        savedir (str): directory of the recording
+        scene (str): e.g. FloorPlan1
+        initialization_parameters (dict): must contain gridSize, width, height,
+            fieldOfView and visibilityDistance.
+        agent (dict): initial agent metadata, with position, rotation and cameraHorizon
+        camera_height (float): height of the camera above the agent position
+        reachable_positions (list): list of dict(x=,y=,z=)
+        objects (list): object metadata (ai2thor's event.metadata['objects'])
+        grid_map (GridMap): saved if provided.
+    """
+    os.makedirs(savedir, exist_ok=True)
+    rec = dict(scene=scene,
+               initialization_parameters=initialization_parameters,
+               agent={"position": agent["position"],
+                      "rotation": agent["rotation"],
+                      "cameraHorizon": agent["cameraHorizon"]},
+               camera_height=camera_height,
+               reachable_positions=reachable_positions,
+               objects=objects)
+    with open(os.path.join(savedir, SCENE_FILE), "w") as f:
+        json.dump(rec, f)
+    if grid_map is not None:
+        grid_map.save(os.path.join(savedir, GRID_MAP_FILE))
+
+
+def save_frame(savedir, event):
+    """Saves the frames of the event (from a real controller) under
+    the recording at `savedir`, keyed by the camera pose."""
+    agent = event.metadata["agent"]
+    framesdir = os.path.join(savedir, FRAMES_DIR)
+    os.makedirs(framesdir, exist_ok=True)
+    detections = event.instance_detections2D or {}
+    object_ids = list(detections.keys())
+    np.savez_compressed(
+        os.path.join(framesdir, pose_key(agent["position"],
+                                         agent["rotation"],
+                                         agent["cameraHorizon"]) + ".npz"),
+        frame=event.frame,
+        depth_frame=event.depth_frame,
+        object_ids=np.array(object_ids, dtype=str),
+        boxes=np.array([detections[oid] for oid in object_ids], dtype=int).reshape(-1, 4))
+
+
+def record_scene(controller, savedir, grid_map=None, frames=False,
+                 h_angles=constants.H_ANGLES, v_angles=constants.V_ANGLES):
+    """
+    Records the scene loaded in the (real) controller at `savedir`.
+    If `frames` is True, the frames at every reachable position,
+    yaw in `h_angles` and pitch in `v_angles` are also recorded
+    (this may take a while and a lot of disk space).
+    """
+    event = controller.step(action="Pass")
+    agent = event.metadata["agent"]
+    camera_height = event.metadata["cameraPosition"]["y"] - agent["position"]["y"]
+    reachable_positions = controller.step(action="GetReachablePositions").metadata["actionReturn"]
+    params = controller.initialization_parameters
+    initialization_parameters = dict(gridSize=params.get("gridSize", constants.GRID_SIZE),
+                                     width=event.screen_width,
+                                     height=event.screen_height,
+                                     fieldOfView=event.metadata["fov"],
+                                     visibilityDistance=params.get("visibilityDistance",
+                                                                   constants.VISIBILITY_DISTANCE))
+    save_recording(savedir, tt.thor_scene_from_controller(controller),
+                   initialization_parameters, agent, camera_height,
+                   reachable_positions, event.metadata["objects"], grid_map=grid_map)
+    if frames:
+        for position in reachable_positions:
+            for yaw in h_angles:
+                for pitch in v_angles:
+                    event = controller.step(action="TeleportFull",
+                                            position=position,
+                                            rotation=dict(x=0, y=yaw, z=0),
+                                            horizon=pitch, standing=True)
+                    if event.metadata["lastActionSuccess"]:
+                        save_frame(savedir, event)
+        controller.step(action="TeleportFull",
+                        position=agent["position"],
+                        rotation=agent["rotation"],
+                        horizon=agent["cameraHorizon"], standing=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record a scene for FakeController")
+    parser.add_argument("scene", type=str, help="e.g. FloorPlan1")
+    parser.add_argument("savedir", type=str, help="directory to save the recording")
+    parser.add_argument("--frames", action="store_true",
+                        help="also record frames at every reachable camera pose")
+    args = parser.parse_args()
+
+    config = {**constants.CONFIG, **{"scene": args.scene}}
+    controller = tt.launch_controller(config)
+    grid_map = tt.proper_convert_scene_to_grid_map(controller, constants.GRID_SIZE)
+    record_scene(controller, args.savedir, grid_map=grid_map, frames=args.frames)
+    controller.stop()
+    print("Recorded {} at {}".format(args.scene, args.savedir))
+
+if __name__ == "__main__":
+    main()
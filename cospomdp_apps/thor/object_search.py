@@ -31,12 +31,14 @@ import thortils.vision.projection as pj
 from thortils.vision.general import saveimg
 from thortils.vision import thor_img, thor_img_depth, thor_topdown_img
 from thortils.utils.visual import GridMapVisualizer
+from cospomdp.utils.async_writer import AsyncWriter, DROP_NEWEST
 
 from .result_types import PathResult, HistoryResult
 from .common import ThorEnv, TOS_Action, TOS_State, TOS_Observation, ThorAgent
 from .agent import ThorObjectSearchOptimalAgent
 from .visual import ThorObjectSearchViz2D
 from .detector import YOLODetector, GroundtruthDetector
+from .assets import get_asset
 from . import paths
 from . import constants
 
@@ -90,9 +92,12 @@ class TOS(ThorEnv):
             elif item.lower() == "grid_map":
                 grid_maps_path = paths.GRID_MAPS_PATH
                 gmap_path = os.path.join(grid_maps_path, "{}-{}.json".format(scene, grid_size))
-                if os.path.exists(gmap_path):
+                if getattr(self.controller, "grid_map", None) is not None:
+                    # e.g. a FakeController replaying a recording
+                    grid_map = self.controller.grid_map
+                elif os.path.exists(gmap_path):
                     print("Loading GridMap from {}".format(gmap_path))
-                    grid_map = tt.GridMap.load(gmap_path)
+                    grid_map = get_asset(gmap_path, lambda: tt.GridMap.load(gmap_path))
                 else:
                     print("Converting scene to GridMap...")
                     grid_map = tt.proper_convert_scene_to_grid_map(
@@ -203,14 +208,15 @@ class TOS(ThorEnv):
         if detector is None:
             detections = []
         else:
-            if isinstance(detector, GroundtruthDetector):
-                detections = detector.detect_project(
-                    event, self._camera_intrinsic, single_loc=False)
-            else:
-                camera_pose = tt.thor_camera_pose(event, as_tuple=True)
-                detections = detector.detect_project(img, event.depth_frame,
-                                                     self._camera_intrinsic,
-                                                     camera_pose)
+            with self.timer.timeit("detection"):
+                if isinstance(detector, GroundtruthDetector):
+                    detections = detector.detect_project(
+                        event, self._camera_intrinsic, single_loc=False)
+                else:
+                    camera_pose = tt.thor_camera_pose(event, as_tuple=True)
+                    detections = detector.detect_project(img, event.depth_frame,
+                                                         self._camera_intrinsic,
+                                                         camera_pose)
             # logging the detections
             if record_detections:
                 camera_position = tt.thor_camera_position(event, as_tuple=True)
@@ -375,6 +381,13 @@ class ThorObjectSearchTrialSaver:
         self.savedir = savedir
         self._generate_gif = kwargs.get("gif", False)
         self._frame_duration = kwargs.get("duration", 0.2)
+        # Images are plotted, encoded and saved in a background thread,
+        # so that the trial does not wait for them. If 'max_queue' steps
+        # are waiting to be saved, new steps are dropped (see AsyncWriter).
+        self._writer = None
+        if kwargs.get("async", True):
+            self._writer = AsyncWriter(max_queue=kwargs.get("max_queue", 64),
+                                       policy=kwargs.get("drop_policy", DROP_NEWEST))
 
         print(f"Will save the trial visualizations to {savedir}")
         os.makedirs(savedir, exist_ok=True)
@@ -400,25 +413,35 @@ class ThorObjectSearchTrialSaver:
                 self._log["object_detections"][cls].append(
                     ((conf, self.agent.detector._avg_loc(thor_locs))))
 
-        # First, save the img visulized by the visualizer
-        belief_path = os.path.join(self.beliefsdir, f"belief_{step:0>3}.png")
-        saveimg(img, belief_path)
-        print(f"Saved beliefs visualization for step {step}")
-
-        # Then, save the img from Ai2thor (both first person view and top-down view);
+        # Get the images that depend on the current state of the controller;
         # If it is the first step, then directly save the FPV from thor controller;
-        # Otherwise, get the object detection visualization from the detector
+        # Otherwise, plot the object detections on the observed image (in _save_images)
+        td_img = thor_topdown_img(controller, cv2=False)
         if step == 0:
             assert action is None and observation is None
             fp_img = thor_img(controller, cv2=False)
-            td_img = thor_topdown_img(controller, cv2=False)
+            detections = None
+        else:
+            fp_img = observation.img
+            detections = observation.detections
 
+        if self._writer is not None:
+            if not self._writer.submit(self._save_images, step, img, fp_img, detections, td_img):
+                print(f"Dropped visualizations of step {step} (too many waiting to be saved)")
         else:
+            self._save_images(step, img, fp_img, detections, td_img)
+
+    def _save_images(self, step, img, fp_img, detections, td_img):
+        # First, save the img visulized by the visualizer
+        belief_path = os.path.join(self.beliefsdir, f"belief_{step:0>3}.png")
+        saveimg(img, belief_path)
+        print(f"Saved beliefs visualization for step {step}")
+
+        # Then, save the img from Ai2thor (both first person view and top-down view);
+        if detections is not None:
             # Get the object detection visualization
-            fp_img = self.agent.detector.plot_detections(
-                observation.img, observation.detections)
+            fp_img = self.agent.detector.plot_detections(fp_img, detections)
             fp_img = cv2.cvtColor(fp_img, cv2.COLOR_BGR2RGB)
-            td_img = thor_topdown_img(controller, cv2=False)
 
         fp_path = os.path.join(self.fpdir, f"fpv_{step:0>3}.png")
         saveimg(fp_img, fp_path)
@@ -428,9 +451,13 @@ class ThorObjectSearchTrialSaver:
         saveimg(td_img, td_path)
         print(f"Saved top-down view image for step {step}")
 
-
     def finish(self):
         import imageio
+        if self._writer is not None:
+            # wait for the remaining images to be saved
+            self._writer.close()
+            if self._writer.dropped > 0:
+                print(f"Visualizations of {self._writer.dropped} steps were dropped")
 
         self.plot_trajectory(self._log["poses"],
                              self._log["object_detections"])
@@ -0,0 +1,199 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Runs many ThorTrials concurrently on one machine with a process pool.
+
+Read-only assets used by the trials (the vision detector, grid maps and
+tabular correlation distributions, see .assets) are loaded once in the
+parent process. Every trial then runs in a freshly forked worker, which
+shares that memory with the parent copy-on-write (correlation
+distributions with the 'dense' or 'sparse' backend are memory-mapped,
+so they are shared through the page cache anyway).
+
+Results are saved as soon as each trial finishes, in the same layout as
+sciex's trial_runner (<exp_path>/<trial name>/{config.yaml, log.txt, results}),
+so check_status.py and gather_results.py work as usual. Trials whose
+results already exist are skipped, so a stopped run can be resumed.
+
+Usage, on an experiment generated by sciex (e.g. experiments/thor/experiment_thor.py):
+
+    python -m cospomdp_apps.thor.parallel <exp_path> -p 8
+"""
+import os
+import gc
+import glob
+import shutil
+import pickle
+import argparse
+import traceback
+import multiprocessing
+from tqdm import tqdm
+import sciex
+from sciex.check_status import trial_completed
+from sciex.trial_runner import save_trial_results
+
+from .assets import get_asset
+from . import paths
+
+# Set in the parent process before forking; inherited by the workers.
+_WORKER_TRIALS = None
+_WORKER_RESOURCE = None
+_WORKER_EXP_PATH = None
+_WORKER_LOGGING = True
+
+
+def preload_assets(trials):
+    """
+    Loads the read-only assets used by `trials` in this process.
+    Returns the shared resource (i.e. vision detector) if any trial can
+    provide one, otherwise None.
+    """
+    resource = None
+    for trial in trials:
+        config = trial.config
+        task_config = config["task_config"]
+        scene = config["thor"]["scene"]
+        if resource is None and trial.could_provide_resource():
+            print("Loading shared resource (vision detector)")
+            resource = trial.provide_shared_resource()
+
+        if "grid_map" in config["agent_init_inputs"]\
+           and config["thor"].get("recording", None) is None:
+            gmap_path = os.path.join(paths.GRID_MAPS_PATH, "{}-{}.json"\
+                                     .format(scene, config["thor"]["GRID_SIZE"]))
+            if os.path.exists(gmap_path):
+                import thortils as tt
+                get_asset(gmap_path, lambda: tt.GridMap.load(gmap_path))
+
+        if task_config.get("save_load_corr", False)\
+           and task_config.get("corr_backend", "tabular") == "tabular":
+            import cospomdp
+            from .agent.cospomdp_basic import corr_dist_name
+            target = task_config["target"]
+            corr_specs = config["agent_config"].get("corr_specs", {})
+            for (obj1, obj2), (_, corr_func_args) in corr_specs.items():
+                if target not in (obj1, obj2):
+                    continue
+                other = obj2 if obj1 == target else obj1
+                cdist_path = os.path.join(
+                    paths.CORR_DISTS_PATH,
+                    corr_dist_name(scene, target, other, corr_func_args.get("type", None)) + ".pkl")
+                if os.path.exists(cdist_path):
+                    get_asset(cdist_path, lambda: cospomdp.CorrelationDist.load(cdist_path))
+    return resource
+
+
+def _run_trial_in_worker(index):
+    trial = _WORKER_TRIALS[index]
+    try:
+        trial.set_resource(_WORKER_RESOURCE)
+        results = trial.run(logging=_WORKER_LOGGING)
+        # the detector is not part of the configuration to save.
+        trial.config["task_config"]["detector_config"].pop("vision_detector", None)
+        save_trial_results(_WORKER_EXP_PATH, trial.name, results,
+                           trial.log, trial.config)
+        return trial.name, None
+    except Exception:
+        return trial.name, traceback.format_exc()
+
+
+def _prepare_exp_path(exp_path, trials):
+    """Writes what sciex's Experiment would have written to exp_path
+    (except the run scripts), if not present"""
+    for trial in trials:
+        trial_path = os.path.join(exp_path, trial.name)
+        trial.trial_path = trial_path
+        if not os.path.exists(os.path.join(trial_path, "trial.pkl")):
+            os.makedirs(trial_path, exist_ok=True)
+            with open(os.path.join(trial_path, "trial.pkl"), "wb") as f:
+                pickle.dump(trial, f)
+    for script in ["gather_results.py", "check_status.py"]:
+        if not os.path.exists(os.path.join(exp_path, script)):
+            shutil.copyfile(os.path.join(os.path.dirname(sciex.__file__), script),
+                            os.path.join(exp_path, script))
+
+
+def run_trials(trials, exp_path, num_workers=None, logging=True):
+    """
+    Runs `trials` with `num_workers` processes (default: number of CPUs)
+    and saves their results under `exp_path`.
+
+    Args:
+        trials (list): list of ThorTrial
+        exp_path (str): experiment directory. Trial pickles and sciex's
+            check_status.py and gather_results.py are written there if not present.
+        num_workers (int): number of trials run at the same time
+        logging (bool): passed to trial.run
+    Returns:
+        dict: maps from the name of each trial that failed to its traceback.
+    """
+    global _WORKER_TRIALS, _WORKER_RESOURCE, _WORKER_EXP_PATH, _WORKER_LOGGING
+    if num_workers is None:
+        num_workers = os.cpu_count()
+    _prepare_exp_path(exp_path, trials)
+
+    pending = [trial for trial in trials
+               if not trial_completed(os.path.join(exp_path, trial.name))]
+    if len(pending) < len(trials):
+        print("Skipping {} trials that are done".format(len(trials) - len(pending)))
+    if len(pending) == 0:
+        return {}
+
+    _WORKER_RESOURCE = preload_assets(pending)
+    _WORKER_TRIALS = pending
+    _WORKER_EXP_PATH = exp_path
+    _WORKER_LOGGING = logging
+    # Keeps the garbage collector of the workers from touching (and
+    # therefore copying) the objects loaded so far.
+    gc.freeze()
+
+    failed = {}
+    # maxtasksperchild=1: each trial runs in a fresh fork of this process,
+    # so trials are isolated as if run by separate scripts.
+    ctx = multiprocessing.get_context("fork")
+    with ctx.Pool(num_workers, maxtasksperchild=1) as pool:
+        for name, error in tqdm(pool.imap_unordered(_run_trial_in_worker, range(len(pending))),
+                                total=len(pending)):
+            if error is not None:
+                print("Trial {} failed:\n{}".format(name, error))
+                failed[name] = error
+    gc.unfreeze()
+    print("{} trials finished; {} failed.".format(len(pending) - len(failed), len(failed)))
+    return failed
+
+
+def load_trials(exp_path):
+    """Loads the trials (trial.pkl) of the experiment at exp_path"""
+    trials = []
+    for trial_pkl in sorted(glob.glob(os.path.join(exp_path, "*", "trial.pkl"))):
+        with open(trial_pkl, "rb") as f:
+            trials.append(pickle.load(f))
+    return trials
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the trials of an experiment in parallel.")
+    parser.add_argument("exp_path", type=str, help="Path to experiment root")
+    parser.add_argument("-p", "--num-workers", type=int, default=None,
+                        help="Number of trials to run at the same time (default: number of CPUs)")
+    parser.add_argument("--no-logging", action="store_true")
+    args = parser.parse_args()
+    trials = load_trials(args.exp_path)
+    print("Loaded {} trials from {}".format(len(trials), args.exp_path))
+    run_trials(trials, args.exp_path, num_workers=args.num_workers,
+               logging=not args.no_logging)
+
+if __name__ == "__main__":
+    main()
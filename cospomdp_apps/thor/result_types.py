@@ -12,17 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from thortils import compute_spl
 from cospomdp.utils.math import ci_normal, test_significance_pairwise
 from cospomdp_apps.thor.constants import SCENE_TYPES
 from sciex import Result, PklResult, YamlResult
-import ai2thor.util.metrics as metrics
-import pandas as pd
-import seaborn as sns
 import pickle
 import numpy as np
 import os
 
+# thortils, ai2thor and pandas are imported where they are used,
+# so that loading this module (e.g. to gather results) stays fast.
+
 # Note: For PklResult, it is not recommended to save the object directly
 # if it is of a custom class; Use it if you only save generic python objects
 # or popular objects like numpy arrays.
@@ -62,6 +61,7 @@ class PathResult(PklResult):
             actual_path (list): List of robot pose tuples (the actual)
             success (bool): Success/fail of the task
         """
+        import ai2thor.util.metrics as metrics
         self.shortest_path = shortest_path
         self.actual_path = actual_path
         self.success = success
@@ -127,6 +127,7 @@ class PathResult(PklResult):
     def gather(cls, results):
         """`results` is a mapping from specific_name to a dictionary {seed: actual_result}.
         Returns a more understandable interpretation of these results"""
+        from thortils import compute_spl
         rows = []
         for baseline in results:
             episode_results = []  # results for 'episodes' (i.e. individual search trials)
@@ -158,6 +159,7 @@ class PathResult(PklResult):
     @classmethod
     def save_gathered_results(cls, gathered_results, path):
         # Gathered results maps from global name to what is returned by gather()
+        import pandas as pd
         all_rows = []
         for global_name in gathered_results:
             scene_type, scene, target = global_name.split("-")
@@ -420,3 +422,65 @@ class HistoryResult(YamlResult):
             ret += step['reward']*discount
             discount *= self.discount_factor
         return ret
+
+
+class TimingResult(YamlResult):
+    def __init__(self, step_timings):
+        """step_timings is a list of {phase: seconds} dictionaries, one per
+        step, as recorded by the StepTimers of the agent and the task env.
+        Each also contains the 'step' index."""
+        self.step_timings = step_timings
+        super().__init__(step_timings)
+
+    @classmethod
+    def FILENAME(cls):
+        return "timings.yaml"
+
+    @staticmethod
+    def totals(step_timings):
+        """Returns {phase: total seconds} over all steps"""
+        totals = {}
+        for step in step_timings:
+            for phase in step:
+                if phase != "step":
+                    totals[phase] = totals.get(phase, 0.0) + step[phase]
+        return totals
+
+    @classmethod
+    def gather(cls, results):
+        """`results` is a mapping from specific_name to a dictionary {seed: actual_result}.
+        Returns a list of rows [baseline, phase, mean total (s), mean per step (s)]"""
+        rows = []
+        for baseline in results:
+            phase_totals = {}
+            phase_steps = {}
+            for seed in results[baseline]:
+                step_timings = results[baseline][seed]
+                totals = TimingResult.totals(step_timings)
+                for phase in totals:
+                    phase_totals.setdefault(phase, []).append(totals[phase])
+                    phase_steps.setdefault(phase, []).append(len(step_timings))
+            for phase in sorted(phase_totals):
+                rows.append([baseline, phase,
+                             np.mean(phase_totals[phase]),
+                             np.sum(phase_totals[phase]) / max(1, np.sum(phase_steps[phase]))])
+        return rows
+
+    @classmethod
+    def save_gathered_results(cls, gathered_results, path):
+        import pandas as pd
+        all_rows = []
+        for global_name in gathered_results:
+            for row in gathered_results[global_name]:
+                all_rows.append([global_name] + row)
+        df = pd.DataFrame(all_rows,
+                          columns=["global_name", "baseline", "phase",
+                                   "total_time", "time_per_step"])
+        df.to_csv(os.path.join(path, "timing_raw.csv"))
+        summary = df.groupby(["baseline", "phase"])\
+                    .agg({"total_time": ["mean", "std"],
+                          "time_per_step": ["mean", "std"]})
+        print(summary)
+        summary.to_csv(os.path.join(path, "timing_summary.csv"))
+        return os.path.join(path, "timing_summary.csv")
+
@@ -22,9 +22,11 @@ from pprint import pprint
 
 from cospomdp.utils.misc import _debug
 from cospomdp.utils import cfg
+from cospomdp.utils.timing import StepTimer
 cfg.DEBUG_LEVEL = 0
 
 from . import constants
+from .fake_controller import FakeController
 from .object_search import ThorObjectSearch
 from .agent import (ThorObjectSearchOptimalAgent,
                     ThorObjectSearchBasicCosAgent,
@@ -34,7 +36,7 @@ from .agent import (ThorObjectSearchOptimalAgent,
                     ThorObjectSearchGreedyNbvAgent,
                     ThorObjectSearchKeyboardAgent)
 from .replay import ReplaySolver
-from .result_types import PathResult, HistoryResult
+from .result_types import PathResult, HistoryResult, TimingResult
 from .common import make_config, TaskArgs, TOS_Action, ThorAgent
 
 class ThorTrial(Trial):
@@ -50,6 +52,10 @@ class ThorTrial(Trial):
         super().__init__(name, config, verbose=verbose)
 
     def _start_controller(self):
+        # If a recording is given, replay it without launching ai2thor.
+        recording = self.config["thor"].get("recording", None)
+        if recording is not None:
+            return FakeController(recording)
         controller = thortils.launch_controller(self.config["thor"])
         return controller
 
@@ -132,10 +138,15 @@ class ThorTrial(Trial):
         saver = components.get("saver", None)
 
         _actions = []
+        # per-step timings of act, update, and the phases recorded
+        # by the agent and task_env (e.g. planning, detection)
+        timer = StepTimer()
+        step_timings = []
 
         max_steps = self.config["max_steps"]
         for i in range(1, max_steps+1):
-            action = agent.act()
+            with timer.timeit("act"):
+                action = agent.act()
             if not logging:
                 a_str = action.name if not action.name.startswith("Open")\
                     else "{}({})".format(action.name, action.params)
@@ -150,7 +161,9 @@ class ThorTrial(Trial):
                     import pdb; pdb.set_trace()
 
             observation, reward = task_env.execute(agent, action)
-            agent.update(action, observation)
+            with timer.timeit("update"):
+                agent.update(action, observation)
+            step_timings.append(_end_step_timings(i, timer, agent, task_env))
 
             if logging:
                 _step_info = task_env.get_step_info(step=i)
@@ -177,6 +190,7 @@ class ThorTrial(Trial):
                     print(msg)
                 break
         results = task_env.compute_results()
+        results.append(TimingResult(step_timings))
         controller.stop()
         if self.config.get("visualize", False):
             viz.on_cleanup()
@@ -192,7 +206,18 @@ class ThorTrial(Trial):
 
 # ------------- Object search trial ------------- #
 class ThorObjectSearchTrial(ThorTrial):
-    RESULT_TYPES = [PathResult, HistoryResult]
+    RESULT_TYPES = [PathResult, HistoryResult, TimingResult]
+
+
+def _end_step_timings(step, timer, agent, task_env):
+    """Ends the step for the trial's timer and the timers of
+    agent and task_env (if they have one). Returns a dictionary
+    {"step": step, phase: seconds, ...}"""
+    step_timings = {"step": step}
+    for t in [timer, getattr(agent, "timer", None), getattr(task_env, "timer", None)]:
+        if t is not None:
+            step_timings.update(t.end_step())
+    return step_timings
 
 
 def _rotating_too_much(actions):
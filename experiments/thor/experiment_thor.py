@@ -304,7 +304,9 @@ def EXPERIMENT_THOR(split=10, num_trials=1):
                      add_timestamp=True)
     exp.generate_trial_scripts_by_groups(split=split)
     print("Trials generated at %s/%s" % (exp._outdir, exp.name))
-    print("Find multiple computers to run these experiments.")
+    print("Find multiple computers to run these experiments,")
+    print("or run them on this computer in parallel with")
+    print("    python -m cospomdp_apps.thor.parallel %s/%s -p <num_workers>" % (exp._outdir, exp.name))
     bump_iter()
 
 if __name__ == "__main__":
@@ -0,0 +1,115 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures how long it takes to import the packages in this repository,
+each in a fresh Python process. Useful to check that heavy dependencies
+(torch, ai2thor/thortils, pandas, matplotlib, ...) are not imported
+by modules that do not need them.
+
+Example:
+
+   python scripts/benchmark_startup.py
+   python scripts/benchmark_startup.py cospomdp_apps.thor.result_types --repeat 10
+   python scripts/benchmark_startup.py cospomdp --importtime 15
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+import statistics
+
+ABS_PATH = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(ABS_PATH)
+
+DEFAULT_MODULES = ["pomdp_py",  # baseline; cospomdp cannot start faster than this
+                   "cospomdp",
+                   "cospomdp_apps.basic",
+                   "cospomdp_apps.thor.result_types",
+                   "cospomdp_apps.thor.trial"]
+
+HEAVY_MODULES = ["torch", "ai2thor", "thortils", "cv2", "matplotlib",
+                 "pandas", "seaborn", "sklearn", "networkx"]
+
+# Runs in the child process. Prints a json line with the import time and
+# which of the heavy modules ended up in sys.modules.
+_CHILD = """
+import sys, time, json, importlib
+start = time.perf_counter()
+importlib.import_module({module!r})
+elapsed = time.perf_counter() - start
+print(json.dumps({{"time": elapsed,
+                   "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def time_import(module, repeat=5):
+    """Imports `module` in `repeat` fresh processes.
+
+    Returns:
+        (times, heavy): list of import times in seconds, and the list of
+            heavy modules that were loaded as a result of the import.
+        Returns (None, error message) if the module fails to import.
+    """
+    times = []
+    heavy = []
+    code = _CHILD.format(module=module, heavy=HEAVY_MODULES)
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-c", code],
+                              cwd=REPO_ROOT, capture_output=True, text=True)
+        if proc.returncode != 0:
+            return None, proc.stderr.strip().split("\n")[-1]
+        out = json.loads(proc.stdout.strip().split("\n")[-1])
+        times.append(out["time"])
+        heavy = out["heavy"]
+    return times, heavy
+
+def slowest_imports(module, top=10):
+    """Runs `python -X importtime` on `module` and returns the `top`
+    imports with the largest cumulative time, as (microseconds, name)."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                           "import {}".format(module)],
+                          cwd=REPO_ROOT, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.split("\n"):
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time benchmark")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES,
+                        help="modules to import")
+    parser.add_argument("-r", "--repeat", type=int, default=5,
+                        help="number of fresh processes per module")
+    parser.add_argument("--importtime", type=int, default=0,
+                        help="also list this many slowest imports (from -X importtime)")
+    args = parser.parse_args()
+
+    print("{:<36} {:>9} {:>9}   {}".format("module", "min (s)", "median", "heavy modules loaded"))
+    for module in args.modules:
+        times, heavy = time_import(module, repeat=args.repeat)
+        if times is None:
+            print("{:<36} {:>9} {:>9}   {}".format(module, "-", "-", "FAILED: " + heavy))
+            continue
+        print("{:<36} {:>9.3f} {:>9.3f}   {}".format(module, min(times), statistics.median(times),
+                                                  ", ".join(heavy) if heavy else "none"))
+        if args.importtime > 0:
+            for cumulative, name in slowest_imports(module, top=args.importtime):
+                print("    {:>9.3f}  {}".format(cumulative / 1e6, name))
+
+if __name__ == "__main__":
+    main()
@@ -69,23 +69,25 @@ def run(args):
     results = []
 
     datadir, fnames, classes, colors = yolo_load_info(args.data_yaml, for_train=False)
-    for idx in tqdm(range(len(fnames))):
-        img, annots = yolo_load_one(datadir, fnames[idx])
-        detections = detector.detect(img)
-
-        # obtain annotated bounding boxes for each frame
-        gtbboxes = {}
-        for annot in annots:
-            class_int = annot[0]
-            xywh = annot[1:]
-            xyxy = normalized_xywh_to_xyxy(xywh, img.shape[:2], center=True)
-
-            if classes[class_int] not in gtbboxes:
-                gtbboxes[classes[class_int]] = []
-            gtbboxes[classes[class_int]].append(xyxy)
-
-        # determine TP/FP/TN/FN outcome for the detections of this frame
-        for cls in detector.detectable_classes:
+    for start in tqdm(range(0, len(fnames), args.batch_size)):
+        batch = [yolo_load_one(datadir, fname)
+                 for fname in fnames[start:start+args.batch_size]]
+        batch_detections = detector.detect_batch([img for img, _ in batch],
+                                                 batch_size=args.batch_size)
+        for (img, annots), detections in zip(batch, batch_detections):
+            # obtain annotated bounding boxes for each frame
+            gtbboxes = {}
+            for annot in annots:
+                class_int = annot[0]
+                xywh = annot[1:]
+                xyxy = normalized_xywh_to_xyxy(xywh, img.shape[:2], center=True)
+
+                if classes[class_int] not in gtbboxes:
+                    gtbboxes[classes[class_int]] = []
+                gtbboxes[classes[class_int]].append(xyxy)
+
+            # determine TP/FP/TN/FN outcome for the detections of this frame
+            for cls in detector.detectable_classes:
 
     # Saves results as DataFrame. Use
     df = pd.DataFrame(results,
@@ -134,6 +136,8 @@ if __name__ == "__main__":
     parser.add_argument("data_yaml", type=str, help="path to the dataset yaml file")
     parser.add_argument("scene_type", type=str, help="scene_type, e.g. kitchen")
     parser.add_argument("--iou-thres", type=float, default=0.5)
+    parser.add_argument("--batch-size", type=int, default=16,
+                        help="number of images the detector processes at a time")
     parser.add_argument("--debug", action="store_true")
     args = parser.parse_args()
 
@@ -0,0 +1,96 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import random
+import pytest
+import numpy as np
+from cospomdp.probability import TabularDistribution, ArrayDistribution, Event
+
+WEIGHTS = [
+    (('x1', 'y1', 'z1'), 0.8),
+    (('x2', 'y1', 'z2'), 0.3),
+    (('x3', 'y1', 'z1'), 0.2),
+    (('x3', 'y2', 'z1'), 0.6),
+    (('x1', 'y2', 'z1'), 0.2),
+    (('x2', 'y2', 'z2'), 0.1),
+]
+
+@pytest.fixture
+def dists():
+    variables = ["X", "Y", "Z"]
+    # The tabular distribution needs every setting to be present
+    full = {(x, y, z): 0.0 for x in ("x1", "x2", "x3")
+            for y in ("y1", "y2") for z in ("z1", "z2")}
+    full.update(dict(WEIGHTS))
+    tabular = TabularDistribution(variables, list(full.items()))
+    array = ArrayDistribution.from_weights(variables, WEIGHTS)
+    return tabular, array
+
+def assert_same(tabular, array):
+    assert sorted(tabular.variables) == sorted(array.variables)
+    for event in tabular.events:
+        assert array.prob(event) == pytest.approx(tabular.prob(event))
+
+def test_prob_and_partial_prob(dists):
+    tabular, array = dists
+    assert_same(tabular, array)
+    assert array.table.sum() == pytest.approx(1.0)
+    assert array.prob({"X": "x1"}) == pytest.approx(1.0 / 2.2)
+    assert array[("x1", "y1", "z1")] == pytest.approx(0.8 / 2.2)
+    with pytest.raises(ValueError):
+        array.prob({"X": "x4"})
+
+def test_condition_sum_out_marginal(dists):
+    tabular, array = dists
+    assert_same(tabular.condition({"Y": "y2"}), array.condition({"Y": "y2"}))
+    assert array.condition({"Y": "y2"}).evidence == Event({"Y": "y2"})
+    assert_same(tabular.sum_out(["Y"]), array.sum_out(["Y"]))
+    assert_same(tabular.marginal(["Z"], evidence={"Y": "y2"}),
+                array.marginal(["Z"], evidence={"Y": "y2"}))
+    pz = array.marginal(["Z"], evidence={"Y": "y2"})
+    assert pz.prob(("z1",)) == pytest.approx(8 * pz.prob(("z2",)))
+
+def test_conversion_and_product(dists):
+    tabular, array = dists
+    assert_same(tabular, ArrayDistribution.from_tabular(tabular))
+    assert_same(array.to_tabular(), array)
+    px = array.marginal(["X"])
+    py = array.marginal(["Y"])
+    pxy = px.product(py)
+    assert pxy.variables == ["X", "Y"]
+    assert pxy.prob(("x3", "y2")) == pytest.approx(px.prob(("x3",)) * py.prob(("y2",)))
+    assert len(array.to_df()) == 12
+
+def test_sample():
+    array = ArrayDistribution(["X"], [0.2, 0.0, 0.8], {"X": ["a", "b", "c"]})
+    rnd = random.Random(0)
+    counts = {}
+    for _ in range(5000):
+        val = array.sample(rnd=rnd)["X"]
+        counts[val] = counts.get(val, 0) + 1
+    assert "b" not in counts
+    assert counts["c"] / 5000 == pytest.approx(0.8, abs=0.03)
+    assert array.mpe() == Event({"X": "c"})
+
+def test_large_table_speed():
+    rnd = np.random.RandomState(0)
+    valranges = {"A": list(range(100)), "B": list(range(100)), "C": list(range(20))}
+    array = ArrayDistribution(["A", "B", "C"], rnd.rand(100, 100, 20), valranges)
+    start = time.time()
+    for _ in range(10):
+        array.marginal(["A"], evidence={"C": 3})
+        array.sum_out(["B"]).condition({"A": 7})
+        array.prob({"A": 1, "B": 2, "C": 3})
+    assert time.time() - start < 1.0
@@ -0,0 +1,54 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import threading
+import pytest
+from cospomdp.utils.async_writer import AsyncWriter, DROP_NEWEST, DROP_OLDEST, BLOCK
+
+def test_async_writer_runs_in_order():
+    done = []
+    writer = AsyncWriter(max_queue=4, policy=BLOCK)
+    for i in range(20):
+        writer.submit(done.append, i)
+    writer.close()
+    assert done == list(range(20))
+    assert writer.dropped == 0
+    with pytest.raises(ValueError):
+        writer.submit(done.append, 20)
+
+@pytest.mark.parametrize("policy", [DROP_NEWEST, DROP_OLDEST])
+def test_async_writer_drops_when_full(policy):
+    done = []
+    release = threading.Event()
+    writer = AsyncWriter(max_queue=2, policy=policy)
+    writer.submit(release.wait)   # keeps the writer busy
+    time.sleep(0.05)
+    start = time.time()
+    for i in range(5):
+        writer.submit(done.append, i)
+    assert time.time() - start < 0.05   # never waits
+    release.set()
+    writer.close()
+    assert writer.dropped == 3
+    if policy == DROP_NEWEST:
+        assert done == [0, 1]
+    else:
+        assert done == [3, 4]
+
+def test_async_writer_job_error():
+    writer = AsyncWriter()
+    writer.submit(lambda: 1/0)
+    writer.close()
+    assert len(writer.errors) == 1
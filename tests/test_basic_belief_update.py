@@ -0,0 +1,171 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import numpy as np
+import pomdp_py
+from cospomdp.domain.state import RobotState2D
+from cospomdp.models.belief import LogHistogram, SparseHistogram
+from cospomdp.models.observation_model import CosObjectObservationModel
+from cospomdp.domain.observation import Loc, CosObservation, RobotObservation
+from cospomdp_apps.basic.parser import create_instance
+from cospomdp_apps.basic.belief import update_target_belief_2d
+
+@pytest.fixture
+def world():
+    WORLD =\
+"""
+### map
+R.......
+.x.T.x..
+.xG..x..
+........
+
+### robotconfig
+th: 0
+
+### corr
+T around G: d=2
+
+### detectors
+T: fan-nofp | fov=90, min_range=0, max_range=3 | (0.6, 0.1)
+G: fan-nofp | fov=90, min_range=0, max_range=4 | (0.8, 0.1)
+
+### goal
+find: T, 2.0
+
+### END
+"""
+    return WORLD
+
+def _observation(agent, srobot, zlocs):
+    robotobz = RobotObservation(agent.robot_id, srobot['pose'], srobot['status'].copy())
+    return CosObservation(robotobz, {objid: Loc(objid, zlocs.get(objid, None))
+                                     for objid in agent.detectable_objects})
+
+def test_vectorized_update_matches_exact(world):
+    agent, objlocs = create_instance(world)
+    btarget = agent.belief.b(agent.target_id)
+    srobot = RobotState2D(agent.robot_id, (1, 1, 0))
+    for zlocs in [{}, {"G": objlocs["G"]}, {"T": objlocs["T"], "G": objlocs["G"]}]:
+        observation = _observation(agent, srobot, zlocs)
+        exact = update_target_belief_2d(btarget, srobot, observation,
+                                        agent.observation_model, "histogram")
+        vectorized = update_target_belief_2d(btarget, srobot, observation,
+                                             agent.observation_model, "histogram-vectorized")
+        for starget in exact:
+            assert vectorized[starget] == pytest.approx(exact[starget], abs=1e-9)
+        btarget = vectorized
+
+def test_reset_belief_keeps_models(world):
+    agent, objlocs = create_instance(world)
+    observation_model = agent.observation_model
+    srobot = RobotState2D(agent.robot_id, (2, 0, 90))
+    # locations not in the prior get weight 1.0
+    prior = {loc: 0.1 for loc in agent.search_region.locations}
+    prior[objlocs["G"]] = 1.0
+    agent.reset_belief(srobot, prior=prior)
+    assert agent.observation_model is observation_model
+    assert agent.belief.b(agent.robot_id).mpe() == srobot
+    assert agent.belief.b(agent.target_id).mpe().loc == objlocs["G"]
+
+def test_log_update_matches_exact(world):
+    agent, objlocs = create_instance(world)
+    btarget = agent.belief.b(agent.target_id)
+    blog = LogHistogram.from_histogram(btarget)
+    srobot = RobotState2D(agent.robot_id, (1, 1, 0))
+    for zlocs in [{}, {"G": objlocs["G"]}, {"T": objlocs["T"], "G": objlocs["G"]}]:
+        observation = _observation(agent, srobot, zlocs)
+        btarget = update_target_belief_2d(btarget, srobot, observation,
+                                          agent.observation_model, "histogram")
+        blog = update_target_belief_2d(blog, srobot, observation,
+                                       agent.observation_model, "histogram-log")
+        assert isinstance(blog, LogHistogram)
+        for starget in btarget:
+            assert blog[starget] == pytest.approx(btarget[starget], abs=1e-9)
+    assert blog.mpe() == btarget.mpe()
+
+def test_log_histogram_no_underflow():
+    values = list(range(5))
+    b = LogHistogram.from_histogram({v: 0.2 for v in values})
+    for _ in range(1000):
+        # each step, value 3 is 1e-3 times less likely than the others
+        b = b.update(np.log([1e-5, 1e-5, 1e-5, 1e-8, 1e-5]))
+    assert sum(b[v] for v in values) == pytest.approx(1.0)
+    assert b[0] == pytest.approx(0.25)
+    assert b.random() != 3
+
+def test_log_histogram_impossible_update_is_a_copy():
+    values = list(range(4))
+    b = LogHistogram.from_histogram({v: 0.25 for v in values})
+    b2 = b.update(np.full(4, -np.inf))
+    assert b2[0] == pytest.approx(0.25)
+    b2[0] = 0.7
+    assert b[0] == pytest.approx(0.25)
+    assert b2[0] > 0.25
+
+def test_sparse_histogram_pruning():
+    hist = {v: p for v, p in enumerate([0.5, 0.3, 0.1995, 0.0003, 0.0002])}
+    b = SparseHistogram.from_histogram(hist, prune_mass=1e-3)
+    assert set(b.support) == {0, 1, 2}
+    assert b.residual == pytest.approx(0.0005)
+    assert b[3] == b[4] == pytest.approx(0.00025)
+    assert sum(b[v] for v in b) == pytest.approx(1.0)
+    # Observations that make the pruned values likely again restore them
+    b2 = b.update(np.array([1e-3, 1e-3, 1e-3]), 1.0)
+    assert set(b2.support) == set(range(5))
+    b3 = b.with_support([4])
+    assert 4 in b3.support and b3[4] == pytest.approx(0.00025)
+
+def test_sparse_update_keeps_cond_matrix(world, monkeypatch):
+    """The support and the pruned samples change every step; their
+    likelihoods must not rebuild the conditional matrix each time"""
+    builds = []
+    corr_cond_matrix = CosObjectObservationModel.corr_cond_matrix
+    def counting_corr_cond_matrix(self, target_locs):
+        cached = self._cond_matrix
+        result = corr_cond_matrix(self, target_locs)
+        if self._cond_matrix is not cached:
+            builds.append(self.corr_object_id)
+        return result
+    monkeypatch.setattr(CosObjectObservationModel, "corr_cond_matrix", counting_corr_cond_matrix)
+
+    agent, objlocs = create_instance(world)
+    bsparse = agent.belief.b(agent.target_id)
+    srobot = RobotState2D(agent.robot_id, (1, 1, 0))
+    for zlocs in [{}, {"G": objlocs["G"]}, {"T": objlocs["T"], "G": objlocs["G"]}, {}]:
+        observation = _observation(agent, srobot, zlocs)
+        bsparse = update_target_belief_2d(bsparse, srobot, observation,
+                                          agent.observation_model, "histogram-sparse",
+                                          bu_args={"prune_mass": 1e-4})
+    # at most one build per correlated object
+    assert len(builds) == len(set(builds))
+
+def test_sparse_update_close_to_exact(world):
+    agent, objlocs = create_instance(world)
+    btarget = agent.belief.b(agent.target_id)
+    bsparse = SparseHistogram.from_histogram(btarget, prune_mass=1e-4)
+    srobot = RobotState2D(agent.robot_id, (1, 1, 0))
+    for zlocs in [{}, {"G": objlocs["G"]}, {"T": objlocs["T"], "G": objlocs["G"]}]:
+        observation = _observation(agent, srobot, zlocs)
+        btarget = update_target_belief_2d(btarget, srobot, observation,
+                                          agent.observation_model, "histogram")
+        bsparse = update_target_belief_2d(bsparse, srobot, observation,
+                                          agent.observation_model, "histogram-sparse",
+                                          bu_args={"prune_mass": 1e-4})
+        assert bsparse.residual <= 2e-4
+        for starget in btarget:
+            assert bsparse[starget] == pytest.approx(btarget[starget], abs=1e-3)
+    assert bsparse.mpe() == btarget.mpe()
+    assert len(bsparse.support) < len(bsparse)
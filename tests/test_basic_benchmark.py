@@ -0,0 +1,49 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from cospomdp_apps.basic.parser import parse_worldstr
+from cospomdp_apps.basic.benchmark import generate_worldstr, run_benchmark, run_suite
+
+def test_generate_worldstr():
+    worldstr = generate_worldstr(15, 10, obstacle_density=0.2, num_objects=3,
+                                 corr_types=("around", "apart"), seed=1)
+    spec = parse_worldstr(worldstr)
+    assert len(spec["search_region"].locations) == 15*10 - 30
+    assert set(spec["objects"]) == {"T", "A", "B", "C"}
+    assert spec["init_robot_loc"] is not None
+    assert generate_worldstr(15, 10, seed=1) == generate_worldstr(15, 10, seed=1)
+
+def test_run_benchmark():
+    worldstr = generate_worldstr(10, 10, seed=2)
+    result = run_benchmark(worldstr, nsteps=2,
+                           solver_args=dict(max_depth=5, num_sims=50,
+                                            discount_factor=0.95,
+                                            exploration_const=100),
+                           belief_type="histogram-vectorized")
+    assert 1 <= result["steps"] <= 2
+    for phase in ["setup", "planning", "observation_sampling", "belief_update"]:
+        assert result[phase] >= 0
+    assert result["peak_rss_mb"] > 0
+
+def test_run_suite():
+    rows = run_suite(sizes=(6, 8), nsteps=1,
+                     solver_args=dict(max_depth=3, num_sims=20,
+                                      discount_factor=0.95,
+                                      exploration_const=100),
+                     belief_type="histogram-vectorized", seed=3)
+    assert [row["size"] for row in rows] == [6, 8]
+    for row in rows:
+        assert row["steps"] == 1
+        assert row["peak_rss_mb"] > 0
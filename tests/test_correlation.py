@@ -0,0 +1,96 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from cospomdp.models.correlation import CorrelationDist, corr_content_hash
+from cospomdp.utils.corr_funcs import ConditionalSpatialCorrelation
+from cospomdp.models.search_region import SearchRegion2D
+from cospomdp.utils.math import euclidean_dist
+
+def corr_func(target_loc, object_loc, target_id, object_id, d=2):
+    return euclidean_dist(target_loc, object_loc) <= d
+
+@pytest.fixture
+def search_region():
+    w, l = 8, 6
+    locations = [(x,y) for x in range(w) for y in range(l)
+                 if (x,y) not in {(2,2), (3,2)}]
+    return SearchRegion2D(locations)
+
+@pytest.mark.parametrize("backend", ["dense", "sparse"])
+def test_matrix_backend_matches_tabular(search_region, backend):
+    target = (0, "target")
+    other = (1, "other")
+    tabular = CorrelationDist(other, target, search_region, corr_func,
+                              corr_func_args={"d": 2})
+    matrix = CorrelationDist(other, target, search_region, corr_func,
+                             corr_func_args={"d": 2}, backend=backend)
+    for starget in tabular.valrange(target[0]):
+        dist_tabular = tabular.marginal([other[0]], evidence={target[0]: starget})
+        dist_matrix = matrix.marginal([other[0]], evidence={target[0]: starget})
+        for si in matrix.valrange(other[0]):
+            assert dist_matrix.prob({other[0]: si})\
+                == pytest.approx(dist_tabular.prob({other[0]: si}))
+        si = dist_matrix.sample()[other[0]]
+        assert dist_tabular.prob({other[0]: si}) > 0
+
+def test_matrix_backend_save_load(search_region, tmp_path):
+    target = (0, "target")
+    other = (1, "other")
+    dist = CorrelationDist(other, target, search_region, corr_func, backend="sparse")
+    path = str(tmp_path / "corr.pkl")
+    dist.save(path)
+    loaded = CorrelationDist.load(path)
+    assert loaded.backend == "sparse"
+    assert (loaded.matrix != dist.matrix).nnz == 0
+
+@pytest.mark.parametrize("backend", ["dense", "sparse"])
+def test_mmap_cache(search_region, tmp_path, backend):
+    target = (0, "target")
+    other = (1, "other")
+    dist = CorrelationDist(other, target, search_region, corr_func, backend=backend)
+    content_hash = corr_content_hash(search_region, other, target, corr_func, {}, backend=backend)
+    path = str(tmp_path / "corr")
+    dist.save_mmap(path, content_hash)
+    loaded = CorrelationDist.load_mmap(path, search_region, content_hash)
+    assert loaded is not None and loaded.backend == backend
+    starget = dist.valrange(target[0])[5]
+    for si in dist.valrange(other[0]):
+        assert loaded.marginal([other[0]], {target[0]: starget}).prob({other[0]: si})\
+            == pytest.approx(dist.marginal([other[0]], {target[0]: starget}).prob({other[0]: si}))
+
+    # A different correlation spec must not reuse the cache
+    stale_hash = corr_content_hash(search_region, other, target, corr_func, {"d": 3}, backend=backend)
+    assert stale_hash != content_hash
+    assert CorrelationDist.load_mmap(path, search_region, stale_hash) is None
+
+def test_corr_content_hash_params(search_region):
+    target = (0, "target")
+    other = (1, "other")
+    def spcorr(**kwargs):
+        args = dict(distances=[1.0, 2.5], nearby_thres=2.0, reverse=False, learned=False)
+        args.update(kwargs)
+        return ConditionalSpatialCorrelation(target, other, **args)
+    def chash(corr_func):
+        return corr_content_hash(search_region, other, target, corr_func, {})
+    assert chash(spcorr().func) == chash(spcorr().func)
+    assert chash(spcorr().func) != chash(spcorr(reverse=True).func)
+    assert chash(spcorr().func) != chash(spcorr(nearby_thres=3.0).func)
+    assert chash(spcorr().func) != chash(spcorr(distances=[1.0, 2.5001]).func)
+
+    # Same name, different body
+    namespace1, namespace2 = {}, {}
+    exec("def f(l1, l2, i1, i2): return l1 == l2", namespace1)
+    exec("def f(l1, l2, i1, i2): return l1 != l2", namespace2)
+    assert chash(namespace1["f"]) != chash(namespace2["f"])
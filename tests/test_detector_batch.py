@@ -0,0 +1,77 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import numpy as np
+torch = pytest.importorskip("torch")
+from cospomdp_apps.thor.detector import YOLODetector
+
+CLASSES = ["Apple", "Mug", "Bowl"]
+
+class FakeResults:
+    def __init__(self, pred):
+        self.pred = pred
+
+class FakeModel:
+    """Stands in for the YOLOv5 hub model. The prediction for an image
+    depends only on that image: one box per class, at a position and
+    with a confidence derived from the pixel values."""
+    def __init__(self):
+        self.batches = []
+
+    def _pred(self, frame):
+        v = float(frame.mean())
+        h, w = frame.shape[:2]
+        return torch.tensor([[v % w, v % h, v % w + 5.4, v % h + 5.6, (v % 7) / 7, cls]
+                             for cls in range(len(CLASSES))])
+
+    def __call__(self, frames):
+        if not isinstance(frames, list):
+            frames = [frames]
+        self.batches.append([f.shape for f in frames])
+        return FakeResults([self._pred(f) for f in frames])
+
+def make_detector():
+    # Skip __init__, which loads a real model through torch.hub
+    detector = YOLODetector.__new__(YOLODetector)
+    detector.detectable_classes = CLASSES
+    detector.classes = CLASSES
+    detector._conf_thres = 0.3
+    detector._visualize = False
+    detector.model = FakeModel()
+    return detector
+
+def test_detect_batch_matches_detect():
+    rnd = np.random.RandomState(0)
+    shapes = [(30, 40, 3), (20, 20, 3), (30, 40, 3), (30, 40, 3), (20, 20, 3), (30, 40, 3)]
+    frames = [rnd.randint(0, 256, size=shape).astype(np.uint8) for shape in shapes]
+    detector = make_detector()
+    expected = [detector.detect(frame, visualize=False) for frame in frames]
+    assert any(len(d) > 0 for d in expected)
+    for batch_size in [1, 2, 3, 16]:
+        detector.model.batches = []
+        outputs = detector.detect_batch(frames, batch_size=batch_size)
+        assert len(outputs) == len(frames)
+        for out, exp in zip(outputs, expected):
+            assert len(out) == len(exp)
+            for (xyxy1, conf1, cls1), (xyxy2, conf2, cls2) in zip(out, exp):
+                assert np.array_equal(xyxy1, xyxy2)
+                assert conf1 == conf2 and cls1 == cls2
+        for batch in detector.model.batches:
+            assert 1 <= len(batch) <= batch_size
+            assert len(set(batch)) == 1  # frames of different shapes are not mixed
+
+def test_detect_batch_size():
+    with pytest.raises(ValueError):
+        make_detector().detect_batch([], batch_size=0)
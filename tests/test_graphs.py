@@ -181,6 +181,28 @@ def test_to_nx(g):
     print(g.shortest_path(src.id, dst.id, lambda e: 1))
     print("Ours took {:.6f}".format(time.time() - _start))
 
+def test_shortest_path_weighted():
+    random.seed(10)
+    nodes = {i: Node(i) for i in range(40)}
+    edges = {}
+    G = nx.Graph()
+    for i in range(120):
+        nid1, nid2 = random.sample(list(nodes), 2)
+        if G.has_edge(nid1, nid2):
+            continue
+        w = random.randint(1, 10)
+        edges[i] = Edge(i, nodes[nid1], nodes[nid2], data=w)
+        G.add_edge(nid1, nid2, weight=w)
+    graph = Graph(edges)
+    for src in graph.nodes:
+        for dst in graph.nodes:
+            path = graph.shortest_path(src, dst, lambda e: e.data)
+            if not nx.has_path(G, src, dst):
+                assert path is None
+                continue
+            assert sum(graph.edges[eid].data for eid in path)\
+                == nx.shortest_path_length(G, src, dst, weight="weight")
+
 
 if __name__ == "__main__":
     #(30, 40, multi=True)
@@ -0,0 +1,37 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from cospomdp_apps.thor.agent.components.navigation import NavGrid
+
+@pytest.fixture
+def reachable_positions():
+    # 7x5 grid with a wall at x=3 except an opening at y=4
+    return [(x,y) for x in range(7) for y in range(5)
+            if not (x == 3 and y < 4)]
+
+def test_nav_grid_paths(reachable_positions):
+    nav_grid = NavGrid(reachable_positions, max_cached_sources=2)
+    path = nav_grid.shortest_path((0,0), (6,0))
+    assert path[0] == (6,0) and path[-1] == (0,0)
+    assert (3,4) in path
+    assert nav_grid.distance((0,0), (6,0)) == len(path) - 1 == 14
+    assert nav_grid.distance((0,0), (0,0)) == 0
+    assert nav_grid.shortest_path((0,0), (3,0)) is None
+    assert nav_grid.distance((0,0), (3,0)) == float("inf")
+
+    # cached trees are reused, and bounded
+    for src in [(0,0), (1,1), (2,2)]:
+        nav_grid.shortest_path(src, (6,4))
+    assert len(nav_grid._trees) == 2
@@ -19,7 +19,9 @@ import matplotlib.pyplot as plt
 from cospomdp.models.observation_model import (CosObjectObservationModel,
                                                CosObservationModel,
                                                FanModelYoonseon,
-                                               FanModelNoFP)
+                                               FanModelNoFP,
+                                               FanModelSimpleFP,
+                                               FanModelFarRange)
 from cospomdp.models.correlation import CorrelationDist
 from cospomdp.domain.state import (ObjectState,
                                    CosState,
@@ -109,6 +111,42 @@ def test_observation_model(search_region, show_plots):
         plt.pause(1)
         ax.clear()
 
+def test_probability_batch(search_region):
+    fan_params = dict(fov=90, min_range=0, max_range=4)
+    detectors = [FanModelNoFP(0, dict(fan_params), (0.8, 0.5)),
+                 FanModelSimpleFP(0, dict(fan_params), (0.8, 0.1, 0.5)),
+                 FanModelFarRange(0, dict(fan_params), (0.8, 0.1, 0.5)),
+                 FanModelYoonseon(0, dict(fan_params), (0.5, 0.9))]
+    locs = np.array(search_region.locations)
+    for detector in detectors:
+        for pose in [(5, 5, 0), (3, 7, 225), (0, 0, 45)]:
+            srobot = RobotState2D(-1, pose, RobotStatus())
+            for zloc in [None, (6, 5), (9, 9), (5, 5)]:
+                zi = Loc(0, zloc)
+                batch = detector.probability_batch(zi, srobot, locs)
+                scalar = [detector.probability(zi, ObjectState(0, "target", loc), srobot)
+                          for loc in search_region.locations]
+                assert np.allclose(batch, scalar, rtol=1e-9, atol=1e-15)
+
+def test_corr_cond_rows(search_region):
+    target = (0, "target")
+    other = (1, "other")
+    fan_params = dict(fov=90, min_range=0, max_range=3)
+    detector = FanModelNoFP(other[0], fan_params, (0.9, 0.1), round_to=None)
+    for backend in ["tabular", "dense"]:
+        corr_dist = CorrelationDist(other, target, search_region, corr_func, backend=backend)
+        omodel = CosObjectObservationModel(other[0], target[0], -1, detector, corr_dist)
+        locs = list(search_region.locations)
+        si_states, matrix = omodel.corr_cond_matrix(locs)
+        cached = omodel._cond_matrix
+        # rows for a few target locations do not replace the cached full matrix
+        some_locs = [locs[10], locs[3], locs[42]]
+        si_locs, rows = omodel.corr_cond_rows(some_locs)
+        assert omodel._cond_matrix is cached
+        assert np.array_equal(si_locs, np.array([si.loc for si in si_states]))
+        assert np.allclose(rows, np.asarray(matrix)[[10, 3, 42]])
+
+
 def plot_belief(belief, dim, ax):
     x = []
     y = []
@@ -0,0 +1,59 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import pytest
+from sciex import Trial, YamlResult
+from cospomdp_apps.thor.parallel import run_trials
+
+class DummyResult(YamlResult):
+    @classmethod
+    def FILENAME(cls):
+        return "dummy.yaml"
+
+class DummyTrial(Trial):
+    """Writes its name as the result, or fails if config['fail'] is True.
+    The config has just what preload_assets needs."""
+    def __init__(self, name, fail=False):
+        super().__init__(name, {"task_config": {"detector_config": {}},
+                                "thor": {"scene": "FloorPlan1"},
+                                "agent_init_inputs": [],
+                                "fail": fail})
+
+    def could_provide_resource(self):
+        return False
+
+    def run(self, logging=False):
+        if self.config["fail"]:
+            raise ValueError("dummy failure")
+        return [DummyResult({"name": self.name})]
+
+def test_run_trials(tmp_path):
+    exp_path = str(tmp_path)
+    trials = [DummyTrial("dummy-{}_{}_ok".format(i, i)) for i in range(3)]
+    trials.append(DummyTrial("dummy-fail_0_bad", fail=True))
+    failed = run_trials(trials, exp_path, num_workers=2)
+    assert set(failed) == {"dummy-fail_0_bad"}
+    assert "dummy failure" in failed["dummy-fail_0_bad"]
+    for trial in trials[:3]:
+        trial_path = os.path.join(exp_path, trial.name)
+        assert os.path.exists(os.path.join(trial_path, "config.yaml"))
+        assert DummyResult.collect(os.path.join(trial_path, "dummy.yaml")) == {"name": trial.name}
+    assert not os.path.exists(os.path.join(exp_path, "dummy-fail_0_bad", "config.yaml"))
+
+    # Completed trials are skipped; only the failed one runs again.
+    mtime = os.path.getmtime(os.path.join(exp_path, trials[0].name, "dummy.yaml"))
+    failed = run_trials(trials, exp_path, num_workers=2)
+    assert set(failed) == {"dummy-fail_0_bad"}
+    assert os.path.getmtime(os.path.join(exp_path, trials[0].name, "dummy.yaml")) == mtime
@@ -0,0 +1,45 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import numpy as np
+from cospomdp.domain.state import ObjectState
+from cospomdp_apps.thor.agent.components.particles import ParticleBelief, systematic_resample
+
+def test_systematic_resample():
+    np.random.seed(10)
+    weights = np.array([0.1, 0.6, 0.0, 0.3])
+    counts = np.bincount(systematic_resample(weights, 100), minlength=4)
+    assert counts[2] == 0
+    for i in [0, 1, 3]:
+        assert abs(counts[i] - 100*weights[i]) <= 1
+
+def test_particle_belief():
+    locs = [(1, 2), (3, 4), (1, 2), (5, 5)]
+    weights = np.array([0.2, 0.3, 0.4, 0.1])
+    belief = ParticleBelief("T", "T", locs, np.log(weights))
+    assert belief.num_unique == 3
+    assert belief[ObjectState("T", "T", (1, 2))] == pytest.approx(0.6)
+    assert belief[ObjectState("T", "T", (0, 0))] == 0.0
+    assert belief.mpe() == ObjectState("T", "T", (1, 2))
+    assert belief.random().loc in set(locs)
+    particles = belief.to_weighted_particles()
+    assert particles.mpe() == belief.mpe()
+
+def test_particle_belief_rng():
+    locs = [(x, y) for x in range(5) for y in range(5)]
+    belief = ParticleBelief("T", "T", locs, np.zeros(len(locs)))
+    samples1 = belief.sample_locs(20, rng=np.random.RandomState(3))
+    samples2 = belief.sample_locs(20, rng=np.random.RandomState(3))
+    assert np.array_equal(samples1, samples2)
@@ -0,0 +1,101 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import pytest
+import pomdp_py
+from pomdp_py.problems.tiger.tiger_problem import TigerProblem, TigerState
+from cospomdp.planning import root_parallel
+from cospomdp.planning.root_parallel import RootParallelPOUCT, merge_root_stats
+
+def test_merge_root_stats():
+    merged = merge_root_stats([{"a": (10, 1.0), "b": (2, -1.0)},
+                               {"a": (30, 3.0)}])
+    assert merged["a"] == (40, pytest.approx(2.5))
+    assert merged["b"] == (2, pytest.approx(-1.0))
+
+@pytest.mark.parametrize("num_workers", [1, 3])
+def test_root_parallel_plan(num_workers):
+    random.seed(0)  # the tree in this process uses `random`
+    init_belief = pomdp_py.Histogram({TigerState("tiger-left"): 0.5,
+                                      TigerState("tiger-right"): 0.5})
+    tiger = TigerProblem(0.15, TigerState("tiger-left"), init_belief)
+    planner = RootParallelPOUCT(num_workers=num_workers, seed=1,
+                                max_depth=3, discount_factor=0.95,
+                                num_sims=500, exploration_const=200,
+                                rollout_policy=tiger.agent.policy_model)
+    action = planner.plan(tiger.agent)
+    assert action.name == "listen"
+    assert planner.last_num_sims == 500 * num_workers
+    assert set(planner.last_root_stats) == set(tiger.agent.tree.children)
+    observation = tiger.agent.observation_model.sample(tiger.env.state, action)
+    planner.update(tiger.agent, action, observation)
+
+def test_root_parallel_keeps_workers():
+    random.seed(0)
+    init_belief = pomdp_py.Histogram({TigerState("tiger-left"): 0.5,
+                                      TigerState("tiger-right"): 0.5})
+    tiger = TigerProblem(0.15, TigerState("tiger-left"), init_belief)
+    with RootParallelPOUCT(num_workers=3, seed=1,
+                           max_depth=3, discount_factor=0.95,
+                           num_sims=300, exploration_const=200,
+                           rollout_policy=tiger.agent.policy_model) as planner:
+        action = planner.plan(tiger.agent)
+        pool = planner._pool
+        for _ in range(3):
+            observation = tiger.agent.observation_model.sample(tiger.env.state, action)
+            new_belief = pomdp_py.update_histogram_belief(tiger.agent.cur_belief, action, observation,
+                                                          tiger.agent.observation_model,
+                                                          tiger.agent.transition_model)
+            tiger.agent.set_belief(new_belief)
+            planner.update(tiger.agent, action, observation)
+            action = planner.plan(tiger.agent)
+            assert planner._pool is pool  # not forked again
+            assert planner.last_num_sims == 300 * 3
+        # The workers plan from the current belief, not the one they were forked with
+        tiger.agent.set_belief(pomdp_py.Histogram({TigerState("tiger-left"): 1.0,
+                                                   TigerState("tiger-right"): 0.0}))
+        del tiger.agent.tree
+        action = planner.plan(tiger.agent)
+        assert planner._pool is pool
+        # with a stale (uniform) belief, the workers would often try open-left
+        open_left = [a for a in planner.last_root_stats if a.name == "open-left"][0]
+        assert planner.last_root_stats[open_left][0] < 0.05 * planner.last_num_sims
+        planner.reset_workers()
+        assert planner._pool is None
+        planner.plan(tiger.agent)
+        assert planner._pool is not None
+    assert planner._pool is None
+
+def test_root_parallel_planners_keep_own_workers():
+    random.seed(0)
+    tigers = [TigerProblem(0.15, TigerState("tiger-left"),
+                           pomdp_py.Histogram({TigerState("tiger-left"): 0.5,
+                                               TigerState("tiger-right"): 0.5}))
+              for _ in range(2)]
+    planners = [RootParallelPOUCT(num_workers=2, seed=1,
+                                  max_depth=3, discount_factor=0.95,
+                                  num_sims=100, exploration_const=200,
+                                  rollout_policy=tiger.agent.policy_model)
+                for tiger in tigers]
+    for planner, tiger in zip(planners, tigers):
+        planner.plan(tiger.agent)
+    # The agents are bound in the workers only; a worker forked later by
+    # either pool gets its own planner's agent, not the last one planned with.
+    assert root_parallel._WORKER_AGENT is None
+    # Ending the workers of one planner leaves the other's workers usable
+    planners[0].close()
+    planners[1].plan(tigers[1].agent)
+    assert planners[1].last_num_sims == 100 * 2
+    planners[1].close()
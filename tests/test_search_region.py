@@ -21,3 +21,11 @@ def test_sr():
     assert sr.width == 5
     assert sr.length == 5
     assert sr.dim == (5,5)
+
+def test_closest_location():
+    locations = [(x,y) for x in range(5) for y in range(5)
+                 if not (1 <= x <= 3 and 1 <= y <= 3)]
+    sr = SearchRegion2D(locations)
+    assert sr.closest_location((0, 0)) == (0, 0)
+    assert sr.closest_location((-3, 2)) == (0, 2)
+    assert sr.closest_location((2, 3.2)) == (2, 4)
@@ -187,3 +187,40 @@ def plot_camera_fov(camera, pose, dim, points, ax):
     ax.set_xlim(-1, w)
     ax.set_ylim(-1, l)
     ax.set_zlim(-1, h)
+
+def test_fansensor_footprint_cache(dim):
+    cached = FanSensor(fov=75, min_range=1, max_range=6, mean_range=4, footprint_cache_size=8)
+    uncached = FanSensor(fov=75, min_range=1, max_range=6, mean_range=4, footprint_cache_size=0)
+    w, l = dim
+    for i in range(2000):
+        robot_pose = (random.randint(0, w-1), random.randint(0, l-1),
+                      random.choice([0, 45, 90, 180, 270, 315]))
+        point = (random.randint(0, w-1), random.randint(0, l-1))
+        for use_mean in [False, True]:
+            assert cached.in_range(point, robot_pose, use_mean=use_mean)\
+                == uncached.in_range(point, robot_pose, use_mean=use_mean)
+    info = cached.footprint_cache_info()
+    assert info["size"] <= 8
+    assert info["misses"] > 0 and info["nbytes"] > 0
+
+def test_fansensor3d_footprint_cache(dim):
+    cached = FanSensor3D(fov=75, min_range=1, max_range=6, mean_range=4,
+                         v_angles=[-30, 0, 30], footprint_cache_size=8)
+    uncached = FanSensor3D(fov=75, min_range=1, max_range=6, mean_range=4,
+                           v_angles=[-30, 0, 30], footprint_cache_size=0)
+    w, l = dim
+    for i in range(2000):
+        robot_pose = (random.randint(0, w-1), random.randint(0, l-1),
+                      random.choice([0, 1.5]), random.choice([-30, 0, 30, 45]),
+                      random.choice([0, 45, 90, 180, 270, 315]))
+        point = (random.randint(0, w-1), random.randint(0, l-1))
+        for use_mean in [False, True]:
+            assert cached.in_range(point, robot_pose, use_mean=use_mean)\
+                == uncached.in_range(point, robot_pose, use_mean=use_mean)
+    info = cached.footprint_cache_info()
+    assert 0 < info["size"] <= 8
+    assert info["misses"] > 0 and info["nbytes"] > 0
+    assert len(cached._cache) <= 8
+    # The masks are kept by the 3D sensor, not by the projected fans
+    assert all(fan2d.footprint_cache_info()["size"] == 0
+               for fan2d in cached._cache.values())
@@ -0,0 +1,37 @@
+# Copyright 2022 Kaiyu Zheng
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import pytest
+from cospomdp.utils.timing import StepTimer
+
+def test_step_timer():
+    timer = StepTimer()
+    with timer.timeit("planning"):
+        time.sleep(0.01)
+    with timer.timeit("planning"):
+        time.sleep(0.01)
+    local_timer = timer.scoped("local")
+    with local_timer.timeit("planning"):
+        pass
+    step = timer.end_step()
+    assert step["planning"] >= 0.02
+    assert "local.planning" in step
+    assert timer.current == {}
+
+    timer.add("belief_update", 0.5)
+    timer.end_step()
+    assert len(timer.history) == 2
+    assert timer.totals()["belief_update"] == pytest.approx(0.5)
+    assert timer.totals()["planning"] == pytest.approx(step["planning"])
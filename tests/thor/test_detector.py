@@ -67,6 +67,33 @@ def _test_vision_detector(scene="FloorPlan1"):
     cv2.imshow("groundtruth", img_bgr)
     cv2.waitKey(0)
 
+
+def test_detection_log():
+    from cospomdp_apps.thor.detector import DetectionLog
+    log = DetectionLog(0.25)
+    log.record("Mug", (1.0, 0.9, 1.0))
+    log.record("Mug", (1.1, 0.9, 1.1))  # near the first one
+    log.record("Mug", (2.0, 0.9, 1.0))
+    log.record("Cup", (1.0, 0.9, 1.0))
+    assert len(log) == 3
+    assert log.count("Mug", (1.05, 0.9, 1.0)) == 2
+    assert log.count("Mug", (2.0, 0.9, 1.2)) == 1
+    assert log.count("Mug", (3.0, 0.9, 1.0)) == 0
+    assert log.count("Cup", (1.0, 0.9, 1.0)) == 1
+
+    # locations not detected within the window are forgotten
+    log = DetectionLog(0.25, window=2)
+    log.record("Mug", (1.0, 0.9, 1.0))
+    log.tick()
+    log.record("Mug", (2.0, 0.9, 1.0))
+    log.tick()
+    log.tick()
+    assert log.count("Mug", (1.0, 0.9, 1.0)) == 0
+    assert log.count("Mug", (2.0, 0.9, 1.0)) == 1
+    log.tick()
+    assert len(log) == 0
+
+
 if __name__ == "__main__":
     # _test_groundtruth_detector()
     _test_vision_detector()
@@ -0,0 +1,83 @@
+import sys
+import tempfile
+import thortils as tt
+from cospomdp_apps.thor.fake_controller import FakeController, save_recording
+from cospomdp_apps.thor.trial import ThorObjectSearchTrial
+from cospomdp_apps.thor.common import TaskArgs, make_config
+
+APPLE = "Apple|+01.00|+00.90|+01.00"
+FRIDGE = "Fridge|+00.00|+00.90|+01.50"
+EGG = "Egg|+00.00|+00.90|+01.50"
+
+def _make_recording():
+    """A 2m x 2m empty room with an apple on the floor
+    and an egg in a closed fridge"""
+    savedir = tempfile.mkdtemp()
+    reachable_positions = [dict(x=i*0.25, y=0.9, z=j*0.25)
+                           for i in range(8) for j in range(8)]
+    objects = [dict(objectId=APPLE, objectType="Apple",
+                    position=dict(x=1.0, y=0.9, z=1.0)),
+               dict(objectId=FRIDGE, objectType="Fridge", openable=True, isOpen=False,
+                    position=dict(x=0.0, y=0.9, z=1.5)),
+               dict(objectId=EGG, objectType="Egg", parentReceptacles=[FRIDGE],
+                    position=dict(x=0.0, y=0.9, z=1.5))]
+    save_recording(savedir, "FloorPlan1",
+                   dict(gridSize=0.25, width=300, height=300,
+                        fieldOfView=90, visibilityDistance=1.5),
+                   dict(position=dict(x=1.0, y=0.9, z=0.0),
+                        rotation=dict(x=0, y=0, z=0),
+                        cameraHorizon=0),
+                   0.675, reachable_positions, objects)
+    return savedir
+
+def test_fake_controller_moves():
+    controller = FakeController(_make_recording())
+    assert tt.thor_scene_from_controller(controller) == "FloorPlan1"
+    event = controller.step(action="MoveAhead", moveMagnitude=0.25)
+    assert event.metadata["lastActionSuccess"]
+    assert event.metadata["agent"]["position"]["z"] == 0.25
+    # cannot move out of the reachable positions
+    event = controller.step(action="MoveBack", moveMagnitude=1.0)
+    assert not event.metadata["lastActionSuccess"]
+    assert event.metadata["agent"]["position"]["z"] == 0.25
+    event = controller.step(action="RotateLeft", degrees=90)
+    assert event.metadata["agent"]["rotation"]["y"] == 270
+    event = controller.step(action="GetReachablePositions")
+    assert len(event.metadata["actionReturn"]) == 64
+
+def test_fake_controller_visibility():
+    controller = FakeController(_make_recording())
+    event = controller.step(action="Pass")
+    assert APPLE in event.instance_detections2D
+    assert tt.thor_object_with_id(event, APPLE)["visible"]
+    # the apple is behind
+    event = controller.step(action="RotateRight", degrees=180)
+    assert APPLE not in event.instance_detections2D
+    # the egg is only visible after the fridge is opened
+    controller.step(action="Teleport", position=dict(x=0.0, y=0.9, z=0.5),
+                    rotation=dict(x=0, y=0, z=0), horizon=0)
+    event = controller.step(action="Pass")
+    assert FRIDGE in event.instance_detections2D
+    assert EGG not in event.instance_detections2D
+    event = controller.step(action="OpenObject", objectId=FRIDGE)
+    assert EGG in event.instance_detections2D
+
+def _test_headless_trial(recording, target, max_steps=20):
+    args = TaskArgs(detectables=[target],
+                    thor_recording=recording,
+                    target=target,
+                    agent_class="ThorObjectSearchRandomAgent",
+                    task_env="ThorObjectSearch",
+                    max_steps=max_steps,
+                    agent_init_inputs=["grid_map"])
+    config = make_config(args)
+    trial = ThorObjectSearchTrial("test_fake-controller", config, verbose=True)
+    trial.run()
+
+if __name__ == "__main__":
+    # python test_fake_controller.py <recording_dir> <target>
+    if len(sys.argv) > 2:
+        _test_headless_trial(sys.argv[1], sys.argv[2])
+    else:
+        test_fake_controller_moves()
+        test_fake_controller_visibility()
@@ -6,7 +6,7 @@ from thortils.utils.visual import GridMapVisualizer
 from thortils.grid_map import GridMap
 from cospomdp.utils.math import indicies2d, normalize
 from cospomdp_apps.thor.agent.cospomdp_complete\
-    import _sample_topo_map
+    import _sample_topo_map, _update_topo_map
 from cospomdp_apps.thor.agent.components.topo_map\
     import TopoMap, draw_edge, draw_topo, mark_cell
 
@@ -85,5 +85,31 @@ def _test_topo_map_sampling_multiple():
     _test_topo_map_sampling(worldstr, seed=200, sleep=3, num_samples=30)
     _test_topo_map_sampling(worldstr, seed=300, sleep=3, num_samples=30)
 
+def test_topo_map_update(num_samples=10, seed=100):
+    print("Test incremental topo map update")
+    reachable_positions = [(x,y) for x in range(30) for y in range(30)]
+    target_hist = normalize({(x,y): 1.0 if x < 10 and y < 10 else 1e-6
+                             for x, y in reachable_positions})
+    rnd = random.Random(seed)
+    topo_map = _sample_topo_map(target_hist, reachable_positions, num_samples,
+                                degree=(2,3), sep=2.0, rnd=rnd)
+    # move the belief to the opposite corner
+    target_hist2 = normalize({(x,y): 1.0 if x >= 20 and y >= 20 else 1e-6
+                              for x, y in reachable_positions})
+    _start = time.time()
+    topo_map2 = _update_topo_map(topo_map, target_hist2, reachable_positions, num_samples,
+                                 degree=(2,3), sep=2.0, rnd=rnd)
+    print("update took {:.4f}s".format(time.time() - _start))
+    print(topo_map.total_prob(target_hist2), "->", topo_map2.total_prob(target_hist2))
+    assert topo_map2.total_prob(target_hist2) > topo_map.total_prob(target_hist2)
+    for nid in topo_map2.nodes:
+        assert len(topo_map2.edges_from(nid)) <= 3
+    # node probabilities are computed in one pass and cached per belief version
+    node_probs = topo_map2.node_probs(target_hist2, version=1)
+    for nid in topo_map2.nodes:
+        assert abs(node_probs[nid] - topo_map2.nodes[nid].prob(target_hist2)) < 1e-9
+    assert topo_map2.node_probs(target_hist, version=1) is node_probs
+
 if __name__ == "__main__":
+    test_topo_map_update()
     _test_topo_map_sampling_multiple()